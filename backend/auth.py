@@ -3,57 +3,74 @@ Authentication utilities and dependencies
 """
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from passlib.context import CryptContext
-from datetime import datetime, timezone, timedelta
-import jwt
 from typing import Optional
-from .config import db, JWT_SECRET, JWT_ALGORITHM, JWT_EXPIRATION_HOURS
+from .config import db
+from .services.password_hasher import get_password_hasher
+from .services.tokens import get_token_service, TokenVerifier, InvalidTokenError, ExpiredTokenError, RevokedTokenError
+from .services.ttl_cache import TTLCache
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing (bcrypt runs on a bounded worker pool, off the event loop)
+password_hasher = get_password_hasher()
+
+# Tokens (same issuer/verifier as server.py)
+token_service = get_token_service()
 
 # Security
 security = HTTPBearer()
 
-def hash_password(password: str) -> str:
+async def hash_password(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return await password_hasher.hash(password)
 
-def verify_password(plain: str, hashed: str) -> bool:
+async def verify_password(plain: str, hashed: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain, hashed)
+    return await password_hasher.verify(plain, hashed)
 
-def create_access_token(data: dict) -> str:
-    """Create JWT access token"""
-    to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
+def create_access_token(user: dict, token_version: int = 0) -> str:
+    """Create JWT access token carrying the user's principal"""
+    return token_service.issue(user, token_version)
 
 def decode_token(token: str) -> Optional[dict]:
     """Decode JWT token"""
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
+        return token_service.decode(token)
+    except InvalidTokenError:
         return None
 
+async def _load_token_version(user_id: str) -> int:
+    user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "id": 1, "token_version": 1})
+    return user_doc.get("token_version", 0) if user_doc else -1
+
+token_verifier = TokenVerifier(token_service, _load_token_version, TTLCache(maxsize=4096, ttl=30))
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Get current authenticated user"""
     from .models.user import User
-    
-    payload = decode_token(credentials.credentials)
-    if not payload:
+
+    try:
+        payload = await token_verifier.verify(credentials.credentials)
+    except ExpiredTokenError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except RevokedTokenError:
+        raise HTTPException(status_code=401, detail="Token revoked")
+    except InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
+
+    if token_service.is_self_contained(payload):
+        return User.model_construct(
+            id=payload["sub"],
+            email=payload["email"],
+            name=payload["name"],
+            role=payload["role"],
+            language=payload["lang"]
+        )
+
     user_id = payload.get("sub")
     user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
-    
+
     if not user_doc:
         raise HTTPException(status_code=401, detail="User not found")
-    
+
     return User(**{k: v for k, v in user_doc.items() if k != "password"})
 
 async def require_super_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
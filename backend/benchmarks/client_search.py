@@ -0,0 +1,89 @@
+"""
+Cost of ranked client search by query: how many clients each query
+matches and how many of them are scored and sorted before the limit, and
+its latency, unbounded (one-character terms kept, every match scored)
+against the defaults (min_term_length, scan_limit). Seeds a scratch
+database on MONGO_URL and drops it after.
+
+    cd backend && python -m benchmarks.client_search --clients 20000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from typing import List
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from config import MONGO_URL
+from services.client_search import ClientSearch
+
+FIRST_NAMES = ["María", "José", "Antonio", "Carmen", "Ana", "Manuel", "Laura", "Francisco", "Lucía", "David",
+               "Marta", "Javier", "Elena", "Miguel", "Sara", "Pablo", "Paula", "Alejandro", "Cristina", "Jorge"]
+SURNAMES = ["García", "Martínez", "López", "Sánchez", "González", "Pérez", "Rodríguez", "Fernández", "Gómez",
+            "Martín", "Jiménez", "Ruiz", "Hernández", "Díaz", "Moreno", "Muñoz", "Álvarez", "Romero", "Navarro"]
+QUERIES = ["m", "ma", "mar", "maria", "6", "61", "612", "maria g", "maria garcia", "m garcia"]
+
+
+def client_docs(size: int, seed: int = 3) -> List[dict]:
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(size):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)} {rng.choice(SURNAMES)}"
+        docs.append({
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "phone": f"{rng.choice('67')}{rng.randrange(10 ** 8):08d}",
+            "email": f"{name.split()[0].lower()}{rng.randrange(1000)}@example.com",
+            "dni": f"{rng.randrange(10 ** 8):08d}Z",
+        })
+    return docs
+
+
+async def measure(db, sizes: List[int], repeat: int, limit: int):
+    for size in sizes:
+        await db.clients.drop()
+        seeding = ClientSearch(db)
+        await db.clients.insert_many([{**doc, **seeding.fields_for(doc)} for doc in client_docs(size)])
+        await db.clients.create_index("search_grams")
+
+        for query in QUERIES:
+            row = [f"{size:>7} clients  {query!r:15}"]
+            for label, search in (("unbounded", ClientSearch(db, min_term_length=1, scan_limit=None)),
+                                  ("bounded", ClientSearch(db))):
+                terms = search.terms(query)
+                matched = await db.clients.count_documents({"search_grams": {"$all": terms}}) if terms else 0
+                scored = min(matched, search.scan_limit) if search.scan_limit else matched
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    await search.search(query, limit=limit)
+                    timings.append((time.perf_counter() - started) * 1000)
+                row.append(f"{label:9} {scored:>6} scored {statistics.median(timings):9.2f} ms")
+            print("  ".join(row))
+
+
+async def run(args):
+    client = AsyncIOMotorClient(MONGO_URL, tz_aware=True)
+    try:
+        await measure(client[args.db], args.clients, args.repeat, args.limit)
+    finally:
+        await client.drop_database(args.db)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1000, 20000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--db", default="client_search_benchmark")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
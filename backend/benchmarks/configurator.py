@@ -0,0 +1,130 @@
+"""
+Latency of the calculator configurator's pack selection over synthetic
+catalogs: the original per-pack scan-score-sort against PackIndex's columnar
+scoring, one request at a time and in batches of scenarios. Every
+request's top three (ids and scores) is checked against the scan first.
+
+    cd backend && python -m benchmarks.configurator --packs 100 10000 100000
+"""
+import argparse
+import random
+import timeit
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from server import ConfiguratorRequest, Pack
+from services.pack_catalog import CatalogSnapshot
+from services.pack_index import PackIndex
+from services.pack_rules import with_rules
+
+COMPANIES = ["Movistar", "Vodafone", "Orange", "Yoigo", "Digi", "Pepephone", "Simyo", "Lowi", "MásMóvil", "O2"]
+TYPES = ["Solo Móvil", "Solo Fibra", "Pack Fibra + Móvil", "Pack Fibra + Móvil + TV"]
+
+
+def catalog(size: int, seed: int = 7) -> List[dict]:
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    packs = []
+    for _ in range(size):
+        pack_type = rng.choice(TYPES)
+        origin = rng.choice(COMPANIES)
+        packs.append(with_rules(Pack(
+            company=rng.choice(COMPANIES),
+            name=f"Tarifa {uuid.uuid4().hex[:6]}",
+            type=pack_type,
+            price=round(rng.uniform(8, 120), 2),
+            created_at=now - timedelta(days=rng.randint(0, 400)),
+            mobile_gb=rng.choice([None, 5, 10, 25, 50, 100, 200]) if pack_type != "Solo Fibra" else None,
+            fiber_speed_mbps=rng.choice([300, 600, 1000]) if pack_type != "Solo Móvil" else None,
+            tv_supported=pack_type.endswith("TV") or rng.random() < 0.1,
+            additional_lines_supported=rng.random() < 0.4,
+            restrictions=f"Solo clientes que vienen de {origin}" if rng.random() < 0.2 else None,
+            observations=f"Especial portabilidad desde {origin}" if rng.random() < 0.3 else None,
+        ).model_dump()))
+    return packs
+
+
+def scan_and_sort(packs: List[dict], config: ConfiguratorRequest, now: datetime):
+    """The configurator's selection before the index: every pack, full sort"""
+    recommendations = []
+    for pack in packs:
+        if pack["type"] != config.pack_type or not pack["active"]:
+            continue
+        if config.respect_restrictions and config.origin_company and pack.get("restrictions"):
+            if config.origin_company.lower() not in pack["restrictions"].lower() and "solo" in pack["restrictions"].lower():
+                continue
+        if config.tv_required and not pack.get("tv_supported"):
+            continue
+        score = 0
+        price_weight = 3 if config.priority == "Ahorrar" else (2 if config.priority == "Equilibrado" else 1)
+        quality_weight = 1 if config.priority == "Ahorrar" else (2 if config.priority == "Equilibrado" else 3)
+        if config.mobile_gb and pack.get("mobile_gb"):
+            if pack["mobile_gb"] >= config.mobile_gb:
+                score += max(0, 20 - (abs(pack["mobile_gb"] - config.mobile_gb) / 10)) * quality_weight
+            else:
+                score -= 10
+        if config.fiber_speed_mbps and pack.get("fiber_speed_mbps"):
+            if pack["fiber_speed_mbps"] >= config.fiber_speed_mbps:
+                score += max(0, 20 - (abs(pack["fiber_speed_mbps"] - config.fiber_speed_mbps) / 100)) * quality_weight
+            else:
+                score -= 10
+        score += ((100 - pack["price"]) / 100) * 20 * price_weight
+        if config.tv_required and pack.get("tv_supported"):
+            score += 15
+        if config.additional_lines > 0 and pack.get("additional_lines_supported"):
+            score += 10
+        if (now - pack["created_at"]).days < 30:
+            score += 5
+        if config.origin_company and pack.get("observations"):
+            if config.origin_company.lower() in pack["observations"].lower():
+                score += 10
+        recommendations.append({**pack, "score": round(score, 2)})
+    recommendations.sort(key=lambda x: x["score"], reverse=True)
+    return recommendations[:3]
+
+
+def requests(count: int, seed: int = 11) -> List[ConfiguratorRequest]:
+    rng = random.Random(seed)
+    return [ConfiguratorRequest(
+        pack_type=rng.choice(TYPES),
+        origin_company=rng.choice([None, *COMPANIES]),
+        priority=rng.choice(["Ahorrar", "Equilibrado", "Máxima calidad"]),
+        mobile_gb=rng.choice([None, 10, 50, 100]),
+        fiber_speed_mbps=rng.choice([None, 300, 600, 1000]),
+        additional_lines=rng.choice([0, 0, 1, 2]),
+        tv_required=rng.random() < 0.25,
+    ) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--packs", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--scenarios", type=int, default=5, help="requests per batch")
+    args = parser.parse_args()
+
+    configs = requests(args.requests)
+    for size in args.packs:
+        now = datetime.now(timezone.utc)
+        packs = catalog(size)
+        packs.sort(key=lambda pack: (pack["created_at"], pack["id"]), reverse=True)
+        index = PackIndex(CatalogSnapshot(1, packs, now, 3600), now)
+
+        for config in configs:
+            expected = [(p["id"], p["score"]) for p in scan_and_sort(packs, config, now)]
+            got = [(entry.pack["id"], score) for score, entry in index.top(config, 3, now)]
+            assert got == expected, (config, expected, got)
+
+        assert index.top_many(configs, 3, now) == [index.top(c, 3, now) for c in configs]
+
+        for label, run in (("scan + sort", lambda: [scan_and_sort(packs, c, now) for c in configs]),
+                           ("columnar", lambda: [index.top(c, 3, now) for c in configs]),
+                           ("batch", lambda: [index.top_many(configs[i:i + args.scenarios], 3, now)
+                                              for i in range(0, len(configs), args.scenarios)])):
+            best = min(timeit.repeat(run, number=1, repeat=3))
+            print(f"{size:>7} packs  {label:11} {best / len(configs) * 1000:8.3f} ms/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Per-row cost of serializing list responses: FastAPI's response_model path
+(validate, dump, json.dumps) against the trusted serializer.
+
+    cd backend && python -m benchmarks.serialization --rows 1000
+"""
+import argparse
+import json
+import random
+import timeit
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from pydantic import TypeAdapter
+
+from server import Client, Sale, SALE_STATUSES
+from services.dates import DATE_FIELDS
+from services.serialization import TrustedSerializer
+
+
+def sale_docs(rows: int) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    return [{
+        "id": str(uuid.uuid4()),
+        "client_id": str(uuid.uuid4()),
+        "company": random.choice(["Movistar", "Vodafone", "Orange"]),
+        "pack_type": "Pack Fibra + Móvil",
+        "pack_id": str(uuid.uuid4()),
+        "pack_name": "Fibra 600Mb + 2 líneas",
+        "pack_price": 45.9,
+        "mobile_lines": [{"number": "600000000", "type": "Postpago", "gb_data": 50, "iccid": None,
+                          "origin_company": "Orange"} for _ in range(2)],
+        "fiber": {"address": "Calle Mayor 1, Madrid", "speed_mbps": 600},
+        "notes": "Instalación por la mañana",
+        "status": random.choice(SALE_STATUSES),
+        "score": random.randint(0, 100),
+        "created_by": str(uuid.uuid4()),
+        "created_at": now - timedelta(minutes=i),
+        "updated_at": now - timedelta(minutes=i),
+        "is_demo": False,
+    } for i in range(rows)]
+
+
+def client_docs(rows: int) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    return [{
+        "id": str(uuid.uuid4()),
+        "name": f"Cliente {i}",
+        "phone": f"6{i:08d}",
+        "email": f"cliente{i}@example.com",
+        "city": "Madrid",
+        "address": "Calle Mayor 1",
+        "dni": f"{i:08d}Z",
+        "internal_notes": None,
+        "created_by": str(uuid.uuid4()),
+        "created_at": now,
+        "updated_at": now,
+        "is_demo": False,
+    } for i in range(rows)]
+
+
+def response_model_path(adapter: TypeAdapter):
+    """What FastAPI does for response_model=List[Model] with a JSONResponse"""
+    def serialize(docs):
+        value = adapter.validate_python(docs)
+        content = adapter.dump_python(value, mode="json")
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+    return serialize
+
+
+def measure(name: str, model, docs: List[dict], date_fields, repeat: int):
+    baseline = response_model_path(TypeAdapter(List[model]))
+    trusted = TrustedSerializer(model, date_fields)
+    assert json.loads(baseline(docs)) == json.loads(trusted.dump_json(docs)), "outputs differ"
+
+    rows = len(docs)
+    for label, serialize in (("response_model", baseline), ("trusted", trusted.dump_json)):
+        best = min(timeit.repeat(lambda: serialize(docs), number=1, repeat=repeat))
+        print(f"{name:8} {label:15} {best * 1000:8.2f} ms/list {best / rows * 1e6:8.2f} us/row")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    measure("sales", Sale, sale_docs(args.rows), DATE_FIELDS["sales"], args.repeat)
+    measure("clients", Client, client_docs(args.rows), DATE_FIELDS["clients"], args.repeat)
+
+
+if __name__ == "__main__":
+    main()
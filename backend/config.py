@@ -1,29 +1,209 @@
 """
 Database and configuration module
 """
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
 from dotenv import load_dotenv
+from typing import Optional
+import importlib.util
+import logging
 import os
+import threading
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Database configuration
 MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
 DB_NAME = os.environ.get("DB_NAME", "hipnotik_db")
 
-# JWT Configuration
-JWT_SECRET = os.environ.get("JWT_SECRET", "hipnotik-secret-key-2024")
-JWT_ALGORITHM = "HS256"
-JWT_EXPIRATION_HOURS = 24
+# JWT configuration lives in services/tokens.py (SECRET_KEY, falling back to JWT_SECRET)
 
 # CORS
 CORS_ORIGINS = os.environ.get("CORS_ORIGINS", "*")
 
-# MongoDB client
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+# Wire compressors and the module each one needs on the client side
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+def _env_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def mongo_client_options() -> dict:
+    """
+    Pool settings for the Mongo client, read from the environment:
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_WAIT_QUEUE_TIMEOUT_MS and
+    MONGO_COMPRESSORS (comma separated, default "zstd,snappy"; compressors
+    whose library is not installed are skipped).
+    """
+    options = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 100),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 30000),
+        # Dates are stored as BSON dates and read back as UTC-aware datetimes
+        "tz_aware": True,
+    }
+    max_idle = _env_int("MONGO_MAX_IDLE_TIME_MS")
+    if max_idle is not None:
+        options["maxIdleTimeMS"] = max_idle
+    wait_queue_timeout = _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+    if wait_queue_timeout is not None:
+        options["waitQueueTimeoutMS"] = wait_queue_timeout
+
+    compressors = []
+    requested = os.environ.get("MONGO_COMPRESSORS")
+    for name in (requested or "zstd,snappy").split(","):
+        name = name.strip()
+        if not name:
+            continue
+        module = _COMPRESSOR_MODULES.get(name)
+        if module and importlib.util.find_spec(module) is not None:
+            compressors.append(name)
+        elif requested:
+            logger.warning("Mongo wire compressor '%s' unavailable, skipping", name)
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Counts connection pool events (called from driver threads)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open_connections = 0
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.checkout_started = 0
+        self.checked_out = 0
+        self.checked_in = 0
+        self.checkout_failed = 0
+        self.waits = 0
+        self.pool_cleared = 0
+        self.max_pool_size = None
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    @property
+    def in_use(self) -> int:
+        return self.checked_out - self.checked_in
+
+    def pool_created(self, event):
+        self.max_pool_size = event.options.get("maxPoolSize")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count(pool_cleared=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._count(open_connections=1, connections_created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count(open_connections=-1, connections_closed=1)
+
+    def connection_check_out_started(self, event):
+        # Every connection busy: this checkout has to wait for one
+        waits = 1 if self.max_pool_size and self.in_use >= self.max_pool_size else 0
+        self._count(checkout_started=1, waits=waits)
+
+    def connection_check_out_failed(self, event):
+        self._count(checkout_failed=1)
+
+    def connection_checked_out(self, event):
+        self._count(checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._count(checked_in=1)
+
+    def stats(self) -> dict:
+        return {
+            "open_connections": self.open_connections,
+            "in_use": self.in_use,
+            "waiting": max(0, self.checkout_started - self.checked_out - self.checkout_failed),
+            "checkouts": self.checked_out,
+            "checkout_failures": self.checkout_failed,
+            "waits": self.waits,
+            "connections_created": self.connections_created,
+            "connections_closed": self.connections_closed,
+            "pool_cleared": self.pool_cleared,
+        }
+
+
+class MongoConnection:
+    """
+    The single Mongo client of the process.
+
+    Nothing connects at import time: the client (and its pool) is created on
+    first use or when the app lifespan calls connect(), and closed by close().
+    """
+
+    def __init__(self, url: str, db_name: str):
+        self.url = url
+        self.db_name = db_name
+        self.monitor = PoolMonitor()
+        self.options = mongo_client_options()
+        self._client: Optional[AsyncIOMotorClient] = None
+        self._database: Optional[AsyncIOMotorDatabase] = None
+
+    @property
+    def client(self) -> AsyncIOMotorClient:
+        if self._client is None:
+            self._client = AsyncIOMotorClient(self.url, event_listeners=[self.monitor], **self.options)
+        return self._client
+
+    @property
+    def database(self) -> AsyncIOMotorDatabase:
+        # Built once per client: `db.<collection>` runs on every request path
+        if self._database is None:
+            self._database = self.client[self.db_name]
+        return self._database
+
+    def connect(self):
+        return self.client
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+            self._database = None
+
+    def stats(self) -> dict:
+        return {
+            "connected": self._client is not None,
+            "options": {k: v for k, v in self.options.items() if k != "tz_aware"},
+            **self.monitor.stats(),
+        }
+
+
+class _LazyDatabase:
+    """Module-level `db` handle that resolves to the shared client's database on use"""
+
+    def __getattr__(self, name):
+        return getattr(mongo.database, name)
+
+    def __getitem__(self, name):
+        return mongo.database[name]
+
+
+mongo = MongoConnection(MONGO_URL, DB_NAME)
+db = _LazyDatabase()
 
 def get_database():
     """Get database instance"""
-    return db
+    return mongo.database
@@ -0,0 +1,7 @@
+"""
+Middleware package - ASGI middleware wrapped around the API
+"""
+# - encoding.py - msgpack content negotiation for JSON responses
+# - compression.py - Brotli/gzip response compression
+from .encoding import MsgpackMiddleware
+from .compression import CompressionMiddleware
@@ -0,0 +1,94 @@
+"""
+Response encoding - MessagePack for clients that ask for it
+"""
+from typing import List, Tuple
+
+import msgpack
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+JSON = "application/json"
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def wants_msgpack(accept: str) -> bool:
+    """True when Accept lists MessagePack ahead of (or without) JSON"""
+    ranked: List[Tuple[float, int, str]] = []
+    for position, item in enumerate(accept.split(",")):
+        media_type, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranked.append((-quality, position, media_type.strip().lower()))
+    for _, _, media_type in sorted(ranked):
+        if media_type in MSGPACK_TYPES:
+            return True
+        if media_type in (JSON, "application/*", "*/*"):
+            return False
+    return False
+
+
+class MsgpackMiddleware:
+    """
+    Re-encodes JSON responses as MessagePack when the request's Accept header
+    prefers it. Other responses (CSV, PDF, streams) pass through untouched;
+    every JSON response gets `Vary: Accept` so caches keep both encodings apart.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if not wants_msgpack(Headers(scope=scope).get("accept", "")):
+            await self.app(scope, receive, self._vary(send))
+            return
+
+        start: dict = {}
+        chunks: List[bytes] = []
+
+        async def send_msgpack(message: Message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                if not headers.get("content-type", "").startswith(JSON):
+                    start = {}
+                    await send(message)
+                    return
+                start = message
+                return
+            if not start:
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            if body:
+                body = msgpack.packb(orjson.loads(body))
+            headers = MutableHeaders(raw=start["headers"])
+            headers["content-type"] = MSGPACK_TYPES[0]
+            headers["content-length"] = str(len(body))
+            headers.add_vary_header("Accept")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_msgpack)
+
+    @staticmethod
+    def _vary(send: Send) -> Send:
+        async def send_with_vary(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                if headers.get("content-type", "").startswith(JSON):
+                    headers.add_vary_header("Accept")
+            await send(message)
+        return send_with_vary
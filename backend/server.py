@@ -1,43 +1,143 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Body
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Body, Request, Response, BackgroundTasks, UploadFile, File
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
+import asyncio
 import os
+import ipaddress
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
+from pydantic_core import to_json
 from typing import List, Optional, Dict, Any, Literal
 import uuid
 from datetime import datetime, timezone, timedelta
-import jwt
-from passlib.context import CryptContext
 import io
 import csv
+import math
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from services.password_hasher import get_password_hasher, PasswordHasherUnavailable, DEMO_BCRYPT_ROUNDS
+from services.ttl_cache import TTLCache
+from services.tokens import get_token_service, TokenVerifier, InvalidTokenError, ExpiredTokenError, RevokedTokenError
+from services.rate_limiter import SlidingWindowLimiter, InMemoryLimiterBackend, MongoLimiterBackend
+from services.dates import DateMigration, DATE_FIELDS, as_datetime, date_sort_key
+from services.indexes import IndexRegistry
+from services.client_search import ClientSearch, INTERNAL_FIELDS as CLIENT_SEARCH_INTERNAL_FIELDS, SEARCH_FIELDS as CLIENT_SEARCH_FIELDS
+from services.phones import ClientPhoneKeys, phone_key
+from services.pagination import Keyset, InvalidCursor, DEFAULT_LIMIT
+from services.list_query import ListQuery, Filter, InvalidQuery, ParsedQuery
+from services.fieldsets import Fieldset, InvalidFieldset
+from services.serialization import TrustedSerializer
+from services.change_versions import ChangeVersions, etag_matches
+from services.pack_catalog import PackCatalog
+from services.pack_index import current_index, feature_count, fit_details, is_recent
+from services.pack_rules import PackRules, compile_rules, origin_key
+from services.pack_prices import PackPriceHistory
+from services.pack_import import PackImport, ImportFileError, read_rows
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from middleware import MsgpackMiddleware, CompressionMiddleware
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection: one client (and connection pool) per process, created
+# by the app lifespan; pool settings come from MONGO_* variables (see config.py)
+from config import mongo, db
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-SECRET_KEY = os.environ.get('SECRET_KEY', 'hipnotik-level-stand-secret-key-2025')
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
+password_hasher = get_password_hasher()
+# Authenticated principals by user id; entries are dropped explicitly when a
+# user's role, password or profile changes and otherwise expire after the TTL
+principal_cache = TTLCache(
+    maxsize=int(os.environ.get('PRINCIPAL_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('PRINCIPAL_CACHE_TTL_SECONDS', 60))
+)
+token_service = get_token_service()
+
+# Admission control for credential endpoints: failed logins and reset
+# requests are counted per email and per client IP, and requests over the
+# limit are refused before any bcrypt work is done. RATE_LIMIT_BACKEND=mongo
+# shares the counters between workers.
+limiter_backend = MongoLimiterBackend(db) if os.environ.get('RATE_LIMIT_BACKEND') == 'mongo' else InMemoryLimiterBackend()
+login_limiter = SlidingWindowLimiter("login", limiter_backend, {
+    "email": (int(os.environ.get('LOGIN_MAX_FAILURES_PER_EMAIL', 5)), float(os.environ.get('LOGIN_FAILURE_WINDOW_SECONDS', 900))),
+    "ip": (int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', 30)), float(os.environ.get('LOGIN_FAILURE_WINDOW_SECONDS', 900)))
+})
+password_reset_limiter = SlidingWindowLimiter("forgot_password", limiter_backend, {
+    "email": (int(os.environ.get('PASSWORD_RESET_MAX_PER_EMAIL', 3)), 3600),
+    "ip": (int(os.environ.get('PASSWORD_RESET_MAX_PER_IP', 10)), 3600)
+})
+
+# Proxies (addresses or CIDR ranges) whose X-Forwarded-For is believed
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy.strip(), strict=False)
+    for proxy in os.environ.get('TRUSTED_PROXIES', '').split(',') if proxy.strip()
+]
 
 security = HTTPBearer()
 
+# Dates are stored as BSON dates. Documents written before that still hold
+# ISO strings until the background migration rewrites them; meanwhile range
+# queries built with date_range() match both formats.
+date_migration = DateMigration(
+    db,
+    batch_size=int(os.environ.get('DATE_MIGRATION_BATCH_SIZE', 500)),
+    enabled=os.environ.get('DATE_MIGRATION_ENABLED', 'true').lower() != 'false'
+)
+date_range = date_migration.range
+
+# Indexes are declared in services/indexes.py and (re)applied on every startup
+index_registry = IndexRegistry()
+
+# Client search keeps edge n-grams of name/phone/email/DNI on each client
+client_search = ClientSearch(db, candidate_limit=int(os.environ.get('CLIENT_SEARCH_CANDIDATES', 200)),
+                             min_term_length=int(os.environ.get('CLIENT_SEARCH_MIN_TERM', 2)),
+                             scan_limit=int(os.environ.get('CLIENT_SEARCH_SCAN_LIMIT', 2000)))
+# Clients are deduplicated by the E.164 form of their phone (unique index)
+client_phone_keys = ClientPhoneKeys(db)
+# Origin-company rules are compiled from pack texts on write; older packs by a backfill
+pack_rules = PackRules(db)
+# Every price a pack has had, so reports price sales as of their date
+pack_prices = PackPriceHistory(db)
+CLIENT_INTERNAL_FIELDS = {**CLIENT_SEARCH_INTERNAL_FIELDS, "phone_key": 0}
+
+# List endpoints return one page; the next page's cursor is in X-Next-Cursor
+newest_first = Keyset("created_at", -1, dual_read=lambda: date_migration.dual_read)
+latest_fichajes_first = Keyset("timestamp", -1, dual_read=lambda: date_migration.dual_read)
+by_name = Keyset("name", 1)
+# ETags of rarely-changing resources derive from per-collection change versions
+change_versions = ChangeVersions(db, ttl=float(os.environ.get('CHANGE_VERSION_CACHE_TTL_SECONDS', 5)))
+# Filters an index cannot serve are answered with an X-Query-Warning header,
+# or rejected with a 400 when LIST_QUERY_STRICT is set
+LIST_QUERY_STRICT = os.environ.get('LIST_QUERY_STRICT', 'false').lower() == 'true'
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    mongo.connect()
+    await password_hasher.calibrate()
+    background = [
+        asyncio.create_task(index_registry.apply(db)),
+        asyncio.create_task(date_migration.run()),
+        asyncio.create_task(client_search.backfill()),
+        asyncio.create_task(client_phone_keys.backfill()),
+        asyncio.create_task(pack_rules.backfill()),
+        asyncio.create_task(pack_prices.backfill()),
+    ]
+    yield
+    for task in background:
+        task.cancel()
+    mongo.close()
+    password_hasher.shutdown()
+
 # Create the main app
-app = FastAPI()
+# Responses are encoded with orjson; clients may ask for MessagePack instead
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 @app.get("/")
 def root():
     return {
@@ -299,6 +399,10 @@ class Pack(BaseModel):
     tv_supported: bool = False
     tv_package_type: Optional[str] = None
     restrictions: Optional[str] = None
+    # Compiled from restrictions/observations on write (services/pack_rules.py)
+    allowed_origins: Optional[List[str]] = None
+    bonus_origins: List[str] = []
+    rules_version: int = 0
     # Permanencia
     has_permanence: bool = False
     permanence_months: Optional[int] = None
@@ -415,35 +519,112 @@ class Notification(BaseModel):
 
 # ==================== HELPER FUNCTIONS ====================
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherUnavailable:
+        raise HTTPException(status_code=503, detail="Servicio ocupado, inténtalo de nuevo", headers={"Retry-After": "1"})
 
-def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+async def verify_password(plain: str, hashed: str) -> bool:
+    try:
+        return await password_hasher.verify(plain, hashed)
+    except PasswordHasherUnavailable:
+        raise HTTPException(status_code=503, detail="Servicio ocupado, inténtalo de nuevo", headers={"Retry-After": "1"})
 
-def create_access_token(data: dict) -> str:
-    to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+async def rehash_password(user_id: str, old_hash: str, plain: str):
+    """Re-hash a stored password with the current bcrypt cost (runs after the login response)"""
+    try:
+        new_hash = await password_hasher.hash(plain)
+    except PasswordHasherUnavailable:
+        return  # Try again on a later login
+    # Only replace the hash we verified, in case the password changed meanwhile
+    await db.users.update_one({"id": user_id, "password": old_hash}, {"$set": {"password": new_hash}})
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+def _trusted(address: str) -> bool:
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def get_client_ip(request: Request) -> Optional[str]:
+    """
+    The peer address, or when the peer is a trusted proxy the right-most
+    X-Forwarded-For hop that is not one: the left part of the header is
+    whatever the client chose to send.
+    """
+    peer = request.client.host if request.client else None
+    if peer is None or not _trusted(peer):
+        return peer
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _trusted(hop):
+            return hop
+    return hops[0] if hops else peer
+
+async def enforce_rate_limit(limiter: SlidingWindowLimiter, **keys: Optional[str]):
+    retry_after = await limiter.retry_after(**keys)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Demasiados intentos. Inténtalo de nuevo más tarde",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+def create_access_token(user: User, token_version: int = 0) -> str:
+    return token_service.issue(user.model_dump(), token_version)
+
+async def load_token_version(user_id: str) -> int:
+    user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "id": 1, "token_version": 1})
+    if not user_doc:
+        return -1
+    return user_doc.get("token_version", 0)
+
+token_verifier = TokenVerifier(
+    token_service,
+    load_token_version,
+    TTLCache(maxsize=4096, ttl=float(os.environ.get('TOKEN_VERSION_CACHE_TTL_SECONDS', 30)))
+)
+
+async def load_principal(user_id: str) -> User:
+    """Full user profile, served from the principal cache when possible"""
+    user = principal_cache.get(user_id)
+    if user is None:
+        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
         if not user_doc:
             raise HTTPException(status_code=401, detail="User not found")
-        
-        return User(**user_doc)
-    except jwt.ExpiredSignatureError:
+        user = User(**user_doc)
+        principal_cache.set(user_id, user)
+    return user
+
+async def revoke_user_tokens(user_id: str):
+    """Invalidate every token issued so far for a user by bumping its token_version"""
+    await db.users.update_one({"id": user_id}, {"$inc": {"token_version": 1}})
+    token_verifier.forget(user_id)
+    principal_cache.invalidate(user_id)
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+    try:
+        payload = await token_verifier.verify(credentials.credentials)
+    except ExpiredTokenError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except Exception:
+    except RevokedTokenError:
+        raise HTTPException(status_code=401, detail="Token revoked")
+    except InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    
+    if token_service.is_self_contained(payload):
+        # Signed claims are trusted as-is: no users lookup per request
+        return User.model_construct(
+            id=payload["sub"],
+            email=payload["email"],
+            name=payload["name"],
+            role=payload["role"],
+            language=payload["lang"]
+        )
+    
+    # Legacy tokens only carry "sub"
+    return await load_principal(payload["sub"])
 
 async def require_super_admin(user: User = Depends(get_current_user)) -> User:
     if user.role != "SuperAdmin":
@@ -473,33 +654,57 @@ async def register(user_data: UserCreate):
     )
     
     user_dict = user.model_dump()
-    user_dict["password"] = hash_password(user_data.password)
-    user_dict["created_at"] = user_dict["created_at"].isoformat()
+    user_dict["password"] = await hash_password(user_data.password)
     
     await db.users.insert_one(user_dict)
+    principal_cache.invalidate(user.id)
+    token_verifier.forget(user.id)
     
-    token = create_access_token({"sub": user.id})
+    token = create_access_token(user)
     return TokenResponse(access_token=token, user=user)
 
 @api_router.post("/auth/login", response_model=TokenResponse)
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, request: Request, background_tasks: BackgroundTasks):
+    client_ip = get_client_ip(request)
+    await enforce_rate_limit(login_limiter, email=credentials.email, ip=client_ip)
+    
     user_doc = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user_doc or not verify_password(credentials.password, user_doc["password"]):
+    if not user_doc or not await verify_password(credentials.password, user_doc["password"]):
+        await login_limiter.hit(email=credentials.email, ip=client_ip)
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    await login_limiter.reset(email=credentials.email)
+    
+    # Demo accounts keep their cheap test cost on purpose
+    if not user_doc.get("is_demo") and password_hasher.needs_update(user_doc["password"]):
+        background_tasks.add_task(rehash_password, user_doc["id"], user_doc["password"], credentials.password)
     user = User(**{k: v for k, v in user_doc.items() if k != "password"})
-    token = create_access_token({"sub": user.id})
+    token = create_access_token(user, user_doc.get("token_version", 0))
     return TokenResponse(access_token=token, user=user)
 
 @api_router.get("/auth/me", response_model=User)
 async def get_me(user: User = Depends(get_current_user)):
-    return user
+    # Token claims only carry the principal; load the full profile here
+    return await load_principal(user.id)
+
+@api_router.post("/auth/revoke/{user_id}")
+async def revoke_tokens(user_id: str, user: User = Depends(require_super_admin)):
+    """Revoke every active session of a user (SuperAdmin only)"""
+    target = await db.users.find_one({"id": user_id}, {"_id": 0, "id": 1})
+    if not target:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    await revoke_user_tokens(user_id)
+    return {"message": "Sesiones revocadas"}
 
 # ==================== PASSWORD RECOVERY ENDPOINTS ====================
 
 @api_router.post("/auth/forgot-password")
-async def forgot_password(email: str = Body(..., embed=True)):
+async def forgot_password(request: Request, email: str = Body(..., embed=True)):
     """Request password reset - generates token and logs it (development mode)"""
+    client_ip = get_client_ip(request)
+    await enforce_rate_limit(password_reset_limiter, email=email, ip=client_ip)
+    await password_reset_limiter.hit(email=email, ip=client_ip)
+    
     user = await db.users.find_one({"email": email}, {"_id": 0})
     
     # Always return success to prevent email enumeration
@@ -515,7 +720,7 @@ async def forgot_password(email: str = Body(..., embed=True)):
     await db.password_resets.insert_one({
         "email": email,
         "token": reset_token,
-        "expires_at": expires_at.isoformat(),
+        "expires_at": expires_at,
         "used": False
     })
     
@@ -542,7 +747,7 @@ async def verify_reset_token(token: str = Body(..., embed=True)):
     if reset_doc.get("used"):
         raise HTTPException(status_code=400, detail="Este token ya ha sido utilizado")
     
-    expires_at = datetime.fromisoformat(reset_doc["expires_at"])
+    expires_at = as_datetime(reset_doc["expires_at"])
     if datetime.now(timezone.utc) > expires_at:
         raise HTTPException(status_code=400, detail="Token expirado")
     
@@ -559,19 +764,23 @@ async def reset_password(token: str = Body(...), new_password: str = Body(...)):
     if reset_doc.get("used"):
         raise HTTPException(status_code=400, detail="Este token ya ha sido utilizado")
     
-    expires_at = datetime.fromisoformat(reset_doc["expires_at"])
+    expires_at = as_datetime(reset_doc["expires_at"])
     if datetime.now(timezone.utc) > expires_at:
         raise HTTPException(status_code=400, detail="Token expirado")
     
     # Update password
-    hashed = hash_password(new_password)
-    result = await db.users.update_one(
+    hashed = await hash_password(new_password)
+    # A password change also revokes every token issued with the old one
+    updated_user = await db.users.find_one_and_update(
         {"email": reset_doc["email"]},
-        {"$set": {"password": hashed}}
+        {"$set": {"password": hashed}, "$inc": {"token_version": 1}},
+        projection={"_id": 0, "id": 1}
     )
     
-    if result.modified_count == 0:
+    if not updated_user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    principal_cache.invalidate(updated_user["id"])
+    token_verifier.forget(updated_user["id"])
     
     # Mark token as used
     await db.password_resets.update_one(
@@ -585,48 +794,151 @@ async def reset_password(token: str = Body(...), new_password: str = Body(...)):
 
 @api_router.post("/clients", response_model=Client)
 async def create_client(client_data: ClientCreate, user: User = Depends(get_current_user)):
-    # Check if client exists by phone
-    existing = await db.clients.find_one({"phone": client_data.phone}, {"_id": 0})
-    if existing:
-        return Client(**existing)
-    
     client = Client(**client_data.model_dump(), created_by=user.id)
     doc = client.model_dump()
-    doc["created_at"] = doc["created_at"].isoformat()
-    doc["updated_at"] = doc["updated_at"].isoformat()
-    await db.clients.insert_one(doc)
-    return client
+    doc.update(client_search.fields_for(doc))
+    key = phone_key(client_data.phone)
+    if not key:
+        await db.clients.insert_one(doc)
+        return client
+    
+    # Existing client with the same phone, or this one inserted, in one round trip
+    doc["phone_key"] = key
+    projection = {"_id": 0, **CLIENT_INTERNAL_FIELDS}
+    try:
+        stored = await db.clients.find_one_and_update(
+            {"phone_key": key},
+            {"$setOnInsert": doc},
+            projection=projection,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # A concurrent request inserted it first
+        stored = await db.clients.find_one({"phone_key": key}, projection)
+    return Client(**stored)
+
+async def keyset_page(keyset: Keyset, collection, query: dict, projection: dict, limit: int,
+                      cursor: Optional[str], response: Response) -> List[dict]:
+    try:
+        docs, next_cursor = await keyset.page(collection, query, projection, limit, cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return docs
+
+def parse_list_query(list_query: ListQuery, request: Request, response: Response,
+                     scopes=((),), check: bool = True) -> ParsedQuery:
+    try:
+        parsed = list_query.parse(request.query_params)
+    except InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    problem = list_query.unserved(parsed, index_registry, scopes) if check else None
+    if problem:
+        if LIST_QUERY_STRICT:
+            raise HTTPException(status_code=400, detail=f"Unindexed query: {problem}")
+        logger.warning("Unindexed list query on %s: %s", list_query.collection, problem)
+        response.headers["X-Query-Warning"] = problem
+    return parsed
+
+async def not_modified(request: Request, response: Response, collections: List[str], *parts) -> Optional[Response]:
+    """
+    Sets the ETag of a response built from `collections` (and `parts`), and
+    returns a 304 when the client already holds it - before any query runs.
+    """
+    etag = await change_versions.etag(collections, request.url.query, request.headers.get("accept", ""), *parts)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=dict(response.headers))
+    return None
+
+async def price_sales(sales: List[dict]):
+    """
+    Fills pack_price on sales saved without one with their pack's price on
+    the sale date, in one history query however many sales there are.
+    """
+    unpriced = [sale for sale in sales if sale.get("pack_price") is None and sale.get("pack_id")]
+    if not unpriced:
+        return
+    prices = await pack_prices.as_of((sale["pack_id"], sale.get("created_at")) for sale in unpriced)
+    for sale, price in zip(unpriced, prices):
+        if price is not None:
+            sale["pack_price"] = price
+
+def parse_fields(fieldset: Fieldset, fields: Optional[str]) -> Optional[List[str]]:
+    try:
+        return fieldset.parse(fields)
+    except InvalidFieldset as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def json_response(body: bytes, response: Response) -> Response:
+    """Already serialized JSON, keeping the headers set on `response`"""
+    return Response(body, media_type="application/json", headers=dict(response.headers))
+
+def sparse_response(content, selected: Optional[List[str]], response: Response):
+    """
+    Partial documents would fail (or be padded by) the response model, so
+    they are serialized directly.
+    """
+    if selected is None:
+        return content
+    return json_response(to_json(content), response)
+
+def list_response(serializer: TrustedSerializer, docs: List[dict], response: Response,
+                  selected: Optional[List[str]] = None) -> Response:
+    """
+    List endpoints skip response_model validation (it still documents the
+    schema): documents come from our own collections and are serialized as is.
+    """
+    if selected is not None:
+        return json_response(to_json(docs), response)
+    return json_response(serializer.dump_json(docs), response)
+
+client_serializer = TrustedSerializer(Client, DATE_FIELDS["clients"])
+
+client_fields = Fieldset(Client.model_fields, {
+    "summary": ["name", "phone", "email", "city", "created_at"],
+    "picker": ["name", "phone"],
+})
+
+client_list = ListQuery("clients", [
+    Filter("id"),
+    Filter("created_by"),
+    Filter("created_from", "created_at", "gte", datetime),
+    Filter("created_to", "created_at", "lt", datetime),
+], sorts=["created_at"], dates=date_migration)
 
 @api_router.get("/clients", response_model=List[Client])
-async def get_clients(user: User = Depends(get_current_user), search: Optional[str] = None):
-    query = {}
+async def get_clients(request: Request, response: Response, user: User = Depends(get_current_user),
+                      search: Optional[str] = None, limit: int = DEFAULT_LIMIT, cursor: Optional[str] = None,
+                      fields: Optional[str] = None):
+    selected = parse_fields(client_fields, fields)
+    # Searches are served by the n-gram index, filters only narrow the candidates
+    parsed = parse_list_query(client_list, request, response, check=not search)
     if search:
-        query = {"$or": [{"phone": {"$regex": search, "$options": "i"}}, {"name": {"$regex": search, "$options": "i"}}]}
+        clients = await client_search.search(search, limit=limit, filter=parsed.query)
+        return list_response(client_serializer, Fieldset.trim(clients, selected), response, selected)
     
-    clients = await db.clients.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for c in clients:
-        if isinstance(c["created_at"], str):
-            c["created_at"] = datetime.fromisoformat(c["created_at"])
-        if isinstance(c["updated_at"], str):
-            c["updated_at"] = datetime.fromisoformat(c["updated_at"])
-    return clients
+    clients = await keyset_page(parsed.keyset, db.clients, parsed.query,
+                                Fieldset.projection(selected, CLIENT_INTERNAL_FIELDS), limit, cursor, response)
+    return list_response(client_serializer, clients, response, selected)
 
 @api_router.get("/clients/{client_id}", response_model=Client)
-async def get_client(client_id: str, user: User = Depends(get_current_user)):
-    client = await db.clients.find_one({"id": client_id}, {"_id": 0})
+async def get_client(client_id: str, response: Response, user: User = Depends(get_current_user),
+                     fields: Optional[str] = None):
+    selected = parse_fields(client_fields, fields)
+    client = await db.clients.find_one({"id": client_id}, Fieldset.projection(selected, CLIENT_INTERNAL_FIELDS))
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
-    if isinstance(client["created_at"], str):
-        client["created_at"] = datetime.fromisoformat(client["created_at"])
-    if isinstance(client["updated_at"], str):
-        client["updated_at"] = datetime.fromisoformat(client["updated_at"])
-    return Client(**client)
+    return sparse_response(client, selected, response) if selected else Client(**client)
 
 @api_router.put("/clients/{client_id}", response_model=Client)
 async def update_client(client_id: str, client_data: ClientUpdate, user: User = Depends(get_current_user)):
     """Update client - all fields are optional"""
     # Build update dict with only provided fields
-    update_dict = {"updated_at": datetime.now(timezone.utc).isoformat()}
+    update_dict = {"updated_at": datetime.now(timezone.utc)}
     
     if client_data.name is not None:
         update_dict["name"] = client_data.name
@@ -643,18 +955,24 @@ async def update_client(client_id: str, client_data: ClientUpdate, user: User =
     if client_data.internal_notes is not None:
         update_dict["internal_notes"] = client_data.internal_notes
     
-    result = await db.clients.update_one(
-        {"id": client_id},
-        {"$set": update_dict}
-    )
+    if any(field in update_dict for field in CLIENT_SEARCH_FIELDS):
+        current = await db.clients.find_one({"id": client_id}, {"_id": 0, **{f: 1 for f in CLIENT_SEARCH_FIELDS}})
+        if current is not None:
+            update_dict.update(client_search.fields_for({**current, **update_dict}))
+    
+    update = {"$set": update_dict}
+    if client_data.phone is not None:
+        update_dict["phone_key"] = phone_key(client_data.phone)
+        update["$unset"] = {"duplicate_of": ""}
+    
+    try:
+        result = await db.clients.update_one({"id": client_id}, update)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Ya existe un cliente con ese teléfono")
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Client not found")
     
-    client = await db.clients.find_one({"id": client_id}, {"_id": 0})
-    if isinstance(client["created_at"], str):
-        client["created_at"] = datetime.fromisoformat(client["created_at"])
-    if isinstance(client["updated_at"], str):
-        client["updated_at"] = datetime.fromisoformat(client["updated_at"])
+    client = await db.clients.find_one({"id": client_id}, {"_id": 0, **CLIENT_INTERNAL_FIELDS})
     return Client(**client)
 
 @api_router.get("/clients/{client_id}/sales")
@@ -666,10 +984,6 @@ async def get_client_sales(client_id: str, user: User = Depends(get_current_user
     total_score = sum(s.get("score", 0) for s in sales)
     
     for s in sales:
-        if isinstance(s["created_at"], str):
-            s["created_at"] = datetime.fromisoformat(s["created_at"])
-        if isinstance(s["updated_at"], str):
-            s["updated_at"] = datetime.fromisoformat(s["updated_at"])
         # Ensure score exists
         if "score" not in s:
             s["score"] = calculate_sale_score(s)
@@ -719,8 +1033,6 @@ async def create_sale(sale_data: SaleCreate, user: User = Depends(get_current_us
     )
     
     doc = sale.model_dump()
-    doc["created_at"] = doc["created_at"].isoformat()
-    doc["updated_at"] = doc["updated_at"].isoformat()
     await db.sales.insert_one(doc)
     
     # Create notification for all SuperAdmins
@@ -733,29 +1045,47 @@ async def create_sale(sale_data: SaleCreate, user: User = Depends(get_current_us
         related_type="sale"
     )
     notif_doc = notif.model_dump()
-    notif_doc["created_at"] = notif_doc["created_at"].isoformat()
     await db.notifications.insert_one(notif_doc)
     
     return sale
 
 @api_router.get("/sales/statuses")
-async def get_sale_statuses(user: User = Depends(get_current_user)):
+async def get_sale_statuses(request: Request, response: Response, user: User = Depends(get_current_user)):
     """Get list of valid sale statuses"""
+    cached = await not_modified(request, response, [], *SALE_STATUSES)
+    if cached:
+        return cached
     return {"statuses": SALE_STATUSES}
 
+sale_serializer = TrustedSerializer(Sale, DATE_FIELDS["sales"])
+sale_fields = Fieldset(Sale.model_fields, {
+    "summary": ["client_id", "company", "pack_type", "pack_name", "pack_price", "status", "score",
+                "created_by", "created_at"],
+})
+
+sale_list = ListQuery("sales", [
+    Filter("status", choices=SALE_STATUSES),
+    Filter("company"),
+    Filter("pack_type"),
+    Filter("created_by"),
+    Filter("created_from", "created_at", "gte", datetime),
+    Filter("created_to", "created_at", "lt", datetime),
+    Filter("score_min", "score", "gte", int),
+    Filter("score_max", "score", "lte", int),
+], sorts=["created_at", "score"], dates=date_migration)
+
 @api_router.get("/sales", response_model=List[Sale])
-async def get_sales(user: User = Depends(get_current_user)):
+async def get_sales(request: Request, response: Response, user: User = Depends(get_current_user),
+                    limit: int = DEFAULT_LIMIT, cursor: Optional[str] = None, fields: Optional[str] = None):
+    selected = parse_fields(sale_fields, fields)
     query = {}
     if user.role == "Empleado":
         query = {"created_by": user.id}
+    parsed = parse_list_query(sale_list, request, response, scopes=[list(query)])
     
-    sales = await db.sales.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for s in sales:
-        if isinstance(s["created_at"], str):
-            s["created_at"] = datetime.fromisoformat(s["created_at"])
-        if isinstance(s["updated_at"], str):
-            s["updated_at"] = datetime.fromisoformat(s["updated_at"])
-    return sales
+    sales = await keyset_page(parsed.keyset, db.sales, parsed.scoped(query), Fieldset.projection(selected),
+                              limit, cursor, response)
+    return list_response(sale_serializer, sales, response, selected)
 
 @api_router.get("/sales/{sale_id}")
 async def get_sale_detail(sale_id: str, user: User = Depends(get_current_user)):
@@ -769,12 +1099,12 @@ async def get_sale_detail(sale_id: str, user: User = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Get client info
-    client = await db.clients.find_one({"id": sale["client_id"]}, {"_id": 0})
+    client = await db.clients.find_one({"id": sale["client_id"]}, {"_id": 0, **CLIENT_INTERNAL_FIELDS})
     
     # Get pack info if pack_id exists
     pack = None
     if sale.get("pack_id"):
-        pack = await db.packs.find_one({"id": sale["pack_id"]}, {"_id": 0})
+        pack = await pack_catalog.get(sale["pack_id"])
     
     # Get employee info
     employee = await db.users.find_one({"id": sale["created_by"]}, {"_id": 0, "password": 0})
@@ -811,7 +1141,7 @@ async def update_sale_status(sale_id: str, status: str, user: User = Depends(get
         {"$set": {
             "status": status, 
             "score": new_score,
-            "updated_at": datetime.now(timezone.utc).isoformat()
+            "updated_at": datetime.now(timezone.utc)
         }}
     )
     
@@ -865,7 +1195,7 @@ async def update_sale(sale_id: str, sale_data: SaleUpdate, user: User = Depends(
     merged_sale = {**sale, **update_dict}
     new_score = calculate_sale_score(merged_sale)
     update_dict["score"] = new_score
-    update_dict["updated_at"] = datetime.now(timezone.utc).isoformat()
+    update_dict["updated_at"] = datetime.now(timezone.utc)
     
     result = await db.sales.update_one(
         {"id": sale_id},
@@ -883,74 +1213,145 @@ async def update_sale(sale_id: str, sale_data: SaleUpdate, user: User = Depends(
 
 @api_router.post("/packs", response_model=Pack)
 async def create_pack(pack_data: PackCreate, user: User = Depends(require_super_admin)):
-    pack = Pack(**pack_data.model_dump())
+    pack = Pack(**pack_data.model_dump(), **compile_rules(pack_data.restrictions, pack_data.observations))
     pack.is_new = (datetime.now(timezone.utc) - pack.created_at).days < 7
     
     doc = pack.model_dump()
-    doc["created_at"] = doc["created_at"].isoformat()
-    if doc.get("validity_start"):
-        doc["validity_start"] = doc["validity_start"].isoformat()
-    if doc.get("validity_end"):
-        doc["validity_end"] = doc["validity_end"].isoformat()
     
     await db.packs.insert_one(doc)
+    await pack_prices.record(pack.id, pack.price, pack.created_at)
+    await change_versions.bump("packs")
     return pack
 
+pack_serializer = TrustedSerializer(Pack, DATE_FIELDS["packs"])
+# Pack reads (listing, calculator, sale detail) are served from memory
+pack_catalog = PackCatalog(db, change_versions, Pack,
+                           max_age=float(os.environ.get('PACK_CATALOG_MAX_AGE_SECONDS', 3600)))
+
 @api_router.get("/packs", response_model=List[Pack])
-async def get_packs(user: User = Depends(get_current_user), active_only: bool = False):
-    query = {}
-    if active_only:
-        query["active"] = True
-    
-    packs = await db.packs.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for p in packs:
-        if isinstance(p["created_at"], str):
-            p["created_at"] = datetime.fromisoformat(p["created_at"])
-        if p.get("validity_start") and isinstance(p["validity_start"], str):
-            p["validity_start"] = datetime.fromisoformat(p["validity_start"])
-        if p.get("validity_end") and isinstance(p["validity_end"], str):
-            p["validity_end"] = datetime.fromisoformat(p["validity_end"])
-        p["is_new"] = (datetime.now(timezone.utc) - p["created_at"]).days < 7
-    return packs
+async def get_packs(request: Request, response: Response, user: User = Depends(get_current_user),
+                    active_only: bool = False, limit: int = DEFAULT_LIMIT, cursor: Optional[str] = None):
+    # is_new depends on the date, so the ETag rotates daily
+    cached = await not_modified(request, response, ["packs"], datetime.now(timezone.utc).date())
+    if cached:
+        return cached
+    try:
+        packs, next_cursor = await pack_catalog.page(newest_first, active_only, limit, cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return list_response(pack_serializer, packs, response)
+
+@api_router.get("/packs/frontier")
+async def get_pack_frontier(request: Request, response: Response, user: User = Depends(get_current_user),
+                            type: Optional[str] = None, tv_supported: Optional[bool] = None):
+    """
+    Packs on offer that no other of the same type and TV support beats on
+    price, GB and fiber speed at once, with their comparison badges
+    """
+    snapshot = await pack_catalog.snapshot()
+    # The frontier changes whenever the catalog is reloaded, for writes or validity windows
+    cached = await not_modified(request, response, ["packs"], snapshot.loaded_at.isoformat())
+    if cached:
+        return cached
+    index = await current_index(pack_catalog)
+    return [
+        {
+            "type": pack_type,
+            "tv_supported": tv,
+            "packs": [{**pack_serializer.rows([entry.pack])[0], "badges": badges}
+                      for entry, badges in index.frontier(pack_type, tv)]
+        }
+        for pack_type, tv in index.frontier_keys()
+        if (type is None or pack_type == type) and (tv_supported is None or tv == tv_supported)
+    ]
 
 @api_router.patch("/packs/{pack_id}")
 async def patch_pack(pack_id: str, pack_data: PackCreate, user: User = Depends(require_super_admin)):
-    doc = pack_data.model_dump()
-    if doc.get("validity_start"):
-        doc["validity_start"] = doc["validity_start"].isoformat()
-    if doc.get("validity_end"):
-        doc["validity_end"] = doc["validity_end"].isoformat()
+    doc = {**pack_data.model_dump(), **compile_rules(pack_data.restrictions, pack_data.observations)}
     
-    result = await db.packs.update_one({"id": pack_id}, {"$set": doc})
-    if result.matched_count == 0:
+    before = await db.packs.find_one_and_update(
+        {"id": pack_id}, {"$set": doc}, projection={"_id": 0, "id": 1, "price": 1, "created_at": 1, "is_demo": 1}
+    )
+    if before is None:
         raise HTTPException(status_code=404, detail="Pack not found")
+    await pack_prices.track(before, pack_data.price)
+    await change_versions.bump("packs")
     return {"message": "Pack updated"}
 
 @api_router.put("/packs/{pack_id}")
 async def update_pack(pack_id: str, pack_data: PackCreate, user: User = Depends(require_super_admin)):
     """Update a pack/tariff completely"""
-    doc = pack_data.model_dump()
-    if doc.get("validity_start"):
-        doc["validity_start"] = doc["validity_start"].isoformat()
-    if doc.get("validity_end"):
-        doc["validity_end"] = doc["validity_end"].isoformat()
+    doc = {**pack_data.model_dump(), **compile_rules(pack_data.restrictions, pack_data.observations)}
     
-    result = await db.packs.update_one({"id": pack_id}, {"$set": doc})
-    if result.matched_count == 0:
+    before = await db.packs.find_one_and_update(
+        {"id": pack_id}, {"$set": doc}, projection={"_id": 0, "id": 1, "price": 1, "created_at": 1, "is_demo": 1}
+    )
+    if before is None:
         raise HTTPException(status_code=404, detail="Pack not found")
+    await pack_prices.track(before, pack_data.price)
+    await change_versions.bump("packs")
     
     # Return updated pack
     updated = await db.packs.find_one({"id": pack_id}, {"_id": 0})
     return updated
 
+# Operator price sheets, upserted by (company, name)
+pack_import = PackImport(db, PackCreate, pack_prices, batch_size=int(os.environ.get('PACK_IMPORT_BATCH_SIZE', 500)))
+
+@api_router.post("/packs/import")
+async def import_packs(file: UploadFile = File(...), deactivate_missing: bool = True,
+                       user: User = Depends(require_super_admin)):
+    """
+    Import an operator price sheet (.csv or .xlsx, one pack per row). Packs
+    are matched by company and name; with deactivate_missing, packs of the
+    sheet's companies it no longer lists are deactivated.
+    """
+    try:
+        result = await pack_import.run(read_rows(file.filename or "", file.file), deactivate_missing)
+    except ImportFileError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result["created"] or result["updated"] or result["deactivated"]:
+        await change_versions.bump("packs")
+    return result
+
+PACK_PRICE_MAX_LOOKUPS = 10000
+
+class PackPriceLookup(BaseModel):
+    pack_id: str
+    at: datetime
+
+class PackPriceLookups(BaseModel):
+    lookups: List[PackPriceLookup] = Field(max_length=PACK_PRICE_MAX_LOOKUPS)
+
+@api_router.get("/packs/{pack_id}/prices")
+async def get_pack_prices(pack_id: str, at: Optional[datetime] = None, user: User = Depends(get_current_user)):
+    """Price history of a pack, oldest first, or its price at `at`"""
+    if at is not None:
+        if at.tzinfo is None:
+            at = at.replace(tzinfo=timezone.utc)
+        [price] = await pack_prices.as_of([(pack_id, at)])
+        if price is None:
+            raise HTTPException(status_code=404, detail="No price for this pack at that date")
+        return {"pack_id": pack_id, "at": at, "price": price}
+    history = await pack_prices.history(pack_id)
+    if not history and await pack_catalog.get(pack_id) is None:
+        raise HTTPException(status_code=404, detail="Pack not found")
+    return history
+
+@api_router.post("/packs/prices/as-of")
+async def get_pack_prices_as_of(body: PackPriceLookups, user: User = Depends(require_super_admin)):
+    """Price of each pack at each date (null if it had none), in request order"""
+    prices = await pack_prices.as_of((lookup.pack_id, lookup.at) for lookup in body.lookups)
+    return {"prices": prices}
+
 # ==================== INCIDENT ENDPOINTS ====================
 
 @api_router.post("/incidents", response_model=Incident)
 async def create_incident(incident_data: IncidentCreate, user: User = Depends(get_current_user)):
     incident = Incident(**incident_data.model_dump(), created_by=user.id)
     doc = incident.model_dump()
-    doc["created_at"] = doc["created_at"].isoformat()
-    doc["updated_at"] = doc["updated_at"].isoformat()
     await db.incidents.insert_one(doc)
     
     # Create notification for incident opened
@@ -963,24 +1364,40 @@ async def create_incident(incident_data: IncidentCreate, user: User = Depends(ge
         related_type="incident"
     )
     notif_doc = notif.model_dump()
-    notif_doc["created_at"] = notif_doc["created_at"].isoformat()
     await db.notifications.insert_one(notif_doc)
     
     return incident
 
+incident_serializer = TrustedSerializer(Incident, DATE_FIELDS["incidents"])
+incident_fields = Fieldset(Incident.model_fields, {
+    "summary": ["client_id", "title", "priority", "type", "status", "assigned_to", "created_by", "created_at"],
+})
+
+incident_list = ListQuery("incidents", [
+    Filter("status", choices=["Abierta", "En Proceso", "Cerrada"]),
+    Filter("priority", choices=["Baja", "Media", "Alta", "Crítica"]),
+    Filter("type"),
+    Filter("client_id"),
+    Filter("assigned_to"),
+    Filter("created_by"),
+    Filter("created_from", "created_at", "gte", datetime),
+    Filter("created_to", "created_at", "lt", datetime),
+], sorts=["created_at"], dates=date_migration)
+
 @api_router.get("/incidents", response_model=List[Incident])
-async def get_incidents(user: User = Depends(get_current_user)):
+async def get_incidents(request: Request, response: Response, user: User = Depends(get_current_user),
+                        limit: int = DEFAULT_LIMIT, cursor: Optional[str] = None, fields: Optional[str] = None):
+    selected = parse_fields(incident_fields, fields)
     query = {}
+    scopes = [[]]
     if user.role == "Empleado":
         query = {"$or": [{"created_by": user.id}, {"assigned_to": user.id}]}
+        scopes = [["created_by"], ["assigned_to"]]
+    parsed = parse_list_query(incident_list, request, response, scopes=scopes)
     
-    incidents = await db.incidents.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for i in incidents:
-        if isinstance(i["created_at"], str):
-            i["created_at"] = datetime.fromisoformat(i["created_at"])
-        if isinstance(i["updated_at"], str):
-            i["updated_at"] = datetime.fromisoformat(i["updated_at"])
-    return incidents
+    incidents = await keyset_page(parsed.keyset, db.incidents, parsed.scoped(query), Fieldset.projection(selected),
+                                  limit, cursor, response)
+    return list_response(incident_serializer, incidents, response, selected)
 
 @api_router.get("/incidents/{incident_id}")
 async def get_incident_detail(incident_id: str, user: User = Depends(get_current_user)):
@@ -994,7 +1411,7 @@ async def get_incident_detail(incident_id: str, user: User = Depends(get_current
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Get client info
-    client = await db.clients.find_one({"id": incident["client_id"]}, {"_id": 0})
+    client = await db.clients.find_one({"id": incident["client_id"]}, {"_id": 0, **CLIENT_INTERNAL_FIELDS})
     
     # Get creator info
     creator = await db.users.find_one({"id": incident["created_by"]}, {"_id": 0, "password": 0})
@@ -1030,7 +1447,7 @@ async def update_incident(incident_id: str, incident_data: IncidentUpdate, user:
         raise HTTPException(status_code=403, detail="No tienes permiso para modificar esta incidencia")
     
     # Build update dict with only provided fields
-    update_dict = {"updated_at": datetime.now(timezone.utc).isoformat()}
+    update_dict = {"updated_at": datetime.now(timezone.utc)}
     
     if incident_data.title is not None:
         update_dict["title"] = incident_data.title
@@ -1063,7 +1480,6 @@ async def update_incident(incident_id: str, incident_data: IncidentUpdate, user:
             related_type="incident"
         )
         notif_doc = notif.model_dump()
-        notif_doc["created_at"] = notif_doc["created_at"].isoformat()
         await db.notifications.insert_one(notif_doc)
     
     # Return updated incident
@@ -1079,16 +1495,12 @@ async def add_incident_comment(incident_id: str, comment: str, user: User = Depe
         user_name=user.name
     )
     doc = comment_data.model_dump()
-    doc["created_at"] = doc["created_at"].isoformat()
     await db.incident_comments.insert_one(doc)
     return {"message": "Comment added"}
 
 @api_router.get("/incidents/{incident_id}/comments")
 async def get_incident_comments(incident_id: str, user: User = Depends(get_current_user)):
     comments = await db.incident_comments.find({"incident_id": incident_id}, {"_id": 0}).sort("created_at", 1).to_list(1000)
-    for c in comments:
-        if isinstance(c["created_at"], str):
-            c["created_at"] = datetime.fromisoformat(c["created_at"])
     return comments
 
 # ==================== DASHBOARD ENDPOINTS ====================
@@ -1102,26 +1514,20 @@ async def get_dashboard_kpis(user: User = Depends(get_current_user)):
     last_month_end = month_start - timedelta(days=1)
     
     # Sales today
-    sales_today = await db.sales.count_documents({
-        "created_at": {"$gte": today.isoformat()}
-    })
+    sales_today = await db.sales.count_documents(date_range("created_at", gte=today))
     
     # Sales yesterday
-    sales_yesterday = await db.sales.count_documents({
-        "created_at": {"$gte": yesterday.isoformat(), "$lt": today.isoformat()}
-    })
+    sales_yesterday = await db.sales.count_documents(date_range("created_at", gte=yesterday, lt=today))
     
     # Sales this month
-    sales_month = await db.sales.count_documents({
-        "created_at": {"$gte": month_start.isoformat()}
-    })
+    sales_month = await db.sales.count_documents(date_range("created_at", gte=month_start))
     
     # Sales last month (same period)
     current_day = today.day
     last_month_same_day = last_month_start + timedelta(days=current_day - 1)
-    sales_last_month_period = await db.sales.count_documents({
-        "created_at": {"$gte": last_month_start.isoformat(), "$lt": last_month_same_day.isoformat()}
-    })
+    sales_last_month_period = await db.sales.count_documents(
+        date_range("created_at", gte=last_month_start, lt=last_month_same_day)
+    )
     
     # Calculate trends
     today_trend = "up" if sales_today > sales_yesterday else ("down" if sales_today < sales_yesterday else "stable")
@@ -1150,10 +1556,10 @@ async def get_dashboard_kpis(user: User = Depends(get_current_user)):
     incidents_closed = await db.incidents.count_documents({"status": "Cerrada"})
     
     # Incidents > 48h
-    two_days_ago = (today - timedelta(days=2)).isoformat()
+    two_days_ago = today - timedelta(days=2)
     incidents_over_48h = await db.incidents.count_documents({
         "status": {"$in": ["Abierta", "En Proceso"]},
-        "created_at": {"$lt": two_days_ago}
+        **date_range("created_at", lt=two_days_ago)
     })
     
     # Objective progress
@@ -1226,12 +1632,12 @@ async def get_team_ranking(user: User = Depends(get_current_user)):
     for u in users:
         sales_month = await db.sales.count_documents({
             "created_by": u["id"],
-            "created_at": {"$gte": month_start.isoformat()}
+            **date_range("created_at", gte=month_start)
         })
         
         sales_today = await db.sales.count_documents({
             "created_by": u["id"],
-            "created_at": {"$gte": today.isoformat()}
+            **date_range("created_at", gte=today)
         })
         
         # Company breakdown
@@ -1263,16 +1669,16 @@ async def create_objective(obj_data: ObjectiveCreate, user: User = Depends(requi
     
     objective = Objective(**obj_data.model_dump())
     doc = objective.model_dump()
-    doc["created_at"] = doc["created_at"].isoformat()
     await db.objectives.insert_one(doc)
+    await change_versions.bump("objectives")
     return objective
 
 @api_router.get("/objectives")
-async def get_objectives(user: User = Depends(require_super_admin)):
+async def get_objectives(request: Request, response: Response, user: User = Depends(require_super_admin)):
+    cached = await not_modified(request, response, ["objectives"])
+    if cached:
+        return cached
     objectives = await db.objectives.find({}, {"_id": 0}).sort("year", -1).sort("month", -1).to_list(100)
-    for o in objectives:
-        if isinstance(o["created_at"], str):
-            o["created_at"] = datetime.fromisoformat(o["created_at"])
     return objectives
 
 # ==================== FICHAJE ENDPOINTS ====================
@@ -1281,21 +1687,17 @@ async def get_objectives(user: User = Depends(require_super_admin)):
 async def create_fichaje(fichaje_data: FichajeCreate, user: User = Depends(get_current_user)):
     fichaje = Fichaje(user_id=user.id, type=fichaje_data.type)
     doc = fichaje.model_dump()
-    doc["timestamp"] = doc["timestamp"].isoformat()
     await db.fichajes.insert_one(doc)
     return fichaje
 
 @api_router.get("/fichajes")
-async def get_fichajes(user: User = Depends(get_current_user)):
+async def get_fichajes(response: Response, user: User = Depends(get_current_user),
+                       limit: int = DEFAULT_LIMIT, cursor: Optional[str] = None):
     query = {"user_id": user.id}
     if user.role == "SuperAdmin":
         query = {}
     
-    fichajes = await db.fichajes.find(query, {"_id": 0}).sort("timestamp", -1).to_list(1000)
-    for f in fichajes:
-        if isinstance(f["timestamp"], str):
-            f["timestamp"] = datetime.fromisoformat(f["timestamp"])
-    return fichajes
+    return await keyset_page(latest_fichajes_first, db.fichajes, query, {"_id": 0}, limit, cursor, response)
 
 @api_router.get("/fichajes/admin")
 async def get_fichajes_admin(user: User = Depends(require_super_admin)):
@@ -1313,8 +1715,9 @@ async def get_fichajes_admin(user: User = Depends(require_super_admin)):
         # Get today's fichajes for this employee
         fichajes_today = await db.fichajes.find({
             "user_id": emp["id"],
-            "timestamp": {"$gte": today.isoformat()}
-        }, {"_id": 0}).sort("timestamp", 1).to_list(100)
+            **date_range("timestamp", gte=today)
+        }, {"_id": 0}).to_list(100)
+        fichajes_today.sort(key=date_sort_key("timestamp"))
         
         # Determine status
         status = "No fichado"
@@ -1338,10 +1741,10 @@ async def get_fichajes_admin(user: User = Depends(require_super_admin)):
             exits = [f for f in fichajes_today if f["type"] == "Salida"]
             
             for i, entry in enumerate(entries):
-                entry_dt = datetime.fromisoformat(entry["timestamp"]) if isinstance(entry["timestamp"], str) else entry["timestamp"]
+                entry_dt = as_datetime(entry["timestamp"])
                 
                 if i < len(exits):
-                    exit_dt = datetime.fromisoformat(exits[i]["timestamp"]) if isinstance(exits[i]["timestamp"], str) else exits[i]["timestamp"]
+                    exit_dt = as_datetime(exits[i]["timestamp"])
                     total_hours_today += (exit_dt - entry_dt).total_seconds() / 3600
                 elif status == "Fichado":
                     # Currently working, calculate partial hours
@@ -1376,13 +1779,14 @@ async def get_fichajes_admin_history(user_id: str, days: int = 30, user: User =
     # Get all fichajes in the period
     fichajes = await db.fichajes.find({
         "user_id": user_id,
-        "timestamp": {"$gte": start_date.isoformat()}
-    }, {"_id": 0}).sort("timestamp", 1).to_list(1000)
+        **date_range("timestamp", gte=start_date)
+    }, {"_id": 0}).to_list(1000)
+    fichajes.sort(key=date_sort_key("timestamp"))
     
     # Group by day
     daily_summary = {}
     for f in fichajes:
-        timestamp = datetime.fromisoformat(f["timestamp"]) if isinstance(f["timestamp"], str) else f["timestamp"]
+        timestamp = as_datetime(f["timestamp"])
         day_key = timestamp.strftime("%Y-%m-%d")
         
         if day_key not in daily_summary:
@@ -1427,23 +1831,27 @@ async def get_fichajes_admin_history(user_id: str, days: int = 30, user: User =
 async def create_contact(contact_data: ContactCreate, user: User = Depends(get_current_user)):
     contact = Contact(**contact_data.model_dump(), created_by=user.id)
     doc = contact.model_dump()
-    doc["created_at"] = doc["created_at"].isoformat()
     await db.contacts.insert_one(doc)
+    await change_versions.bump("contacts")
     return contact
 
+contact_serializer = TrustedSerializer(Contact, DATE_FIELDS["contacts"])
+
 @api_router.get("/contacts", response_model=List[Contact])
-async def get_contacts(user: User = Depends(get_current_user)):
-    contacts = await db.contacts.find({}, {"_id": 0}).sort("name", 1).to_list(1000)
-    for c in contacts:
-        if isinstance(c["created_at"], str):
-            c["created_at"] = datetime.fromisoformat(c["created_at"])
-    return contacts
+async def get_contacts(request: Request, response: Response, user: User = Depends(get_current_user),
+                       limit: int = DEFAULT_LIMIT, cursor: Optional[str] = None):
+    cached = await not_modified(request, response, ["contacts"])
+    if cached:
+        return cached
+    contacts = await keyset_page(by_name, db.contacts, {}, {"_id": 0}, limit, cursor, response)
+    return list_response(contact_serializer, contacts, response)
 
 @api_router.delete("/contacts/{contact_id}")
 async def delete_contact(contact_id: str, user: User = Depends(require_super_admin)):
     result = await db.contacts.delete_one({"id": contact_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Contact not found")
+    await change_versions.bump("contacts")
     return {"message": "Contact deleted"}
 
 # ==================== NOTIFICATION ENDPOINTS ====================
@@ -1497,10 +1905,6 @@ async def get_notifications(user: User = Depends(get_current_user)):
                 notifications.append(n)
         notifications = notifications[:50]
     
-    for n in notifications:
-        if isinstance(n.get("created_at"), str):
-            n["created_at"] = datetime.fromisoformat(n["created_at"])
-    
     return notifications
 
 @api_router.get("/notifications/unread-count")
@@ -1568,21 +1972,14 @@ async def mark_all_notifications_read(user: User = Depends(get_current_user)):
 
 @api_router.post("/calculator/recommend")
 async def recommend_packs(pack_type: str, origin_company: Optional[str] = None, user: User = Depends(get_current_user)):
-    query = {"active": True, "type": pack_type}
-    packs = await db.packs.find(query, {"_id": 0}).to_list(100)
+    packs = await pack_catalog.offer(pack_type)
     
-    # Filter by origin company observations
+    # Packs whose observations single out the origin company first
+    origin = origin_key(origin_company)
     recommendations = []
     for pack in packs:
-        if isinstance(pack["created_at"], str):
-            pack["created_at"] = datetime.fromisoformat(pack["created_at"])
-        if pack.get("validity_start") and isinstance(pack["validity_start"], str):
-            pack["validity_start"] = datetime.fromisoformat(pack["validity_start"])
-        if pack.get("validity_end") and isinstance(pack["validity_end"], str):
-            pack["validity_end"] = datetime.fromisoformat(pack["validity_end"])
-        
         score = 0
-        if origin_company and pack.get("observations") and origin_company.lower() in pack["observations"].lower():
+        if origin and origin in pack["bonus_origins"]:
             score = 10
         
         recommendations.append({**pack, "score": score})
@@ -1602,99 +1999,23 @@ class ConfiguratorRequest(BaseModel):
     tv_package_type: Optional[str] = None
     respect_restrictions: bool = True
 
-@api_router.post("/calculator/configure")
-async def configure_packs(config: ConfiguratorRequest, user: User = Depends(get_current_user)):
-    # Filter active packs by type
-    query = {"active": True, "type": config.pack_type}
-    packs = await db.packs.find(query, {"_id": 0}).to_list(1000)
-    
-    if not packs:
-        return []
-    
-    recommendations = []
-    
-    for pack in packs:
-        # Parse dates
-        if isinstance(pack["created_at"], str):
-            pack["created_at"] = datetime.fromisoformat(pack["created_at"])
-        if pack.get("validity_start") and isinstance(pack["validity_start"], str):
-            pack["validity_start"] = datetime.fromisoformat(pack["validity_start"])
-        if pack.get("validity_end") and isinstance(pack["validity_end"], str):
-            pack["validity_end"] = datetime.fromisoformat(pack["validity_end"])
-        
-        # Check restrictions
-        if config.respect_restrictions and config.origin_company and pack.get("restrictions"):
-            if config.origin_company.lower() not in pack["restrictions"].lower() and "solo" in pack["restrictions"].lower():
-                continue
-        
-        # Check TV requirement
-        if config.tv_required and not pack.get("tv_supported"):
-            continue
-        
-        # Calculate score
-        score = 0
-        fit_details = []
-        
-        # Priority weights
-        price_weight = 3 if config.priority == "Ahorrar" else (2 if config.priority == "Equilibrado" else 1)
-        quality_weight = 1 if config.priority == "Ahorrar" else (2 if config.priority == "Equilibrado" else 3)
-        
-        # Mobile GB fit
-        if config.mobile_gb and pack.get("mobile_gb"):
-            gb_diff = abs(pack["mobile_gb"] - config.mobile_gb)
-            if pack["mobile_gb"] >= config.mobile_gb:
-                gb_score = max(0, 20 - (gb_diff / 10))
-                score += gb_score * quality_weight
-                fit_details.append(f"GB: {pack['mobile_gb']}GB (pedido: {config.mobile_gb}GB)")
-            else:
-                score -= 10  # Penalize if below needed
-        
-        # Fiber speed fit
-        if config.fiber_speed_mbps and pack.get("fiber_speed_mbps"):
-            speed_diff = abs(pack["fiber_speed_mbps"] - config.fiber_speed_mbps)
-            if pack["fiber_speed_mbps"] >= config.fiber_speed_mbps:
-                speed_score = max(0, 20 - (speed_diff / 100))
-                score += speed_score * quality_weight
-                fit_details.append(f"Fibra: {pack['fiber_speed_mbps']}Mbps")
-            else:
-                score -= 10
-        
-        # Price score (inverse - lower is better for "Ahorrar")
-        max_price = 100
-        price_score = ((max_price - pack["price"]) / max_price) * 20
-        score += price_score * price_weight
-        
-        # TV bonus
-        if config.tv_required and pack.get("tv_supported"):
-            score += 15
-            fit_details.append(f"TV: {pack.get('tv_package_type', 'incluida')}")
-        
-        # Additional lines
-        if config.additional_lines > 0 and pack.get("additional_lines_supported"):
-            score += 10
-            fit_details.append(f"Líneas adicionales soportadas")
-        
-        # New pack bonus
-        is_new = (datetime.now(timezone.utc) - pack["created_at"]).days < 30
-        if is_new:
-            score += 5
-        
-        # Origin company bonus
-        if config.origin_company and pack.get("observations"):
-            if config.origin_company.lower() in pack["observations"].lower():
-                score += 10
-                fit_details.append(f"Especial para {config.origin_company}")
-        
-        recommendations.append({
-            **pack,
-            "score": round(score, 2),
-            "fit_details": fit_details,
-            "is_new": is_new,
+CONFIGURATOR_MAX_SCENARIOS = int(os.environ.get('CONFIGURATOR_MAX_SCENARIOS', 20))
+
+class ConfiguratorBatchRequest(BaseModel):
+    scenarios: List[ConfiguratorRequest] = Field(min_length=1, max_length=CONFIGURATOR_MAX_SCENARIOS)
+
+def build_recommendations(top, config: ConfiguratorRequest, now: datetime) -> List[dict]:
+    """Configurator results with fit details and badges for the top (score, pack) entries"""
+    recommendations = [
+        {
+            **entry.pack,
+            "score": score,
+            "fit_details": fit_details(entry, config),
+            "is_new": is_recent(entry, now.timestamp()),
             "badges": []
-        })
-    
-    # Sort by score
-    recommendations.sort(key=lambda x: x["score"], reverse=True)
+        }
+        for score, entry in top
+    ]
     
     # Assign badges to top 3
     if len(recommendations) > 0:
@@ -1711,14 +2032,9 @@ async def configure_packs(config: ConfiguratorRequest, user: User = Depends(get_
         most_complete_idx = 0
         max_features = 0
         for i, pack in enumerate(recommendations[:3]):
-            feature_count = sum([
-                1 if pack.get("mobile_gb", 0) > 20 else 0,
-                1 if pack.get("fiber_speed_mbps", 0) > 500 else 0,
-                1 if pack.get("tv_supported") else 0,
-                1 if pack.get("additional_lines_supported") else 0
-            ])
-            if feature_count > max_features:
-                max_features = feature_count
+            features = feature_count(pack)
+            if features > max_features:
+                max_features = features
                 most_complete_idx = i
         if most_complete_idx > 0:
             recommendations[most_complete_idx]["badges"].append("Más completo")
@@ -1730,6 +2046,40 @@ async def configure_packs(config: ConfiguratorRequest, user: User = Depends(get_
     
     return recommendations[:3]
 
+@api_router.post("/calculator/configure")
+async def configure_packs(config: ConfiguratorRequest, user: User = Depends(get_current_user)):
+    # Active packs of the type, within their validity window, best three first
+    index = await current_index(pack_catalog)
+    now = datetime.now(timezone.utc)
+    return build_recommendations(index.top(config, 3, now), config, now)
+
+@api_router.post("/calculator/configure/batch")
+async def configure_packs_batch(batch: ConfiguratorBatchRequest, user: User = Depends(get_current_user)):
+    """
+    Several household scenarios against one catalog snapshot: each gets what
+    /calculator/configure would return, and the summary points at the
+    cheapest and the best-scored pack across all of them.
+    """
+    index = await current_index(pack_catalog)
+    now = datetime.now(timezone.utc)
+    tops = index.top_many(batch.scenarios, 3, now)
+    scenarios = [build_recommendations(top, config, now) for top, config in zip(tops, batch.scenarios)]
+    
+    def summarize(offer):
+        if offer is None:
+            return None
+        scenario, pack = offer
+        return {"scenario": scenario, **{k: pack[k] for k in ("id", "company", "name", "type", "price", "score")}}
+    
+    offered = [(i, pack) for i, recommendations in enumerate(scenarios) for pack in recommendations]
+    return {
+        "scenarios": scenarios,
+        "summary": {
+            "cheapest": summarize(min(offered, key=lambda item: item[1]["price"], default=None)),
+            "best_value": summarize(max(offered, key=lambda item: item[1]["score"], default=None)),
+        }
+    }
+
 # ==================== EXPORT ENDPOINTS ====================
 
 @api_router.get("/export/sales/csv")
@@ -1746,7 +2096,7 @@ async def export_sales_csv(user: User = Depends(require_super_admin)):
             "company": sale["company"],
             "pack_type": sale["pack_type"],
             "status": sale["status"],
-            "created_at": sale["created_at"]
+            "created_at": as_datetime(sale["created_at"]).isoformat()
         })
     
     output.seek(0)
@@ -1802,16 +2152,34 @@ async def export_sales_pdf(user: User = Depends(require_super_admin)):
 
 # ==================== DEMO DATA ENDPOINTS ====================
 
+async def seed_documents(collection: str, docs: List[dict], keys: tuple = ("id",)) -> int:
+    """
+    Inserts the `docs` not stored yet, matched on their unique `keys`;
+    documents already there (an earlier seed, this month's real objective)
+    are left untouched. Returns how many were inserted.
+    """
+    operations = [
+        UpdateOne({key: doc[key] for key in keys}, {"$setOnInsert": doc}, upsert=True)
+        for doc in docs
+    ]
+    result = await db[collection].bulk_write(operations, ordered=False)
+    return result.upserted_count
+
 @api_router.post("/demo/seed")
 async def seed_demo_data(user: User = Depends(require_super_admin)):
-    # Create demo users
+    # Create demo users (all share the same demo password, so hash it once,
+    # with the cheap test-only cost)
+    try:
+        demo_password = await password_hasher.hash("demo123", rounds=DEMO_BCRYPT_ROUNDS)
+    except PasswordHasherUnavailable:
+        raise HTTPException(status_code=503, detail="Servicio ocupado, inténtalo de nuevo", headers={"Retry-After": "1"})
     demo_users = [
-        {"id": "demo-tai", "email": "tai@demo.com", "password": hash_password("demo123"), "name": "Tai", "role": "Empleado", "language": "es", "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True},
-        {"id": "demo-carlos", "email": "carlos@demo.com", "password": hash_password("demo123"), "name": "Carlos", "role": "Empleado", "language": "es", "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True},
-        {"id": "demo-miguel", "email": "miguel@demo.com", "password": hash_password("demo123"), "name": "Miguel Ángel", "role": "Empleado", "language": "es", "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True}
+        {"id": "demo-tai", "email": "tai@demo.com", "password": demo_password, "name": "Tai", "role": "Empleado", "language": "es", "created_at": datetime.now(timezone.utc), "is_demo": True},
+        {"id": "demo-carlos", "email": "carlos@demo.com", "password": demo_password, "name": "Carlos", "role": "Empleado", "language": "es", "created_at": datetime.now(timezone.utc), "is_demo": True},
+        {"id": "demo-miguel", "email": "miguel@demo.com", "password": demo_password, "name": "Miguel Ángel", "role": "Empleado", "language": "es", "created_at": datetime.now(timezone.utc), "is_demo": True}
     ]
     
-    await db.users.insert_many(demo_users)
+    created = {"users": await seed_documents("users", demo_users, keys=("email",))}
     
     # Create demo clients
     demo_clients = []
@@ -1823,12 +2191,15 @@ async def seed_demo_data(user: User = Depends(require_super_admin)):
             "email": f"cliente{i}@demo.com",
             "city": "Madrid" if i % 2 == 0 else "Barcelona",
             "created_by": "demo-tai",
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc),
             "is_demo": True
         })
     
-    await db.clients.insert_many(demo_clients)
+    for demo_client in demo_clients:
+        demo_client.update(client_search.fields_for(demo_client))
+    await client_phone_keys.claim(demo_clients)
+    created["clients"] = await seed_documents("clients", demo_clients)
     
     # Create demo packs
     companies = ["Jazztel", "MásMóvil", "Pepephone", "Simyo"]
@@ -1836,33 +2207,38 @@ async def seed_demo_data(user: User = Depends(require_super_admin)):
     
     # Jazztel packs
     demo_packs.extend([
-        {"id": "pack-jazztel-1", "company": "Jazztel", "name": "Móvil 20GB", "type": "Solo Móvil", "price": 15.0, "features": "20GB + Minutos ilimitados", "active": True, "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True, "category": "mobile_only", "mobile_gb": 20, "minutes_type": "ilimitadas"},
-        {"id": "pack-jazztel-2", "company": "Jazztel", "name": "Fibra 600Mb", "type": "Solo Fibra", "price": 30.0, "features": "600Mbps simétrica", "active": True, "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True, "category": "fiber_only", "fiber_speed_mbps": 600},
-        {"id": "pack-jazztel-3", "company": "Jazztel", "name": "Pack Total 1Gb + 50GB", "type": "Pack Fibra + Móvil", "price": 45.0, "features": "1Gbps + 50GB móvil + TV Básica", "active": True, "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True, "category": "bundle_tv", "fiber_speed_mbps": 1000, "mobile_gb": 50, "minutes_type": "ilimitadas", "tv_supported": True, "tv_package_type": "basic", "additional_lines_supported": True, "lines_included": 1},
+        {"id": "pack-jazztel-1", "company": "Jazztel", "name": "Móvil 20GB", "type": "Solo Móvil", "price": 15.0, "features": "20GB + Minutos ilimitados", "active": True, "created_at": datetime.now(timezone.utc), "is_demo": True, "category": "mobile_only", "mobile_gb": 20, "minutes_type": "ilimitadas"},
+        {"id": "pack-jazztel-2", "company": "Jazztel", "name": "Fibra 600Mb", "type": "Solo Fibra", "price": 30.0, "features": "600Mbps simétrica", "active": True, "created_at": datetime.now(timezone.utc), "is_demo": True, "category": "fiber_only", "fiber_speed_mbps": 600},
+        {"id": "pack-jazztel-3", "company": "Jazztel", "name": "Pack Total 1Gb + 50GB", "type": "Pack Fibra + Móvil", "price": 45.0, "features": "1Gbps + 50GB móvil + TV Básica", "active": True, "created_at": datetime.now(timezone.utc), "is_demo": True, "category": "bundle_tv", "fiber_speed_mbps": 1000, "mobile_gb": 50, "minutes_type": "ilimitadas", "tv_supported": True, "tv_package_type": "basic", "additional_lines_supported": True, "lines_included": 1},
     ])
     
     # MásMóvil packs
     demo_packs.extend([
-        {"id": "pack-masmovil-1", "company": "MásMóvil", "name": "Móvil Ilimitado 80GB", "type": "Solo Móvil", "price": 25.0, "features": "80GB + Llamadas ilimitadas", "active": True, "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True, "category": "mobile_only", "mobile_gb": 80, "minutes_type": "ilimitadas"},
-        {"id": "pack-masmovil-2", "company": "MásMóvil", "name": "Fibra 1Gb", "type": "Solo Fibra", "price": 35.0, "features": "1Gbps simétrica", "active": True, "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True, "category": "fiber_only", "fiber_speed_mbps": 1000},
-        {"id": "pack-masmovil-3", "company": "MásMóvil", "name": "Pack Familia 600Mb + 100GB", "type": "Pack Fibra + Móvil", "price": 55.0, "features": "600Mbps + 100GB + 2 líneas", "active": True, "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True, "category": "bundle", "fiber_speed_mbps": 600, "mobile_gb": 100, "minutes_type": "ilimitadas", "additional_lines_supported": True, "lines_included": 2},
-        {"id": "pack-masmovil-4", "company": "MásMóvil", "name": "Pack Premium TV Deportes", "type": "Pack Fibra + Móvil + TV", "price": 70.0, "features": "1Gbps + 120GB + TV Deportes", "active": True, "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True, "category": "bundle_tv", "fiber_speed_mbps": 1000, "mobile_gb": 120, "minutes_type": "ilimitadas", "tv_supported": True, "tv_package_type": "sports", "additional_lines_supported": True, "lines_included": 1},
+        {"id": "pack-masmovil-1", "company": "MásMóvil", "name": "Móvil Ilimitado 80GB", "type": "Solo Móvil", "price": 25.0, "features": "80GB + Llamadas ilimitadas", "active": True, "created_at": datetime.now(timezone.utc), "is_demo": True, "category": "mobile_only", "mobile_gb": 80, "minutes_type": "ilimitadas"},
+        {"id": "pack-masmovil-2", "company": "MásMóvil", "name": "Fibra 1Gb", "type": "Solo Fibra", "price": 35.0, "features": "1Gbps simétrica", "active": True, "created_at": datetime.now(timezone.utc), "is_demo": True, "category": "fiber_only", "fiber_speed_mbps": 1000},
+        {"id": "pack-masmovil-3", "company": "MásMóvil", "name": "Pack Familia 600Mb + 100GB", "type": "Pack Fibra + Móvil", "price": 55.0, "features": "600Mbps + 100GB + 2 líneas", "active": True, "created_at": datetime.now(timezone.utc), "is_demo": True, "category": "bundle", "fiber_speed_mbps": 600, "mobile_gb": 100, "minutes_type": "ilimitadas", "additional_lines_supported": True, "lines_included": 2},
+        {"id": "pack-masmovil-4", "company": "MásMóvil", "name": "Pack Premium TV Deportes", "type": "Pack Fibra + Móvil + TV", "price": 70.0, "features": "1Gbps + 120GB + TV Deportes", "active": True, "created_at": datetime.now(timezone.utc), "is_demo": True, "category": "bundle_tv", "fiber_speed_mbps": 1000, "mobile_gb": 120, "minutes_type": "ilimitadas", "tv_supported": True, "tv_package_type": "sports", "additional_lines_supported": True, "lines_included": 1},
     ])
     
     # Pepephone packs  
     demo_packs.extend([
-        {"id": "pack-pepephone-1", "company": "Pepephone", "name": "Móvil Smart 30GB", "type": "Solo Móvil", "price": 18.0, "features": "30GB + Llamadas ilimitadas", "active": True, "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True, "category": "mobile_only", "mobile_gb": 30, "minutes_type": "ilimitadas"},
-        {"id": "pack-pepephone-2", "company": "Pepephone", "name": "Pack Económico 300Mb + 40GB", "type": "Pack Fibra + Móvil", "price": 38.0, "features": "300Mbps + 40GB", "active": True, "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True, "category": "bundle", "fiber_speed_mbps": 300, "mobile_gb": 40, "minutes_type": "ilimitadas", "restrictions": "Solo clientes que vienen de Digi"},
-        {"id": "pack-pepephone-3", "company": "Pepephone", "name": "Pack Streaming 600Mb + 60GB", "type": "Pack Fibra + Móvil + TV", "price": 50.0, "features": "600Mbps + 60GB + Streaming", "active": True, "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True, "category": "bundle_tv", "fiber_speed_mbps": 600, "mobile_gb": 60, "minutes_type": "ilimitadas", "tv_supported": True, "tv_package_type": "streaming"},
+        {"id": "pack-pepephone-1", "company": "Pepephone", "name": "Móvil Smart 30GB", "type": "Solo Móvil", "price": 18.0, "features": "30GB + Llamadas ilimitadas", "active": True, "created_at": datetime.now(timezone.utc), "is_demo": True, "category": "mobile_only", "mobile_gb": 30, "minutes_type": "ilimitadas"},
+        {"id": "pack-pepephone-2", "company": "Pepephone", "name": "Pack Económico 300Mb + 40GB", "type": "Pack Fibra + Móvil", "price": 38.0, "features": "300Mbps + 40GB", "active": True, "created_at": datetime.now(timezone.utc), "is_demo": True, "category": "bundle", "fiber_speed_mbps": 300, "mobile_gb": 40, "minutes_type": "ilimitadas", "restrictions": "Solo clientes que vienen de Digi"},
+        {"id": "pack-pepephone-3", "company": "Pepephone", "name": "Pack Streaming 600Mb + 60GB", "type": "Pack Fibra + Móvil + TV", "price": 50.0, "features": "600Mbps + 60GB + Streaming", "active": True, "created_at": datetime.now(timezone.utc), "is_demo": True, "category": "bundle_tv", "fiber_speed_mbps": 600, "mobile_gb": 60, "minutes_type": "ilimitadas", "tv_supported": True, "tv_package_type": "streaming"},
     ])
     
     # Simyo packs
     demo_packs.extend([
-        {"id": "pack-simyo-1", "company": "Simyo", "name": "Móvil Básico 10GB", "type": "Solo Móvil", "price": 12.0, "features": "10GB + 500 minutos", "active": True, "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True, "category": "mobile_only", "mobile_gb": 10, "minutes_type": "limitadas"},
-        {"id": "pack-simyo-2", "company": "Simyo", "name": "Pack Light 300Mb + 25GB", "type": "Pack Fibra + Móvil", "price": 35.0, "features": "300Mbps + 25GB", "active": True, "created_at": datetime.now(timezone.utc).isoformat(), "is_demo": True, "category": "bundle", "fiber_speed_mbps": 300, "mobile_gb": 25, "minutes_type": "ilimitadas"},
+        {"id": "pack-simyo-1", "company": "Simyo", "name": "Móvil Básico 10GB", "type": "Solo Móvil", "price": 12.0, "features": "10GB + 500 minutos", "active": True, "created_at": datetime.now(timezone.utc), "is_demo": True, "category": "mobile_only", "mobile_gb": 10, "minutes_type": "limitadas"},
+        {"id": "pack-simyo-2", "company": "Simyo", "name": "Pack Light 300Mb + 25GB", "type": "Pack Fibra + Móvil", "price": 35.0, "features": "300Mbps + 25GB", "active": True, "created_at": datetime.now(timezone.utc), "is_demo": True, "category": "bundle", "fiber_speed_mbps": 300, "mobile_gb": 25, "minutes_type": "ilimitadas"},
     ])
     
-    await db.packs.insert_many(demo_packs)
+    for pack in demo_packs:
+        pack.update(compile_rules(pack.get("restrictions"), pack.get("observations")))
+    created["packs"] = await seed_documents("packs", demo_packs)
+    for pack in demo_packs:
+        await pack_prices.record(pack["id"], pack["price"], pack["created_at"], is_demo=True)
+    await change_versions.bump("packs")
     
     # Create demo sales
     demo_sales = []
@@ -1874,12 +2250,12 @@ async def seed_demo_data(user: User = Depends(require_super_admin)):
             "pack_type": ["Solo Móvil", "Solo Fibra", "Pack Fibra + Móvil"][i % 3],
             "status": ["Registrado", "Subido a compañía", "Instalado"][i % 3],
             "created_by": demo_users[i % len(demo_users)]["id"],
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc),
             "is_demo": True
         })
     
-    await db.sales.insert_many(demo_sales)
+    created["sales"] = await seed_documents("sales", demo_sales)
     
     # Create demo incidents
     demo_incidents = []
@@ -1893,23 +2269,24 @@ async def seed_demo_data(user: User = Depends(require_super_admin)):
             "type": "Técnica",
             "status": ["Abierta", "En Proceso", "Cerrada"][i % 3],
             "created_by": user.id,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc),
             "is_demo": True
         })
     
-    await db.incidents.insert_many(demo_incidents)
+    created["incidents"] = await seed_documents("incidents", demo_incidents)
     
-    # Create demo objective
-    await db.objectives.insert_one({
+    # Create demo objective, unless the month already has one
+    created["objectives"] = await seed_documents("objectives", [{
         "id": "demo-objective",
         "month": datetime.now(timezone.utc).month,
         "year": datetime.now(timezone.utc).year,
         "team_target": 50,
-        "created_at": datetime.now(timezone.utc).isoformat()
-    })
+        "created_at": datetime.now(timezone.utc)
+    }], keys=("year", "month"))
+    await change_versions.bump("objectives")
     
-    return {"message": "Demo data created successfully"}
+    return {"message": "Demo data created successfully", "created": created}
 
 @api_router.delete("/demo/clean")
 async def clean_demo_data(user: User = Depends(require_super_admin)):
@@ -1917,8 +2294,13 @@ async def clean_demo_data(user: User = Depends(require_super_admin)):
     await db.clients.delete_many({"is_demo": True})
     await db.sales.delete_many({"is_demo": True})
     await db.packs.delete_many({"is_demo": True})
+    await db.pack_prices.delete_many({"is_demo": True})
     await db.incidents.delete_many({"is_demo": True})
     await db.objectives.delete_many({"id": "demo-objective"})
+    await change_versions.bump("packs")
+    await change_versions.bump("objectives")
+    principal_cache.clear()
+    token_verifier.versions.clear()
     
     return {"message": "Demo data deleted successfully"}
 
@@ -1930,16 +2312,15 @@ async def get_sales_by_period(days: int = 30, user: User = Depends(require_super
     start_date = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
     
     sales = await db.sales.find(
-        {"created_at": {"$gte": start_date.isoformat()}},
-        {"_id": 0, "created_at": 1, "company": 1, "pack_price": 1, "score": 1, "status": 1}
+        date_range("created_at", gte=start_date),
+        {"_id": 0, "created_at": 1, "company": 1, "pack_id": 1, "pack_price": 1, "score": 1, "status": 1}
     ).to_list(10000)
+    await price_sales(sales)
     
     # Group by day
     daily_data = {}
     for sale in sales:
-        created = sale.get("created_at")
-        if isinstance(created, str):
-            created = datetime.fromisoformat(created)
+        created = as_datetime(sale.get("created_at"))
         day_key = created.strftime("%Y-%m-%d")
         
         if day_key not in daily_data:
@@ -1968,9 +2349,10 @@ async def get_sales_by_company(days: int = 30, user: User = Depends(require_supe
     start_date = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
     
     sales = await db.sales.find(
-        {"created_at": {"$gte": start_date.isoformat()}},
-        {"_id": 0, "company": 1, "pack_price": 1, "score": 1}
+        date_range("created_at", gte=start_date),
+        {"_id": 0, "created_at": 1, "company": 1, "pack_id": 1, "pack_price": 1, "score": 1}
     ).to_list(10000)
+    await price_sales(sales)
     
     company_data = {}
     for sale in sales:
@@ -1996,9 +2378,10 @@ async def get_sales_by_employee(days: int = 30, user: User = Depends(require_sup
     start_date = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
     
     sales = await db.sales.find(
-        {"created_at": {"$gte": start_date.isoformat()}},
-        {"_id": 0, "created_by": 1, "pack_price": 1, "score": 1}
+        date_range("created_at", gte=start_date),
+        {"_id": 0, "created_at": 1, "created_by": 1, "pack_id": 1, "pack_price": 1, "score": 1}
     ).to_list(10000)
+    await price_sales(sales)
     
     # Get all users
     users = await db.users.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(100)
@@ -2030,15 +2413,17 @@ async def get_sales_trend(days: int = 30, user: User = Depends(require_super_adm
     
     # Current period
     current_sales = await db.sales.find(
-        {"created_at": {"$gte": start_current.isoformat()}},
-        {"_id": 0, "pack_price": 1, "score": 1}
+        date_range("created_at", gte=start_current),
+        {"_id": 0, "created_at": 1, "pack_id": 1, "pack_price": 1, "score": 1}
     ).to_list(10000)
+    await price_sales(current_sales)
     
     # Previous period
     previous_sales = await db.sales.find(
-        {"created_at": {"$gte": start_previous.isoformat(), "$lt": start_current.isoformat()}},
-        {"_id": 0, "pack_price": 1, "score": 1}
+        date_range("created_at", gte=start_previous, lt=start_current),
+        {"_id": 0, "created_at": 1, "pack_id": 1, "pack_price": 1, "score": 1}
     ).to_list(10000)
+    await price_sales(previous_sales)
     
     current_count = len(current_sales)
     current_revenue = sum(s.get("pack_price", 0) or 0 for s in current_sales)
@@ -2079,6 +2464,7 @@ async def get_sales_trend(days: int = 30, user: User = Depends(require_super_adm
 async def export_sales_csv(user: User = Depends(require_super_admin)):
     """Export all sales to CSV"""
     sales = await db.sales.find({}, {"_id": 0}).sort("created_at", -1).to_list(10000)
+    await price_sales(sales)
     
     # Get client and user names
     clients = await db.clients.find({}, {"_id": 0, "id": 1, "name": 1, "phone": 1}).to_list(10000)
@@ -2099,9 +2485,7 @@ async def export_sales_csv(user: User = Depends(require_super_admin)):
     # Data
     for sale in sales:
         client = client_map.get(sale.get("client_id"), {})
-        created_at = sale.get("created_at")
-        if isinstance(created_at, str):
-            created_at = datetime.fromisoformat(created_at)
+        created_at = as_datetime(sale.get("created_at"))
         
         writer.writerow([
             sale.get("id", ""),
@@ -2130,6 +2514,7 @@ async def export_sales_csv(user: User = Depends(require_super_admin)):
 async def export_sales_pdf(user: User = Depends(require_super_admin)):
     """Export sales summary to PDF"""
     sales = await db.sales.find({}, {"_id": 0}).sort("created_at", -1).to_list(10000)
+    await price_sales(sales)
     
     # Get client and user names
     clients = await db.clients.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(10000)
@@ -2199,9 +2584,7 @@ async def export_sales_pdf(user: User = Depends(require_super_admin)):
     elements.append(Paragraph("Últimas 20 Ventas", styles['Heading2']))
     sales_data = [["Fecha", "Cliente", "Compañía", "Precio", "Score", "Estado"]]
     for sale in sales[:20]:
-        created_at = sale.get("created_at")
-        if isinstance(created_at, str):
-            created_at = datetime.fromisoformat(created_at)
+        created_at = as_datetime(sale.get("created_at"))
         
         sales_data.append([
             created_at.strftime("%d/%m/%y") if created_at else "",
@@ -2244,9 +2627,7 @@ async def export_clients_csv(user: User = Depends(require_super_admin)):
     
     # Data
     for client in clients:
-        created_at = client.get("created_at")
-        if isinstance(created_at, str):
-            created_at = datetime.fromisoformat(created_at)
+        created_at = as_datetime(client.get("created_at"))
         
         writer.writerow([
             client.get("id", ""),
@@ -2285,9 +2666,7 @@ async def export_incidents_csv(user: User = Depends(require_super_admin)):
     
     # Data
     for incident in incidents:
-        created_at = incident.get("created_at")
-        if isinstance(created_at, str):
-            created_at = datetime.fromisoformat(created_at)
+        created_at = as_datetime(incident.get("created_at"))
         
         writer.writerow([
             incident.get("id", ""),
@@ -2414,11 +2793,16 @@ def calculate_sale_commission(sale: dict, category: dict) -> float:
 
 @api_router.get("/commissions/config")
 async def get_commission_configs(
+    request: Request,
+    response: Response,
     year: Optional[int] = None,
     month: Optional[int] = None,
     user: User = Depends(require_super_admin)
 ):
     """Get commission configurations (SuperAdmin only)"""
+    cached = await not_modified(request, response, ["commission_configs"])
+    if cached:
+        return cached
     query = {}
     if year:
         query["year"] = year
@@ -2430,11 +2814,16 @@ async def get_commission_configs(
 
 @api_router.get("/commissions/config/{year}/{month}")
 async def get_commission_config(
+    request: Request,
+    response: Response,
     year: int,
     month: int,
     user: User = Depends(require_super_admin)
 ):
     """Get specific month's commission configuration"""
+    cached = await not_modified(request, response, ["commission_configs"], year, month)
+    if cached:
+        return cached
     config = await db.commission_configs.find_one(
         {"year": year, "month": month},
         {"_id": 0}
@@ -2483,12 +2872,13 @@ async def create_commission_config(
             "retroactive_from": config_data.retroactive_from,
             "categories": categories,
             "is_active": True,
-            "updated_at": datetime.now(timezone.utc).isoformat()
+            "updated_at": datetime.now(timezone.utc)
         }
         await db.commission_configs.update_one(
             {"year": config_data.year, "month": config_data.month},
             {"$set": update_data}
         )
+        await change_versions.bump("commission_configs")
         existing.update(update_data)
         return existing
     else:
@@ -2504,9 +2894,8 @@ async def create_commission_config(
             created_by=user.id
         )
         doc = config.model_dump()
-        doc["created_at"] = doc["created_at"].isoformat()
-        doc["updated_at"] = doc["updated_at"].isoformat()
         await db.commission_configs.insert_one(doc)
+        await change_versions.bump("commission_configs")
         # Remove MongoDB _id before returning
         doc.pop("_id", None)
         return doc
@@ -2527,7 +2916,7 @@ async def update_commission_config(
     if not existing:
         raise HTTPException(status_code=404, detail="Configuration not found")
     
-    updates = {"updated_at": datetime.now(timezone.utc).isoformat()}
+    updates = {"updated_at": datetime.now(timezone.utc)}
     
     if update_data.threshold is not None:
         updates["threshold"] = update_data.threshold
@@ -2549,6 +2938,7 @@ async def update_commission_config(
         {"year": year, "month": month},
         {"$set": updates}
     )
+    await change_versions.bump("commission_configs")
     
     existing.update(updates)
     return existing
@@ -2589,12 +2979,13 @@ async def duplicate_commission_config(
         "retroactive_from": source["retroactive_from"],
         "categories": source["categories"],
         "is_active": True,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "updated_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": datetime.now(timezone.utc),
+        "updated_at": datetime.now(timezone.utc),
         "created_by": user.id
     }
     
     await db.commission_configs.insert_one(new_config)
+    await change_versions.bump("commission_configs")
     # Remove MongoDB _id before returning
     new_config.pop("_id", None)
     return new_config
@@ -2633,30 +3024,10 @@ async def get_commission_summary(
     
     # Query sales within the month
     sales = await db.sales.find(
-        {
-            "created_at": {
-                "$gte": start_date.isoformat(),
-                "$lt": end_date.isoformat()
-            }
-        },
+        date_range("created_at", gte=start_date, lt=end_date),
         {"_id": 0}
     ).to_list(10000)
-    
-    # Also try date format without timezone
-    if not sales:
-        sales = await db.sales.find({}, {"_id": 0}).to_list(10000)
-        # Filter manually
-        filtered_sales = []
-        for sale in sales:
-            created_at = sale.get("created_at")
-            if isinstance(created_at, str):
-                try:
-                    sale_date = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                    if start_date <= sale_date < end_date:
-                        filtered_sales.append(sale)
-                except:
-                    pass
-        sales = filtered_sales
+    await price_sales(sales)
     
     # Get all employees
     employees = await db.users.find({"role": "Empleado"}, {"_id": 0}).to_list(100)
@@ -2690,7 +3061,7 @@ async def get_commission_summary(
         emp_info = employee_map.get(emp_id, {"name": "Desconocido", "id": emp_id})
         
         # Sort sales by date
-        emp_sales.sort(key=lambda x: x.get("created_at", ""))
+        emp_sales.sort(key=date_sort_key("created_at"))
         
         total_emp_sales = len(emp_sales)
         valid_sales = [s for s in emp_sales if s.get("status") in COMMISSIONABLE_STATUSES]
@@ -2779,22 +3150,14 @@ async def get_employee_commission_details(
     else:
         end_date = datetime(year, month + 1, 1, tzinfo=timezone.utc)
     
-    # Get all sales and filter
-    all_sales = await db.sales.find({"created_by": employee_id}, {"_id": 0}).to_list(10000)
-    
-    emp_sales = []
-    for sale in all_sales:
-        created_at = sale.get("created_at")
-        if isinstance(created_at, str):
-            try:
-                sale_date = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                if start_date <= sale_date < end_date:
-                    emp_sales.append(sale)
-            except:
-                pass
+    emp_sales = await db.sales.find(
+        {"created_by": employee_id, **date_range("created_at", gte=start_date, lt=end_date)},
+        {"_id": 0}
+    ).to_list(10000)
+    await price_sales(emp_sales)
     
     # Sort by date
-    emp_sales.sort(key=lambda x: x.get("created_at", ""))
+    emp_sales.sort(key=date_sort_key("created_at"))
     
     threshold = config.get("threshold", 10)
     retroactive = config.get("retroactive", True)
@@ -2870,16 +3233,57 @@ async def get_employee_commission_details(
         "sales": sale_details
     }
 
+# ==================== DIAGNOSTICS ENDPOINTS ====================
+
+@api_router.get("/admin/diagnostics")
+async def get_diagnostics(user: User = Depends(require_super_admin)):
+    """Runtime metrics of the in-process services (SuperAdmin only)"""
+    hasher_stats = password_hasher.stats()
+    login_stats = login_limiter.stats()
+    # Every refused login is a bcrypt verification that never ran
+    login_stats["bcrypt_verifications_avoided"] = login_stats["rejected"]
+    login_stats["estimated_cpu_ms_saved"] = round(login_stats["rejected"] * hasher_stats["avg_run_ms"], 1)
+    return {
+        "password_hasher": hasher_stats,
+        "login_limiter": login_stats,
+        "password_reset_limiter": password_reset_limiter.stats(),
+        "principal_cache": principal_cache.stats(),
+        "token_versions": token_verifier.versions.stats(),
+        "mongo_pool": mongo.stats(),
+        "date_migration": date_migration.stats(),
+        "client_search": client_search.stats(),
+        "client_phone_keys": client_phone_keys.stats(),
+        "pack_rules": pack_rules.stats(),
+        "pack_prices": pack_prices.stats(),
+        "change_versions": change_versions.stats(),
+        "pack_catalog": pack_catalog.stats()
+    }
+
+@api_router.get("/admin/indexes")
+async def get_index_report(user: User = Depends(require_super_admin)):
+    """Registered indexes with their build status, and the index serving each query shape"""
+    return index_registry.report()
+
 # ==================== INCLUDE ROUTER ====================
 
 app.include_router(api_router)
 
+app.add_middleware(MsgpackMiddleware)
+# PDFs are already compressed; exports stream through the compressor chunk by chunk
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+    gzip_level=int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6)),
+    brotli_quality=int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4)),
+    exclude_paths=["/api/export/sales/pdf"],
+)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Query-Warning", "ETag"],
 )
 
 logging.basicConfig(
@@ -2887,7 +3291,3 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
@@ -5,3 +5,21 @@ Services package - Business logic
 # - commission_calculator.py - Commission calculation logic
 # - notification_service.py - Notification handling
 # - export_service.py - PDF/CSV generation
+# - password_hasher.py - bcrypt hashing on a bounded worker pool
+# - ttl_cache.py - In-process TTL + LRU cache
+# - tokens.py - JWT issuing and verification with token versioning
+# - rate_limiter.py - Sliding-window limiter with in-memory/Mongo backends
+# - dates.py - BSON date helpers and the ISO-string date migration
+# - indexes.py - Declarative index registry and query-shape coverage
+# - client_search.py - Edge n-gram client search
+# - phones.py - E.164 phone keys for client dedupe
+# - pagination.py - Keyset (cursor) pagination for list endpoints
+# - list_query.py - Allow-listed filters and sorts for list endpoints
+# - fieldsets.py - Sparse fieldsets (?fields=) and their presets
+# - serialization.py - Trusted (non-validating) list serialization
+# - change_versions.py - Per-collection change counters for ETags
+# - pack_catalog.py - In-memory pack catalog invalidated by change version
+# - pack_index.py - Calculator pack index bucketed by type and TV support
+# - pack_rules.py - Origin-company rules compiled from pack restrictions/observations
+# - pack_prices.py - Append-only pack price history and as-of lookups
+# - pack_import.py - CSV/XLSX price sheet import with bulk upserts
@@ -0,0 +1,80 @@
+"""
+Change versions - per-collection counters bumped on every write, used to build ETags
+"""
+import hashlib
+import logging
+from typing import Iterable, Optional
+
+from pymongo import ReturnDocument
+
+from .ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Content codings the compression middleware appends to ETags ("abc" -> "abc-br")
+ENCODING_SUFFIXES = ("-br", "-gzip")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 asks for GET)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    wanted = etag.strip('"')
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        for suffix in ENCODING_SUFFIXES:
+            if candidate.endswith(suffix):
+                candidate = candidate[:-len(suffix)]
+                break
+        if candidate == wanted:
+            return True
+    return False
+
+
+class ChangeVersions:
+    """
+    A counter per collection in `change_versions`, incremented after each write.
+
+    Reads are served from a short TTL cache, so a conditional GET usually costs
+    no database round trip; a write in this process updates the cache at once,
+    one in another worker is seen within `ttl` seconds.
+    """
+
+    def __init__(self, db, ttl: float = 5.0):
+        self.db = db
+        self.cache = TTLCache(maxsize=256, ttl=ttl)
+        self.bumps = 0
+
+    async def get(self, collection: str) -> int:
+        version = self.cache.get(collection)
+        if version is None:
+            doc = await self.db.change_versions.find_one({"collection": collection}, {"_id": 0, "version": 1})
+            version = doc["version"] if doc else 0
+            self.cache.set(collection, version)
+        return version
+
+    async def bump(self, collection: str) -> int:
+        doc = await self.db.change_versions.find_one_and_update(
+            {"collection": collection},
+            {"$inc": {"version": 1}},
+            projection={"_id": 0, "version": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self.cache.set(collection, doc["version"])
+        self.bumps += 1
+        return doc["version"]
+
+    async def etag(self, collections: Iterable[str], *parts) -> str:
+        """Strong ETag for a response built from `collections` and the given request `parts`"""
+        versions = [f"{collection}:{await self.get(collection)}" for collection in collections]
+        digest = hashlib.blake2b("|".join([*versions, *map(str, parts)]).encode(), digest_size=12)
+        return f'"{digest.hexdigest()}"'
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "bumps": self.bumps}
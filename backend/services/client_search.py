@@ -0,0 +1,239 @@
+"""
+Client search - normalized tokens and edge n-grams served from a multikey index
+"""
+import logging
+import re
+import time
+import unicodedata
+from typing import Iterable, List, Optional, Set
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELDS = ("name", "phone", "email", "dni")
+
+# Search bookkeeping stored on each client, never returned by the API
+INTERNAL_FIELDS = {
+    "search_grams": 0, "search_tokens": 0, "search_exact": 0, "search_lead": 0, "search_name": 0,
+    "search_version": 0,
+}
+
+_SEPARATORS = re.compile(r"[^0-9a-z]+")
+_PHONE_QUERY = re.compile(r"^[\d\s+().-]+$")
+
+
+def normalize(text: Optional[str]) -> str:
+    """Lowercase, accent-free text ("José Ñúñez" -> "jose nunez")"""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [token for token in _SEPARATORS.split(normalize(text)) if token]
+
+
+def phone_tokens(phone: Optional[str]) -> List[str]:
+    """The number as typed (digits only) plus the national number without the 34 prefix"""
+    digits = re.sub(r"\D", "", phone or "")
+    if not digits:
+        return []
+    tokens = [digits]
+    if digits.startswith("0034"):
+        tokens.append(digits[4:])
+    elif digits.startswith("34") and len(digits) == 11:
+        tokens.append(digits[2:])
+    return tokens
+
+
+def exact_tokens(doc: dict) -> Set[str]:
+    """Tokens that are a whole field value: phone, DNI, the email without separators"""
+    tokens = set(phone_tokens(doc.get("phone"))) | set(tokenize(doc.get("dni")))
+    email = normalize(doc.get("email"))
+    if email:
+        tokens.add(_SEPARATORS.sub("", email))
+    return tokens
+
+
+def document_tokens(doc: dict) -> Set[str]:
+    tokens = set(tokenize(doc.get("name")))
+    tokens.update(phone_tokens(doc.get("phone")))
+    email = normalize(doc.get("email"))
+    if email:
+        tokens.add(_SEPARATORS.sub("", email))
+        tokens.update(tokenize(email))
+    tokens.update(tokenize(doc.get("dni")))
+    return tokens
+
+
+class ClientSearch:
+    """
+    Ranked prefix search over client name, phone, email and DNI.
+
+    Every client stores `search_grams`: the edge n-grams (prefixes) of its
+    normalized tokens. A search term must be a prefix of some token, so a
+    query is an `$all` over the terms against the multikey index on
+    `search_grams`. Matches are ranked in the aggregation, from the tokens,
+    exact values and leading name prefixes stored next to the grams, so the
+    `candidate_limit` best of them are returned rather than the first ones
+    the index yields.
+
+    Every match is scored and sorted before the limit, so the work is
+    bounded twice: terms shorter than `min_term_length` are dropped (a
+    single letter matches half the clients), and at most `scan_limit`
+    matches are scored. A query broader than that ranks the first
+    `scan_limit` matches the index yields; typing more narrows it back to
+    an exact ranking (benchmarks/client_search.py).
+    """
+
+    def __init__(self, db, version: int = 2, max_gram: int = 20, candidate_limit: int = 200,
+                 min_term_length: int = 2, scan_limit: Optional[int] = 2000, batch_size: int = 500):
+        self.db = db
+        self.version = version
+        self.max_gram = max_gram
+        self.candidate_limit = candidate_limit
+        self.min_term_length = min_term_length
+        self.scan_limit = scan_limit
+        self.batch_size = batch_size
+        self.searches = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.backfilled = 0
+        self.backfill_status = "pending"
+
+    def grams(self, doc: dict) -> List[str]:
+        grams = set()
+        for token in document_tokens(doc):
+            grams.update(self._prefixes(token))
+        return sorted(grams)
+
+    def _prefixes(self, token: str) -> List[str]:
+        return [token[:size] for size in range(1, min(len(token), self.max_gram) + 1)]
+
+    def terms(self, search: str) -> List[str]:
+        """
+        Query terms, longest first (the first $all term picks the index
+        bounds), without those shorter than `min_term_length`
+        """
+        if _PHONE_QUERY.match(search) and re.search(r"\d", search):
+            terms = phone_tokens(search)[-1:]
+        else:
+            terms = tokenize(search)
+        terms = {term[:self.max_gram] for term in terms if len(term) >= self.min_term_length}
+        return sorted(terms, key=len, reverse=True)
+
+    def query(self, search: str) -> Optional[dict]:
+        terms = self.terms(search)
+        if not terms:
+            return None
+        return {"search_grams": {"$all": terms}}
+
+    def score(self, terms: Iterable[str]) -> dict:
+        """
+        Aggregation expression ranking a matched client: per term 5 for a
+        whole phone, DNI or email, 3 for a whole word, 1 for a prefix, plus
+        1 when it starts the name (matches there rank above later words).
+        """
+        def has(field: str, term: str) -> dict:
+            return {"$in": [term, {"$ifNull": [f"${field}", []]}]}
+
+        return {"$add": [
+            points
+            for term in terms
+            for points in (
+                {"$cond": [has("search_exact", term), 5, {"$cond": [has("search_tokens", term), 3, 1]}]},
+                {"$cond": [has("search_lead", term), 1, 0]},
+            )
+        ]}
+
+    async def search(self, search: str, limit: Optional[int] = None, filter: Optional[dict] = None) -> List[dict]:
+        started = time.perf_counter()
+        query = self.query(search)
+        if query is None:
+            return []
+        if filter:
+            query = {"$and": [query, filter]}
+        count = min(limit, self.candidate_limit) if limit else self.candidate_limit
+        scan = [{"$limit": self.scan_limit}] if self.scan_limit else []
+        candidates = await self.db.clients.aggregate([
+            {"$match": query},
+            *scan,
+            {"$addFields": {"search_score": self.score(self.terms(search))}},
+            # Ties by name, then id, so pages of equal scores are stable
+            {"$sort": {"search_score": -1, "search_name": 1, "id": 1}},
+            {"$limit": count},
+            {"$project": {"_id": 0, "search_score": 0, **INTERNAL_FIELDS}},
+        ]).to_list(count)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.searches += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        return candidates
+
+    async def backfill(self):
+        """Compute grams for clients written before (or by an older version of) this scheme"""
+        state_id = f"client_search_v{self.version}"
+        try:
+            state = await self.db.migrations.find_one({"id": state_id}, {"_id": 0})
+            if state and state.get("status") == "complete":
+                self.backfill_status = "complete"
+                return
+            self.backfill_status = "running"
+            last_id = None
+            fields = {"_id": 1, **{field: 1 for field in SEARCH_FIELDS}}
+            while True:
+                query = {"search_version": {"$ne": self.version}}
+                if last_id is not None:
+                    query["_id"] = {"$gt": last_id}
+                docs = await self.db.clients.find(query, fields).sort("_id", 1).to_list(self.batch_size)
+                if not docs:
+                    break
+                last_id = docs[-1]["_id"]
+                # Only applies if the searchable fields did not change meanwhile
+                operations = [
+                    UpdateOne(
+                        {"_id": doc["_id"], **{field: doc.get(field) for field in SEARCH_FIELDS}},
+                        {"$set": self.fields_for(doc)}
+                    )
+                    for doc in docs
+                ]
+                result = await self.db.clients.bulk_write(operations, ordered=False)
+                self.backfilled += result.modified_count
+            await self.db.migrations.update_one(
+                {"id": state_id},
+                {"$set": {"status": "complete", "converted": self.backfilled}},
+                upsert=True
+            )
+            self.backfill_status = "complete"
+        except Exception:
+            # Retried on the next startup
+            logger.exception("Client search backfill failed")
+            self.backfill_status = "failed"
+
+    def fields_for(self, doc: dict) -> dict:
+        """Fields to $set on a client whose searchable fields are those of `doc`"""
+        name_tokens = tokenize(doc.get("name"))
+        return {
+            "search_grams": self.grams(doc),
+            "search_tokens": sorted(document_tokens(doc)),
+            "search_exact": sorted(exact_tokens(doc)),
+            "search_lead": self._prefixes(name_tokens[0]) if name_tokens else [],
+            "search_name": normalize(doc.get("name")),
+            "search_version": self.version,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "searches": self.searches,
+            "avg_ms": round(self.total_ms / self.searches, 2) if self.searches else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "candidate_limit": self.candidate_limit,
+            "min_term_length": self.min_term_length,
+            "scan_limit": self.scan_limit,
+            "backfill_status": self.backfill_status,
+            "backfilled": self.backfilled,
+        }
@@ -0,0 +1,163 @@
+"""
+Native BSON dates - conversion helpers and the online migration of legacy ISO strings
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Every date field the backend writes, by collection
+DATE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "users": ("created_at",),
+    "clients": ("created_at", "updated_at"),
+    "sales": ("created_at", "updated_at"),
+    "packs": ("created_at", "validity_start", "validity_end"),
+    "incidents": ("created_at", "updated_at"),
+    "incident_comments": ("created_at",),
+    "notifications": ("created_at",),
+    "objectives": ("created_at",),
+    "fichajes": ("timestamp",),
+    "contacts": ("created_at",),
+    "commission_configs": ("created_at", "updated_at"),
+    "password_resets": ("expires_at",),
+}
+
+
+def as_datetime(value: Any) -> Optional[datetime]:
+    """
+    Timezone-aware datetime for a stored date, whatever its format: a BSON
+    date (naive values are UTC) or a legacy ISO-8601 string.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def date_sort_key(field: str):
+    """Sort key for documents whose `field` may be missing or still a string"""
+    return lambda doc: as_datetime(doc.get(field)) or EPOCH
+
+
+class DateMigration:
+    """
+    Rewrites legacy ISO-string dates as BSON dates, in the background.
+
+    Documents are converted in batches of `batch_size` with unordered bulk
+    writes; each update only applies if the field still holds the string
+    that was read, so it is safe to run from several workers at once and to
+    restart. Progress is recorded in the `migrations` collection.
+
+    Until the migration has completed, `range()` builds queries that match
+    both formats (the dual-read period); afterwards it queries dates only.
+    """
+
+    def __init__(self, db, fields: Dict[str, Tuple[str, ...]] = DATE_FIELDS, batch_size: int = 500,
+                 pause: float = 0.05, name: str = "bson_dates", enabled: bool = True):
+        self.db = db
+        self.enabled = enabled
+        self.fields = fields
+        self.batch_size = batch_size
+        self.pause = pause
+        self.name = name
+        self.dual_read = True
+        self.status = "pending"
+        self.converted = 0
+        self.failed = 0
+
+    async def load_state(self):
+        """Leave the dual-read period if the migration already completed"""
+        state = await self.db.migrations.find_one({"id": self.name}, {"_id": 0})
+        if state and state.get("status") == "complete":
+            self.status = "complete"
+            self.dual_read = False
+
+    def range(self, field: str, gte: Optional[datetime] = None, lt: Optional[datetime] = None) -> dict:
+        """Query fragment for gte <= field < lt"""
+        bounds = {}
+        if gte is not None:
+            bounds["$gte"] = gte
+        if lt is not None:
+            bounds["$lt"] = lt
+        if not self.dual_read:
+            return {field: bounds}
+        legacy = {op: value.isoformat() for op, value in bounds.items()}
+        return {"$or": [{field: bounds}, {field: legacy}]}
+
+    async def run(self):
+        """Convert every legacy date (only checks the recorded state when disabled)"""
+        try:
+            await self.load_state()
+            if self.status == "complete" or not self.enabled:
+                return
+            self.status = "running"
+            await self._save_state(started_at=datetime.now(timezone.utc))
+            for collection, fields in self.fields.items():
+                for field in fields:
+                    await self._convert(collection, field)
+        except asyncio.CancelledError:
+            self.status = "interrupted"
+            raise
+        except Exception:
+            # Retried on the next startup
+            logger.exception("Date migration failed")
+            self.status = "failed"
+            return
+
+        # Unparseable values are left as they are, and so is the dual read
+        self.status = "complete" if not self.failed else "complete_with_errors"
+        self.dual_read = bool(self.failed)
+        await self._save_state(completed_at=datetime.now(timezone.utc))
+        logger.info("Date migration %s: %d converted, %d failed", self.status, self.converted, self.failed)
+
+    async def _convert(self, collection: str, field: str):
+        last_id = None
+        while True:
+            query = {field: {"$type": "string"}}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            docs = await self.db[collection].find(query, {"_id": 1, field: 1}).sort("_id", 1).to_list(self.batch_size)
+            if not docs:
+                return
+            last_id = docs[-1]["_id"]
+
+            operations = []
+            for doc in docs:
+                try:
+                    value = as_datetime(doc[field])
+                except ValueError:
+                    self.failed += 1
+                    continue
+                operations.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: value}}))
+            if operations:
+                result = await self.db[collection].bulk_write(operations, ordered=False)
+                self.converted += result.modified_count
+                await self._save_state()
+            # Leave room for request traffic between batches
+            await asyncio.sleep(self.pause)
+
+    async def _save_state(self, **extra):
+        await self.db.migrations.update_one(
+            {"id": self.name},
+            {"$set": {"status": self.status, "converted": self.converted, "failed": self.failed, **extra}},
+            upsert=True
+        )
+
+    def stats(self) -> dict:
+        return {
+            "status": self.status,
+            "enabled": self.enabled,
+            "dual_read": self.dual_read,
+            "converted": self.converted,
+            "failed": self.failed,
+            "batch_size": self.batch_size,
+        }
@@ -0,0 +1,58 @@
+"""
+Sparse fieldsets - ?fields= selection of response fields, as a Mongo projection
+"""
+from typing import Dict, Iterable, List, Optional, Sequence
+
+
+class InvalidFieldset(ValueError):
+    pass
+
+
+class Fieldset:
+    """
+    The fields a resource can return and its named presets.
+
+    `?fields=` takes a comma-separated list of field and preset names; "full"
+    (or no parameter) means the whole document. `always` fields (the id) are
+    returned whatever is asked for.
+    """
+
+    def __init__(self, fields: Iterable[str], presets: Dict[str, Sequence[str]], always: Sequence[str] = ("id",)):
+        self.fields = set(fields)
+        self.presets = {name: list(names) for name, names in presets.items()}
+        self.always = list(always)
+        for name, names in self.presets.items():
+            unknown = set(names) - self.fields
+            if unknown:
+                raise ValueError(f"Preset {name} has unknown fields: {sorted(unknown)}")
+
+    def parse(self, fields: Optional[str]) -> Optional[List[str]]:
+        """Selected field names, or None for the full document"""
+        if not fields or fields.strip() == "full":
+            return None
+        selected = list(self.always)
+        for name in (n.strip() for n in fields.split(",")):
+            if not name:
+                continue
+            if name == "full":
+                return None
+            if name in self.presets:
+                selected.extend(self.presets[name])
+            elif name in self.fields:
+                selected.append(name)
+            else:
+                raise InvalidFieldset(f"Unknown field: {name}")
+        return list(dict.fromkeys(selected))
+
+    @staticmethod
+    def projection(selected: Optional[List[str]], exclude: Optional[dict] = None) -> dict:
+        """Mongo projection for `selected`; `exclude` applies to full documents only"""
+        if selected is None:
+            return {"_id": 0, **(exclude or {})}
+        return {"_id": 0, **{field: 1 for field in selected}}
+
+    @staticmethod
+    def trim(docs: List[dict], selected: Optional[List[str]]) -> List[dict]:
+        if selected is None:
+            return docs
+        return [{field: doc[field] for field in selected if field in doc} for doc in docs]
@@ -0,0 +1,260 @@
+"""
+Index registry - every index the backend relies on, and the queries each one serves
+"""
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pymongo.errors import ConnectionFailure, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+ASC = 1
+DESC = -1
+
+
+class IndexSpec:
+    """One index; `keys` is a list of (field, direction) like pymongo's create_index"""
+
+    def __init__(self, collection: str, keys: Sequence[Tuple[str, int]], unique: bool = False,
+                 ttl_seconds: Optional[int] = None, partial: Optional[dict] = None, name: Optional[str] = None):
+        self.collection = collection
+        self.keys = list(keys)
+        self.unique = unique
+        self.ttl_seconds = ttl_seconds
+        self.partial = partial
+        self.name = name or "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+    @property
+    def fields(self) -> List[str]:
+        return [field for field, _ in self.keys]
+
+    def options(self) -> dict:
+        options = {"name": self.name}
+        if self.unique:
+            options["unique"] = True
+        if self.ttl_seconds is not None:
+            options["expireAfterSeconds"] = self.ttl_seconds
+        if self.partial is not None:
+            options["partialFilterExpression"] = self.partial
+        return options
+
+    def describe(self) -> dict:
+        return {
+            "collection": self.collection,
+            "name": self.name,
+            "keys": [[field, direction] for field, direction in self.keys],
+            "unique": self.unique,
+            "ttl_seconds": self.ttl_seconds,
+            "partial": self.partial,
+        }
+
+
+class QueryShape:
+    """
+    A query the code issues: fields matched by equality, the sort, and the
+    field filtered by range. An index serves the shape when its keys are the
+    equality fields (in any order), then the sort fields, then the range
+    field (the equality-sort-range rule).
+    """
+
+    def __init__(self, name: str, collection: str, equality: Sequence[str] = (),
+                 sort: Sequence[str] = (), range: Optional[str] = None):
+        self.name = name
+        self.collection = collection
+        self.equality = tuple(equality)
+        self.sort = tuple(sort)
+        self.range = range
+
+    def served_by(self, index: IndexSpec) -> bool:
+        # A partial index only holds documents matching its filter; it serves
+        # shapes that match its filter fields by equality
+        if index.partial is not None and not set(index.partial) <= set(self.equality):
+            return False
+        fields = index.fields
+        # A unique key matched by equality finds at most one document per value
+        if index.unique and index.partial is None and len(fields) == 1 and fields[0] in self.equality:
+            return True
+        count = len(self.equality)
+        if set(fields[:count]) != set(self.equality):
+            return False
+        tail = list(self.sort)
+        if self.range and self.range not in tail:
+            tail.append(self.range)
+        if not count and not tail:
+            return False
+        return fields[count:count + len(tail)] == tail
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "collection": self.collection,
+            "equality": list(self.equality),
+            "sort": list(self.sort),
+            "range": self.range,
+        }
+
+
+INDEXES: List[IndexSpec] = [
+    IndexSpec("users", [("id", ASC)], unique=True),
+    IndexSpec("users", [("email", ASC)], unique=True),
+    IndexSpec("users", [("role", ASC)]),
+    IndexSpec("clients", [("id", ASC)], unique=True),
+    # Clients without a usable phone have no phone_key and are not deduplicated
+    IndexSpec("clients", [("phone_key", ASC)], unique=True, partial={"phone_key": {"$type": "string"}}),
+    IndexSpec("clients", [("created_at", DESC), ("id", DESC)]),
+    IndexSpec("clients", [("created_by", ASC), ("created_at", DESC), ("id", DESC)]),
+    IndexSpec("clients", [("search_grams", ASC)]),
+    IndexSpec("sales", [("id", ASC)], unique=True),
+    IndexSpec("sales", [("created_at", DESC), ("id", DESC)]),
+    IndexSpec("sales", [("created_by", ASC), ("created_at", DESC), ("id", DESC)]),
+    IndexSpec("sales", [("client_id", ASC), ("created_at", DESC)]),
+    IndexSpec("sales", [("status", ASC), ("created_at", DESC), ("id", DESC)]),
+    IndexSpec("sales", [("created_by", ASC), ("status", ASC), ("created_at", DESC), ("id", DESC)]),
+    IndexSpec("sales", [("company", ASC), ("created_at", DESC), ("id", DESC)]),
+    IndexSpec("sales", [("score", DESC), ("id", DESC)]),
+    IndexSpec("packs", [("id", ASC)], unique=True),
+    IndexSpec("packs", [("active", ASC), ("type", ASC)]),
+    IndexSpec("packs", [("created_at", DESC), ("id", DESC)]),
+    IndexSpec("packs", [("active", ASC), ("created_at", DESC), ("id", DESC)]),
+    IndexSpec("packs", [("company", ASC), ("name", ASC)]),
+    IndexSpec("pack_prices", [("pack_id", ASC), ("valid_from", ASC)], unique=True),
+    IndexSpec("incidents", [("id", ASC)], unique=True),
+    IndexSpec("incidents", [("created_at", DESC), ("id", DESC)]),
+    IndexSpec("incidents", [("status", ASC), ("created_at", DESC), ("id", DESC)]),
+    IndexSpec("incidents", [("status", ASC), ("priority", ASC), ("created_at", DESC), ("id", DESC)]),
+    IndexSpec("incidents", [("created_by", ASC), ("created_at", DESC), ("id", DESC)]),
+    IndexSpec("incidents", [("assigned_to", ASC), ("created_at", DESC), ("id", DESC)]),
+    IndexSpec("incidents", [("client_id", ASC), ("created_at", DESC), ("id", DESC)]),
+    IndexSpec("incidents", [("created_by", ASC), ("client_id", ASC), ("created_at", DESC), ("id", DESC)]),
+    IndexSpec("incidents", [("assigned_to", ASC), ("client_id", ASC), ("created_at", DESC), ("id", DESC)]),
+    IndexSpec("incident_comments", [("incident_id", ASC), ("created_at", ASC)]),
+    IndexSpec("fichajes", [("user_id", ASC), ("timestamp", DESC), ("id", DESC)]),
+    IndexSpec("fichajes", [("timestamp", DESC), ("id", DESC)]),
+    IndexSpec("notifications", [("read", ASC)]),
+    IndexSpec("notifications", [("related_id", ASC)]),
+    IndexSpec("notifications", [("created_at", DESC)]),
+    IndexSpec("contacts", [("id", ASC)], unique=True),
+    IndexSpec("contacts", [("name", ASC), ("id", ASC)]),
+    IndexSpec("objectives", [("year", ASC), ("month", ASC)], unique=True),
+    IndexSpec("commission_configs", [("year", ASC), ("month", ASC)], unique=True),
+    IndexSpec("password_resets", [("token", ASC)], unique=True),
+    IndexSpec("password_resets", [("email", ASC)]),
+    # Expired reset tokens are kept one day so they still report "expired"
+    IndexSpec("password_resets", [("expires_at", ASC)], ttl_seconds=86400),
+    IndexSpec("rate_limit_hits", [("key", ASC), ("at", ASC)]),
+    IndexSpec("rate_limit_hits", [("expires_at", ASC)], ttl_seconds=0),
+    IndexSpec("migrations", [("id", ASC)], unique=True),
+    IndexSpec("change_versions", [("collection", ASC)], unique=True),
+]
+
+QUERY_SHAPES: List[QueryShape] = [
+    QueryShape("user by id (auth, profile)", "users", equality=["id"]),
+    QueryShape("user by email (login, register, password reset)", "users", equality=["email"]),
+    QueryShape("employees (ranking, fichajes, commissions)", "users", equality=["role"]),
+    QueryShape("client by id", "clients", equality=["id"]),
+    QueryShape("client by phone key (create, quick sale)", "clients", equality=["phone_key"]),
+    QueryShape("GET /clients", "clients", sort=["created_at", "id"]),
+    QueryShape("GET /clients?search= (n-gram $all)", "clients", equality=["search_grams"]),
+    QueryShape("GET /clients?created_by=", "clients", equality=["created_by"], sort=["created_at", "id"]),
+    QueryShape("GET /clients?id= (clients of the listed sales or incidents)", "clients", equality=["id"],
+               sort=["created_at", "id"]),
+    QueryShape("sale by id", "sales", equality=["id"]),
+    QueryShape("GET /sales (SuperAdmin)", "sales", sort=["created_at", "id"]),
+    QueryShape("GET /sales (Empleado)", "sales", equality=["created_by"], sort=["created_at", "id"]),
+    QueryShape("GET /clients/{id}/sales", "sales", equality=["client_id"], sort=["created_at"]),
+    QueryShape("dashboard, analytics and commission date ranges", "sales", range="created_at"),
+    QueryShape("ranking and commissions per employee", "sales", equality=["created_by"], range="created_at"),
+    QueryShape("GET /sales?status=", "sales", equality=["status"], sort=["created_at", "id"]),
+    QueryShape("GET /sales?status= (Empleado)", "sales", equality=["created_by", "status"], sort=["created_at", "id"]),
+    QueryShape("GET /sales?company=", "sales", equality=["company"], sort=["created_at", "id"]),
+    QueryShape("GET /sales?sort=-score", "sales", sort=["score", "id"]),
+    QueryShape("pack by id", "packs", equality=["id"]),
+    QueryShape("GET /packs", "packs", sort=["created_at", "id"]),
+    QueryShape("GET /packs?active_only=true", "packs", equality=["active"], sort=["created_at", "id"]),
+    QueryShape("active packs by type (calculator)", "packs", equality=["active", "type"]),
+    QueryShape("packs by company and name (price sheet import)", "packs", equality=["company", "name"]),
+    QueryShape("price history of a pack", "pack_prices", equality=["pack_id"], sort=["valid_from"]),
+    QueryShape("pack prices as of sale dates ($in)", "pack_prices", equality=["pack_id"], sort=["valid_from"], range="valid_from"),
+    QueryShape("incident by id", "incidents", equality=["id"]),
+    QueryShape("GET /incidents (SuperAdmin)", "incidents", sort=["created_at", "id"]),
+    QueryShape("GET /incidents?status=", "incidents", equality=["status"], sort=["created_at", "id"]),
+    QueryShape("GET /incidents?status=&priority=", "incidents", equality=["status", "priority"], sort=["created_at", "id"]),
+    QueryShape("open incidents older than 48h", "incidents", equality=["status"], range="created_at"),
+    # GET /incidents (Empleado) is an $or of these two, merged in sort order
+    QueryShape("incidents created by employee", "incidents", equality=["created_by"], sort=["created_at", "id"]),
+    QueryShape("incidents assigned to employee", "incidents", equality=["assigned_to"], sort=["created_at", "id"]),
+    QueryShape("GET /incidents?client_id=", "incidents", equality=["client_id"], sort=["created_at", "id"]),
+    QueryShape("GET /incidents?client_id= (Empleado, created by)", "incidents", equality=["created_by", "client_id"],
+               sort=["created_at", "id"]),
+    QueryShape("GET /incidents?client_id= (Empleado, assigned to)", "incidents",
+               equality=["assigned_to", "client_id"], sort=["created_at", "id"]),
+    QueryShape("incident comments", "incident_comments", equality=["incident_id"], sort=["created_at"]),
+    QueryShape("GET /fichajes (Empleado)", "fichajes", equality=["user_id"], sort=["timestamp", "id"]),
+    QueryShape("fichajes of a user since a date", "fichajes", equality=["user_id"], range="timestamp"),
+    QueryShape("GET /fichajes (SuperAdmin)", "fichajes", sort=["timestamp", "id"]),
+    QueryShape("unread notifications", "notifications", equality=["read"]),
+    QueryShape("notifications of a sale or incident", "notifications", equality=["related_id"]),
+    QueryShape("GET /notifications", "notifications", sort=["created_at"]),
+    QueryShape("contact by id", "contacts", equality=["id"]),
+    QueryShape("GET /contacts", "contacts", sort=["name", "id"]),
+    QueryShape("objective of a month", "objectives", equality=["year", "month"]),
+    QueryShape("commission config of a month", "commission_configs", equality=["year", "month"]),
+    QueryShape("reset token lookup", "password_resets", equality=["token"]),
+    QueryShape("reset tokens of an email", "password_resets", equality=["email"]),
+    QueryShape("rate limit window", "rate_limit_hits", equality=["key"], range="at"),
+    QueryShape("migration state", "migrations", equality=["id"]),
+    QueryShape("change version of a collection (ETags)", "change_versions", equality=["collection"]),
+]
+
+
+class IndexRegistry:
+    """
+    Applies the registered indexes and reports which index serves each query shape.
+
+    create_index is idempotent, so apply() runs on every startup. Failures
+    (duplicates blocking a unique index, an existing index with different
+    options) are logged and reported, never raised.
+    """
+
+    def __init__(self, indexes: List[IndexSpec] = INDEXES, shapes: List[QueryShape] = QUERY_SHAPES):
+        self.indexes = indexes
+        self.shapes = shapes
+        self.status: Dict[Tuple[str, str], dict] = {
+            (index.collection, index.name): {"status": "pending"} for index in indexes
+        }
+
+    async def apply(self, db):
+        for position, index in enumerate(self.indexes):
+            key = (index.collection, index.name)
+            try:
+                await db[index.collection].create_index(index.keys, **index.options())
+                self.status[key] = {"status": "ok"}
+            except ConnectionFailure as e:
+                logger.error("Index bootstrap stopped, database unreachable: %s", e)
+                for pending in self.indexes[position:]:
+                    self.status[(pending.collection, pending.name)] = {"status": "pending", "error": str(e)}
+                return
+            except OperationFailure as e:
+                logger.error("Could not create index %s on %s: %s", index.name, index.collection, e)
+                self.status[key] = {"status": "failed", "error": str(e)}
+
+    def serving_index(self, shape: QueryShape) -> Optional[IndexSpec]:
+        for index in self.indexes:
+            if index.collection == shape.collection and shape.served_by(index):
+                return index
+        return None
+
+    def report(self) -> dict:
+        indexes = [
+            {**index.describe(), **self.status[(index.collection, index.name)]}
+            for index in self.indexes
+        ]
+        shapes = []
+        for shape in self.shapes:
+            index = self.serving_index(shape)
+            shapes.append({
+                **shape.describe(),
+                "index": index.name if index else None,
+                "index_status": self.status[(index.collection, index.name)]["status"] if index else "unindexed",
+            })
+        return {"indexes": indexes, "query_shapes": shapes}
@@ -0,0 +1,137 @@
+"""
+List queries - allow-listed filters and sorts for list endpoints, checked against the index registry
+"""
+from datetime import datetime
+from typing import Dict, List, Mapping, Optional, Sequence
+
+from .dates import as_datetime
+from .indexes import IndexRegistry, QueryShape
+from .pagination import Keyset
+
+# Query parameters the list endpoints handle themselves
+RESERVED_PARAMS = {"limit", "cursor", "search", "sort", "fields"}
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+class Filter:
+    """
+    One query parameter. `op` is "in" (comma-separated values, matched by
+    equality) or a range bound: "gte", "lte" or "lt". Values are parsed with
+    `cast`; `choices` restricts them further.
+    """
+
+    def __init__(self, param: str, field: Optional[str] = None, op: str = "in", cast=str,
+                 choices: Optional[Sequence] = None):
+        self.param = param
+        self.field = field or param
+        self.op = op
+        self.cast = cast
+        self.choices = choices
+
+    def parse(self, raw: str):
+        values = [v.strip() for v in raw.split(",")] if self.op == "in" else [raw.strip()]
+        parsed = []
+        for value in values:
+            try:
+                value = as_datetime(value) if self.cast is datetime else self.cast(value)
+            except (TypeError, ValueError):
+                raise InvalidQuery(f"Invalid value for {self.param}: {value!r}")
+            if self.choices is not None and value not in self.choices:
+                raise InvalidQuery(f"Invalid value for {self.param}: {value!r}")
+            parsed.append(value)
+        return parsed if self.op == "in" else parsed[0]
+
+
+class ParsedQuery:
+    def __init__(self, query: dict, keyset: Keyset, equality: List[str], ranges: List[str]):
+        self.query = query
+        self.keyset = keyset
+        self.equality = equality
+        self.ranges = ranges
+
+    def scoped(self, base: dict) -> dict:
+        """The query restricted to what the endpoint lets the user see"""
+        if not base or not self.query:
+            return base or self.query
+        return {"$and": [base, self.query]}
+
+
+class ListQuery:
+    """
+    Turns the query string of a list endpoint into a Mongo query and a keyset.
+
+    Only the declared filters and sorts are accepted; anything else is a 400.
+    `sort` is a field name, "-" first for descending. Date bounds go through
+    `dates.range()` so they match legacy string dates during the migration.
+    """
+
+    def __init__(self, collection: str, filters: Sequence[Filter], sorts: Sequence[str],
+                 default_sort: str = "-created_at", dates=None):
+        self.collection = collection
+        self.filters: Dict[str, Filter] = {f.param: f for f in filters}
+        self.sorts = set(sorts)
+        self.default_sort = default_sort
+        self.dates = dates
+        self._keysets: Dict[str, Keyset] = {}
+
+    def keyset(self, sort: str) -> Keyset:
+        if sort not in self._keysets:
+            field = sort.lstrip("-")
+            if field not in self.sorts:
+                raise InvalidQuery(f"Cannot sort by {field}")
+            dual_read = (lambda: self.dates.dual_read) if self.dates is not None else None
+            self._keysets[sort] = Keyset(field, -1 if sort.startswith("-") else 1, dual_read=dual_read)
+        return self._keysets[sort]
+
+    def parse(self, params: Mapping[str, str]) -> ParsedQuery:
+        unknown = sorted(set(params) - set(self.filters) - RESERVED_PARAMS)
+        if unknown:
+            raise InvalidQuery(f"Unknown filter: {', '.join(unknown)}")
+
+        clauses = []
+        equality: List[str] = []
+        bounds: Dict[str, dict] = {}
+        for param, raw in params.items():
+            spec = self.filters.get(param)
+            if spec is None or raw == "":
+                continue
+            value = spec.parse(raw)
+            if spec.op == "in":
+                clauses.append({spec.field: value[0] if len(value) == 1 else {"$in": value}})
+                equality.append(spec.field)
+            else:
+                bounds.setdefault(spec.field, {})[spec.op] = value
+
+        for field, ops in bounds.items():
+            if isinstance(next(iter(ops.values())), datetime) and self.dates is not None:
+                clauses.append(self.dates.range(field, gte=ops.get("gte"), lt=ops.get("lt")))
+            else:
+                clauses.append({field: {f"${op}": value for op, value in ops.items()}})
+
+        query = clauses[0] if len(clauses) == 1 else ({"$and": clauses} if clauses else {})
+        keyset = self.keyset(params.get("sort") or self.default_sort)
+        return ParsedQuery(query, keyset, equality, list(bounds))
+
+    def unserved(self, parsed: ParsedQuery, registry: IndexRegistry,
+                 scopes: Sequence[Sequence[str]] = ((),)) -> Optional[str]:
+        """
+        Why no registered index serves the query, or None if one does.
+
+        `scopes` are the equality fields the endpoint adds itself, one list per
+        branch of its $or (e.g. incidents created by or assigned to a user).
+        """
+        if len(parsed.ranges) > 1:
+            return f"ranges on {', '.join(parsed.ranges)} cannot share an index"
+        sort = [parsed.keyset.field, "id"]
+        for scope in scopes:
+            equality = list(dict.fromkeys([*scope, *parsed.equality]))
+            shape = QueryShape(f"GET /{self.collection}", self.collection, equality=equality, sort=sort,
+                               range=parsed.ranges[0] if parsed.ranges else None)
+            if registry.serving_index(shape) is None:
+                described = ", ".join(equality) or "no filter"
+                ranged = f", range on {shape.range}" if shape.range else ""
+                return f"no index serves {described}{ranged} sorted by {parsed.keyset.field}"
+        return None
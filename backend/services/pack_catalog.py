@@ -0,0 +1,147 @@
+"""
+Pack catalog - in-process copy of the packs collection, reloaded when packs change
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+from .change_versions import ChangeVersions
+from .dates import EPOCH, as_datetime
+from .pack_rules import with_rules
+from .pagination import InvalidCursor, Keyset, MAX_LIMIT
+
+logger = logging.getLogger(__name__)
+
+NEW_PACK_DAYS = 7
+DATE_FIELDS = ("created_at", "validity_start", "validity_end")
+
+
+class CatalogSnapshot:
+    """
+    The whole catalog as of one packs change version, newest first.
+
+    Documents are normalized once through the Pack model (dates parsed,
+    defaults filled) and must be treated as read-only by callers.
+    """
+
+    def __init__(self, version: int, packs: List[dict], now: datetime, max_age: float):
+        self.version = version
+        self.packs = packs
+        self.by_id: Dict[str, dict] = {pack["id"]: pack for pack in packs}
+        self.loaded_at = now
+        # Structures built from this snapshot (see pack_index.py), dropped with it
+        self.derived: Dict[str, Any] = {}
+        # Valid until the next is_new or validity boundary, or max_age at most
+        boundaries = [now + timedelta(seconds=max_age)]
+        for pack in packs:
+            created_at = pack.get("created_at")
+            if created_at:
+                boundaries.append(created_at + timedelta(days=NEW_PACK_DAYS))
+            boundaries.extend(pack[field] for field in ("validity_start", "validity_end") if pack.get(field))
+        self.expires_at = min(b for b in boundaries if b > now)
+
+    def current(self, pack: dict, now: datetime) -> bool:
+        """Active and inside its validity window (open ends allowed)"""
+        if not pack.get("active", True):
+            return False
+        start, end = pack.get("validity_start"), pack.get("validity_end")
+        return (start is None or start <= now) and (end is None or now < end)
+
+
+class PackCatalog:
+    """
+    Serves pack reads from memory.
+
+    The snapshot is rebuilt when the packs change version moves (every pack
+    write bumps it, see ChangeVersions) or when a time-based fact changes: a
+    pack stops being new, or a validity window opens or closes. Checking the
+    version is itself served from the ChangeVersions cache, so most reads
+    make no database round trip at all.
+    """
+
+    def __init__(self, db, versions: ChangeVersions, model: Type[BaseModel], max_age: float = 3600.0):
+        self.db = db
+        self.versions = versions
+        self.model = model
+        self.max_age = max_age
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    async def snapshot(self) -> CatalogSnapshot:
+        version = await self.versions.get("packs")
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version and datetime.now(timezone.utc) < snapshot.expires_at:
+            self.hits += 1
+            return snapshot
+        async with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version or datetime.now(timezone.utc) >= snapshot.expires_at:
+                snapshot = self._snapshot = await self._load(version)
+            return snapshot
+
+    async def _load(self, version: int) -> CatalogSnapshot:
+        now = datetime.now(timezone.utc)
+        docs = await self.db.packs.find({}, {"_id": 0}).to_list(None)
+        packs = []
+        for doc in docs:
+            try:
+                pack = self.model.model_validate(doc).model_dump()
+            except ValidationError as e:
+                # Served as stored rather than dropped from the catalog
+                logger.warning("Pack %s does not match the Pack model: %s", doc.get("id"), e)
+                pack = dict(doc)
+            # Timezone-aware throughout, whatever the stored format
+            for field in DATE_FIELDS:
+                try:
+                    pack[field] = as_datetime(pack.get(field))
+                except ValueError:
+                    pack[field] = None
+            # Packs the rules backfill has not reached yet
+            pack = with_rules(pack)
+            pack["is_new"] = bool(pack.get("created_at")) and (now - pack["created_at"]).days < NEW_PACK_DAYS
+            packs.append(pack)
+        packs.sort(key=lambda pack: (pack.get("created_at") or EPOCH, pack["id"]), reverse=True)
+        self.loads += 1
+        return CatalogSnapshot(version, packs, now, self.max_age)
+
+    async def get(self, pack_id: str) -> Optional[dict]:
+        return (await self.snapshot()).by_id.get(pack_id)
+
+    async def offer(self, pack_type: str) -> List[dict]:
+        """Packs of `pack_type` that can be sold right now"""
+        snapshot = await self.snapshot()
+        now = datetime.now(timezone.utc)
+        return [pack for pack in snapshot.packs if pack.get("type") == pack_type and snapshot.current(pack, now)]
+
+    async def page(self, keyset: Keyset, active_only: bool = False, limit: int = 100,
+                   cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Same pages (and cursors) as Keyset.page over (created_at, id), newest first"""
+        snapshot = await self.snapshot()
+        limit = max(1, min(limit, MAX_LIMIT))
+        packs = [pack for pack in snapshot.packs if pack.get("active")] if active_only else snapshot.packs
+        if cursor:
+            value, last_id = keyset.decode(cursor)
+            try:
+                # Packs are ordered by created_at, so the cursor has to hold a date
+                after = (as_datetime(value) or EPOCH, last_id)
+            except (TypeError, ValueError, AttributeError):
+                raise InvalidCursor(cursor)
+            packs = [pack for pack in packs if (pack.get("created_at") or EPOCH, pack["id"]) < after]
+        next_cursor = keyset.encode(packs[limit - 1]) if len(packs) > limit else None
+        return packs[:limit], next_cursor
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "packs": len(snapshot.packs) if snapshot else 0,
+            "loaded_at": snapshot.loaded_at.isoformat() if snapshot else None,
+            "expires_at": snapshot.expires_at.isoformat() if snapshot else None,
+            "hits": self.hits,
+            "loads": self.loads,
+        }
@@ -0,0 +1,269 @@
+"""
+Pack import - operator price sheets (CSV or XLSX) upserted into the catalog in batches
+"""
+import asyncio
+import codecs
+import csv
+import uuid
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, Iterator, List, Set, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .dates import as_datetime
+from .pack_prices import PackPriceHistory
+from .pack_rules import compile_rules, plain_words
+
+# Sheet headers (normalized: lowercase, unaccented) -> PackCreate field
+COLUMN_ALIASES = {
+    "compania": "company", "operador": "company", "operadora": "company",
+    "nombre": "name", "tarifa": "name",
+    "tipo": "type",
+    "precio": "price", "precio eur": "price", "cuota": "price",
+    "caracteristicas": "features", "descripcion": "features",
+    "inicio": "validity_start", "vigencia desde": "validity_start",
+    "fin": "validity_end", "vigencia hasta": "validity_end",
+    "activo": "active", "activa": "active",
+    "observaciones": "observations",
+    "restricciones": "restrictions",
+    "categoria": "category",
+    "fibra": "fiber_speed_mbps", "velocidad": "fiber_speed_mbps", "fibra mbps": "fiber_speed_mbps",
+    "gb": "mobile_gb", "datos": "mobile_gb", "datos gb": "mobile_gb",
+    "lineas": "mobile_lines", "lineas incluidas": "lines_included",
+    "minutos": "minutes_type",
+    "lineas adicionales": "additional_lines_supported",
+    "tv": "tv_supported", "paquete tv": "tv_package_type",
+    "permanencia": "has_permanence", "meses permanencia": "permanence_months",
+}
+# Tried in order; Excel's Spanish "CSV" export is Windows-1252
+CSV_ENCODINGS = ("utf-8-sig", "cp1252")
+TRUE_VALUES = {"si", "s", "yes", "y", "true", "1", "x"}
+FALSE_VALUES = {"no", "n", "false", "0"}
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+def read_rows(filename: str, stream: BinaryIO) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(sheet row number, raw row) for each data row of a .csv or .xlsx upload, read lazily"""
+    if filename.lower().endswith(".xlsx"):
+        return _xlsx_rows(stream)
+    if filename.lower().endswith(".csv"):
+        return _csv_rows(stream)
+    raise ImportFileError("Unsupported file type, expected .csv or .xlsx")
+
+
+def _csv_encoding(stream: BinaryIO) -> str:
+    """
+    First of CSV_ENCODINGS the whole file decodes with. Checked before any
+    row is read, so a bad byte deep in the file fails the import up front
+    instead of after earlier batches were written.
+    """
+    for encoding in CSV_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        stream.seek(0)
+        try:
+            for chunk in iter(lambda: stream.read(1 << 16), b""):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            continue
+        stream.seek(0)
+        return encoding
+    raise ImportFileError("Unreadable CSV file, expected UTF-8 or Windows-1252 text")
+
+
+def _csv_rows(stream: BinaryIO) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    text = codecs.getreader(_csv_encoding(stream))(stream)
+    header_line = text.readline()
+    if not header_line.strip():
+        raise ImportFileError("The file has no header row")
+    # Spanish spreadsheets export with ";" (the decimal separator is ",")
+    delimiter = ";" if header_line.count(";") > header_line.count(",") else ","
+    header = next(csv.reader([header_line], delimiter=delimiter))
+    for number, values in enumerate(csv.reader(text, delimiter=delimiter), start=2):
+        if any(value.strip() for value in values):
+            yield number, dict(zip(header, values))
+
+
+def _xlsx_rows(stream: BinaryIO) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    from openpyxl import load_workbook
+
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFileError(f"Unreadable XLSX file: {e}")
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header:
+            raise ImportFileError("The file has no header row")
+        header = [str(cell) if cell is not None else "" for cell in header]
+        for number, values in enumerate(rows, start=2):
+            if any(value not in (None, "") for value in values):
+                yield number, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def normalize_row(raw: Dict[str, Any], fields: Set[str], flags: Set[str]) -> Dict[str, Any]:
+    """
+    Sheet row -> model input: known columns only, blanks dropped, "sí"/"no"
+    read for the boolean `flags` fields and "29,90" for the price.
+    """
+    row = {}
+    for column, value in raw.items():
+        key = plain_words(str(column or ""))
+        field = key.replace(" ", "_") if key.replace(" ", "_") in fields else COLUMN_ALIASES.get(key)
+        if field is None or field in row:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if not value:
+                continue
+            flag = plain_words(value)
+            if field in flags and flag in TRUE_VALUES | FALSE_VALUES:
+                value = flag in TRUE_VALUES
+            elif field == "price":
+                value = value.replace("€", "").replace(" ", "")
+                if "," in value:
+                    value = value.replace(".", "").replace(",", ".")
+        elif value is None:
+            continue
+        row[field] = value
+    return row
+
+
+class PackImport:
+    """
+    Upserts a price sheet into `packs`, keyed by (company, name).
+
+    Rows are read and validated against `model` in batches of `batch_size`;
+    each batch is one read of the packs it names and one unordered
+    bulk_write, so a bad row only fails itself. Rows identical to the stored
+    pack are not written. Packs of the sheet's companies that the sheet no
+    longer lists can be deactivated at the end.
+    """
+
+    def __init__(self, db, model: Type[BaseModel], prices: PackPriceHistory, batch_size: int = 500):
+        self.db = db
+        self.model = model
+        self.fields = set(model.model_fields)
+        self.flags = {name for name, info in model.model_fields.items() if info.annotation is bool}
+        self.prices = prices
+        self.batch_size = batch_size
+
+    async def run(self, rows: Iterator[Tuple[int, Dict[str, Any]]], deactivate_missing: bool = True) -> dict:
+        report: List[dict] = []
+        seen: Dict[str, Set[str]] = {}
+        imported: Set[Tuple[str, str]] = set()
+        while True:
+            # Parsing is blocking (openpyxl, csv), so batches are read off the event loop
+            batch = await asyncio.to_thread(_take, rows, self.batch_size)
+            if not batch:
+                break
+            report.extend(await self._apply(batch, seen, imported))
+
+        deactivated = await self._deactivate(seen) if deactivate_missing else []
+        counts = {status: 0 for status in ("created", "updated", "unchanged", "failed")}
+        for entry in report:
+            counts[entry["status"]] += 1
+        return {"rows": len(report), **counts, "deactivated": deactivated, "report": report}
+
+    async def _apply(self, batch: List[Tuple[int, Dict[str, Any]]], seen: Dict[str, Set[str]],
+                     imported: Set[Tuple[str, str]]) -> List[dict]:
+        report, valid = [], []
+        for number, raw in batch:
+            row = normalize_row(raw, self.fields, self.flags)
+            # Listed packs are never deactivated, even when their row is rejected
+            if isinstance(row.get("company"), str) and isinstance(row.get("name"), str):
+                seen.setdefault(row["company"], set()).add(row["name"])
+            try:
+                pack = self.model.model_validate(row).model_dump()
+            except ValidationError as e:
+                report.append({"row": number, "status": "failed", "errors": [
+                    f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}" for error in e.errors()
+                ]})
+                continue
+            key = (pack["company"], pack["name"])
+            if key in imported:
+                report.append({"row": number, "status": "failed", "errors": ["Duplicate company and name in the sheet"]})
+                continue
+            imported.add(key)
+            valid.append((number, pack))
+
+        stored = {}
+        if valid:
+            cursor = self.db.packs.find(
+                {"company": {"$in": list({p["company"] for _, p in valid})}, "name": {"$in": list({p["name"] for _, p in valid})}},
+                {"_id": 0}
+            ).sort("created_at", 1)
+            # Of packs sharing a (company, name), the sheet keeps the oldest up to date
+            async for doc in cursor:
+                stored.setdefault((doc["company"], doc["name"]), doc)
+
+        now = datetime.now(timezone.utc)
+        operations, written, changes = [], [], []
+        for number, pack in valid:
+            before = stored.get((pack["company"], pack["name"]))
+            doc = {**pack, **compile_rules(pack.get("restrictions"), pack.get("observations"))}
+            if before is not None and all(_same(before.get(field), value) for field, value in doc.items()):
+                report.append({"row": number, "status": "unchanged", "pack_id": before["id"]})
+                continue
+            if before is not None:
+                # (company, name) is not unique: write the very pack the price history is tracked on
+                pack_id = before["id"]
+                operations.append(UpdateOne({"id": pack_id}, {"$set": doc}))
+            else:
+                # Inserted, not upserted on (company, name): a pack created meanwhile would
+                # take the write and leave the report and price history on an unknown id
+                pack_id = str(uuid.uuid4())
+                operations.append(InsertOne({**doc, "id": pack_id, "created_at": now, "is_demo": False, "is_new": True}))
+            written.append({"row": number, "status": "updated" if before else "created", "pack_id": pack_id})
+            changes.append((before, {"id": pack_id, "price": pack["price"], "created_at": now}))
+        if operations:
+            try:
+                await self.db.packs.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    entry = written[error["index"]]
+                    entry.update(status="failed", errors=[error.get("errmsg", "Write failed")])
+                    changes[error["index"]] = None
+            await self.prices.track_many([change for change in changes if change is not None])
+        report.extend(written)
+        report.sort(key=lambda entry: entry["row"])
+        return report
+
+    async def _deactivate(self, seen: Dict[str, Set[str]]) -> List[str]:
+        if not seen:
+            return []
+        missing = []
+        for company, names in seen.items():
+            cursor = self.db.packs.find(
+                {"company": company, "active": True, "name": {"$nin": list(names)}}, {"_id": 0, "id": 1}
+            )
+            missing.extend([doc["id"] async for doc in cursor])
+        if missing:
+            await self.db.packs.update_many({"id": {"$in": missing}}, {"$set": {"active": False}})
+        return missing
+
+
+def _same(stored: Any, value: Any) -> bool:
+    if isinstance(value, datetime):
+        try:
+            return as_datetime(stored) == as_datetime(value)
+        except (TypeError, ValueError):
+            return False
+    return stored == value
+
+
+def _take(rows: Iterator, count: int) -> list:
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) == count:
+            break
+    return batch
@@ -0,0 +1,326 @@
+"""
+Pack index - offerable packs bucketed by (type, tv_supported) for the calculator configurator
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .pack_catalog import CatalogSnapshot, PackCatalog
+from .pack_rules import origin_key
+
+RECENT_PACK_SECONDS = 30 * 86400
+MAX_PRICE = 100
+# Rounding to 2 decimals moves a score by 0.005 at most, so nothing further
+# than this below the n-th best raw score can reach the top n once rounded
+RERANK_MARGIN = 0.01 + 1e-6
+NOWHERE = np.empty(0, dtype=np.intp)
+
+# (price weight, quality weight) by configurator priority
+PRIORITY_WEIGHTS = {
+    "Ahorrar": (3, 1),
+    "Equilibrado": (2, 2),
+    "Máxima calidad": (1, 3),
+}
+
+
+class IndexedPack:
+    """A catalog pack with what the scorer reads precomputed"""
+
+    __slots__ = ("pack", "price", "price_score", "mobile_gb", "fiber_speed_mbps", "tv_supported",
+                 "tv_package_type", "additional_lines_supported", "created_ts", "allowed_origins",
+                 "bonus_origins")
+
+    def __init__(self, pack: dict):
+        self.pack = pack
+        self.price = pack["price"]
+        self.price_score = ((MAX_PRICE - self.price) / MAX_PRICE) * 20
+        self.mobile_gb = pack.get("mobile_gb")
+        self.fiber_speed_mbps = pack.get("fiber_speed_mbps")
+        self.tv_supported = bool(pack.get("tv_supported"))
+        self.tv_package_type = pack.get("tv_package_type")
+        self.additional_lines_supported = bool(pack.get("additional_lines_supported"))
+        created_at = pack.get("created_at")
+        self.created_ts = created_at.timestamp() if created_at else 0.0
+        # Compiled origin rules (see pack_rules.py); None means anyone qualifies
+        allowed = pack.get("allowed_origins")
+        self.allowed_origins = frozenset(allowed) if allowed is not None else None
+        self.bonus_origins = frozenset(pack.get("bonus_origins") or ())
+
+
+class PackColumns:
+    """The scorer's inputs for one bucket as arrays, in catalog order"""
+
+    def __init__(self, entries: List[IndexedPack]):
+        self.entries = entries
+        self.price = np.array([e.price for e in entries], dtype=np.float64)
+        self.price_score = np.array([e.price_score for e in entries], dtype=np.float64)
+        # Missing quantities are 0, which the scorer treats as "not stated"
+        self.mobile_gb = np.array([e.mobile_gb or 0 for e in entries], dtype=np.float64)
+        self.fiber_speed_mbps = np.array([e.fiber_speed_mbps or 0 for e in entries], dtype=np.float64)
+        self.tv_supported = np.array([e.tv_supported for e in entries], dtype=bool)
+        self.additional_lines_supported = np.array([e.additional_lines_supported for e in entries], dtype=bool)
+        self.created_ts = np.array([e.created_ts for e in entries], dtype=np.float64)
+        self.restricted = np.array([e.allowed_origins is not None for e in entries], dtype=bool)
+        # Origin key -> positions of the packs that allow / favour it
+        allowed_by_origin: Dict[str, List[int]] = defaultdict(list)
+        bonus_by_origin: Dict[str, List[int]] = defaultdict(list)
+        for i, entry in enumerate(entries):
+            for origin in entry.allowed_origins or ():
+                allowed_by_origin[origin].append(i)
+            for origin in entry.bonus_origins:
+                bonus_by_origin[origin].append(i)
+        self.allowed_by_origin = {origin: np.array(at, dtype=np.intp) for origin, at in allowed_by_origin.items()}
+        self.bonus_by_origin = {origin: np.array(at, dtype=np.intp) for origin, at in bonus_by_origin.items()}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def origin_masks(self, origin: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(restricted to other origins, singled out for this one) for an origin key"""
+        blocked = self.restricted.copy()
+        blocked[self.allowed_by_origin.get(origin, NOWHERE)] = False
+        favoured = np.zeros(len(self), dtype=bool)
+        favoured[self.bonus_by_origin.get(origin, NOWHERE)] = True
+        return blocked, favoured
+
+
+class PackIndex:
+    """
+    The packs of one catalog snapshot that can be sold now, bucketed by
+    (type, tv_required): the TV bucket holds the type's packs with TV, the
+    other all of the type's packs. Each bucket is columnar, so a request is
+    scored with a handful of array operations; only the few packs that can
+    make the top `n` are then scored exactly by `score()` and ranked.
+    """
+
+    def __init__(self, snapshot: CatalogSnapshot, now: Optional[datetime] = None):
+        now = now or datetime.now(timezone.utc)
+        by_type: Dict[str, List[IndexedPack]] = defaultdict(list)
+        for pack in snapshot.packs:
+            if snapshot.current(pack, now):
+                by_type[pack.get("type")].append(IndexedPack(pack))
+        self.built_at = now
+        self.buckets: Dict[Tuple[str, bool], PackColumns] = {}
+        for pack_type, entries in by_type.items():
+            self.buckets[(pack_type, False)] = PackColumns(entries)
+            self.buckets[(pack_type, True)] = PackColumns([e for e in entries if e.tv_supported])
+        self._frontiers: Dict[Tuple[str, bool], List[Tuple[IndexedPack, List[str]]]] = {}
+
+    def frontier_keys(self) -> List[Tuple[str, bool]]:
+        """(type, tv_supported) groups that have packs on offer"""
+        return sorted({(pack_type, entry.tv_supported)
+                       for (pack_type, tv_only), columns in self.buckets.items() if not tv_only
+                       for entry in columns.entries})
+
+    def frontier(self, pack_type: str, tv_supported: bool) -> List[Tuple[IndexedPack, List[str]]]:
+        """
+        Packs of the type (with or without TV) that no other one beats on
+        price, GB and fiber speed at once, cheapest first, with the badges
+        "Más barato", "Mejor valor" and "Más completo" placed among them.
+
+        Not maintained incrementally on pack writes: a write moves the packs
+        change version, so the next read loads a new snapshot and a new
+        PackIndex, and there is no long-lived index to patch. Instead each
+        (type, tv) frontier is built on first use, once per snapshot, from
+        that bucket alone (O(k log k) for its k packs).
+        """
+        key = (pack_type, tv_supported)
+        if key not in self._frontiers:
+            columns = self.buckets.get((pack_type, False))
+            if columns is None:
+                return []
+            on_frontier = [columns.entries[i] for i in pareto_frontier(columns, columns.tv_supported == tv_supported)]
+            self._frontiers[key] = frontier_badges(on_frontier, self.built_at.timestamp())
+        return self._frontiers[key]
+
+    def top(self, request, n: int = 3, now: Optional[datetime] = None) -> List[Tuple[float, IndexedPack]]:
+        """Best `n` (score, pack) for a ConfiguratorRequest, best first; ties keep catalog order"""
+        return self.top_many([request], n, now)[0]
+
+    def top_many(self, requests: Sequence, n: int = 3,
+                 now: Optional[datetime] = None) -> List[List[Tuple[float, IndexedPack]]]:
+        """`top` for each request; requests sharing a bucket are scored together as one matrix"""
+        now_ts = (now or datetime.now(timezone.utc)).timestamp()
+        groups: Dict[Tuple[str, bool], List[int]] = defaultdict(list)
+        for position, request in enumerate(requests):
+            groups[(request.pack_type, request.tv_required)].append(position)
+        results: List[List[Tuple[float, IndexedPack]]] = [[] for _ in requests]
+        for key, positions in groups.items():
+            columns = self.buckets.get(key)
+            if columns is None or not len(columns):
+                continue
+            group = [requests[position] for position in positions]
+            for position, request, raw in zip(positions, group, scores(columns, group, now_ts)):
+                results[position] = _select(columns, request, raw, n, now_ts)
+        return results
+
+
+def _select(columns: PackColumns, request, raw: np.ndarray, n: int, now_ts: float) -> List[Tuple[float, IndexedPack]]:
+    offered = int(np.count_nonzero(raw > -np.inf))
+    if not offered:
+        return []
+    k = min(n, offered)
+    kth = np.partition(raw, len(raw) - k)[len(raw) - k]
+    contenders = np.flatnonzero((raw >= kth - RERANK_MARGIN) & (raw > -np.inf))
+    origin = origin_key(request.origin_company)
+    ranked = sorted(
+        ((score(columns.entries[i], request, origin, now_ts), int(i)) for i in contenders),
+        key=lambda item: (-item[0], item[1])
+    )
+    return [(value, columns.entries[i]) for value, i in ranked[:n]]
+
+
+def scores(columns: PackColumns, requests: Sequence, now_ts: float) -> np.ndarray:
+    """
+    Unrounded `score()` of every pack in `columns` (columns) for each request
+    (rows), -inf where restrictions exclude the pack. Terms are added in the
+    order `score()` adds them; a term that does not apply adds 0.
+    """
+    def column(values, dtype=np.float64):
+        return np.array(values, dtype=dtype)[:, None]
+
+    weights = [PRIORITY_WEIGHTS[request.priority] for request in requests]
+    price_weight = column([price for price, _ in weights])
+    quality_weight = column([quality for _, quality in weights])
+    total = np.zeros((len(requests), len(columns)), dtype=np.float64)
+    total += _fit(columns.mobile_gb, column([r.mobile_gb or 0 for r in requests]), 10, quality_weight)
+    total += _fit(columns.fiber_speed_mbps, column([r.fiber_speed_mbps or 0 for r in requests]), 100, quality_weight)
+    total += columns.price_score * price_weight
+    total += np.where(column([r.tv_required for r in requests], bool) & columns.tv_supported, 15.0, 0.0)
+    total += np.where(column([r.additional_lines > 0 for r in requests], bool) & columns.additional_lines_supported,
+                      10.0, 0.0)
+    total += np.where(now_ts - columns.created_ts < RECENT_PACK_SECONDS, 5.0, 0.0)
+    for row, request in enumerate(requests):
+        origin = origin_key(request.origin_company)
+        if origin:
+            blocked, favoured = columns.origin_masks(origin)
+            total[row] += np.where(favoured, 10.0, 0.0)
+            if request.respect_restrictions:
+                total[row, blocked] = -np.inf
+    return total
+
+
+def _fit(offered: np.ndarray, wanted: np.ndarray, step: int, weight: np.ndarray) -> np.ndarray:
+    """GB or speed term; `wanted` 0 (not asked) or `offered` 0 (not stated) adds nothing"""
+    stated = (offered != 0) & (wanted != 0)
+    covered = stated & (offered >= wanted)
+    closeness = np.maximum(0.0, 20 - (offered - wanted) / step) * weight
+    return np.where(covered, closeness, np.where(stated, -10.0, 0.0))
+
+
+def score(entry: IndexedPack, request, origin: Optional[str], now_ts: float) -> float:
+    """Exact (rounded) score of one pack for the request's origin key; `scores` is its vectorized form"""
+    price_weight, quality_weight = PRIORITY_WEIGHTS[request.priority]
+    total = 0.0
+    if request.mobile_gb and entry.mobile_gb:
+        if entry.mobile_gb >= request.mobile_gb:
+            total += max(0, 20 - (entry.mobile_gb - request.mobile_gb) / 10) * quality_weight
+        else:
+            total -= 10
+    if request.fiber_speed_mbps and entry.fiber_speed_mbps:
+        if entry.fiber_speed_mbps >= request.fiber_speed_mbps:
+            total += max(0, 20 - (entry.fiber_speed_mbps - request.fiber_speed_mbps) / 100) * quality_weight
+        else:
+            total -= 10
+    total += entry.price_score * price_weight
+    if request.tv_required and entry.tv_supported:
+        total += 15
+    if request.additional_lines > 0 and entry.additional_lines_supported:
+        total += 10
+    if is_recent(entry, now_ts):
+        total += 5
+    if origin and origin in entry.bonus_origins:
+        total += 10
+    return round(total, 2)
+
+
+def pareto_frontier(columns: PackColumns, mask: np.ndarray) -> List[int]:
+    """
+    Positions of the packs under `mask` not dominated by another one - as
+    cheap or cheaper with as many GB and as much speed, better on one of
+    them - cheapest first.
+    """
+    candidates = np.flatnonzero(mask)
+    price, gb, speed = columns.price[candidates], columns.mobile_gb[candidates], columns.fiber_speed_mbps[candidates]
+    # Cheapest first, then most GB, then fastest: nothing later can dominate an earlier pack
+    order = np.lexsort((-speed, -gb, price))
+    kept: List[int] = []
+    kept_price, kept_gb, kept_speed = (np.empty(len(candidates)) for _ in range(3))
+    for i in order:
+        n = len(kept)
+        no_worse = (kept_price[:n] <= price[i]) & (kept_gb[:n] >= gb[i]) & (kept_speed[:n] >= speed[i])
+        better = (kept_price[:n] < price[i]) | (kept_gb[:n] > gb[i]) | (kept_speed[:n] > speed[i])
+        if np.any(no_worse & better):
+            continue
+        kept_price[n], kept_gb[n], kept_speed[n] = price[i], gb[i], speed[i]
+        kept.append(int(candidates[i]))
+    return kept
+
+
+def frontier_badges(entries: List[IndexedPack], now_ts: float) -> List[Tuple[IndexedPack, List[str]]]:
+    """
+    Badges across a frontier: the cheapest; the best configurator score for a
+    balanced customer wanting the frontier's median GB and speed; and the one
+    with the most features, the cheapest of those on a tie.
+    """
+    if not entries:
+        return []
+    badges: List[List[str]] = [[] for _ in entries]
+    badges[0].append("Más barato")
+
+    def median(values):
+        values = [v for v in values if v]
+        return int(np.median(values)) if values else None
+
+    balanced = SimpleNamespace(
+        priority="Equilibrado", tv_required=False, additional_lines=0,
+        mobile_gb=median(e.mobile_gb for e in entries),
+        fiber_speed_mbps=median(e.fiber_speed_mbps for e in entries),
+    )
+    scores = [score(entry, balanced, None, now_ts) for entry in entries]
+    badges[scores.index(max(scores))].append("Mejor valor")
+    features = [feature_count(entry.pack) for entry in entries]
+    badges[features.index(max(features))].append("Más completo")
+    return list(zip(entries, badges))
+
+
+def feature_count(pack: dict) -> int:
+    """High-end features a pack has, for the "Más completo" badge"""
+    return sum([
+        (pack.get("mobile_gb") or 0) > 20,
+        (pack.get("fiber_speed_mbps") or 0) > 500,
+        bool(pack.get("tv_supported")),
+        bool(pack.get("additional_lines_supported")),
+    ])
+
+
+def is_recent(entry: IndexedPack, now_ts: float) -> bool:
+    return now_ts - entry.created_ts < RECENT_PACK_SECONDS
+
+
+def fit_details(entry: IndexedPack, request) -> List[str]:
+    """Why the pack fits the request, for the packs actually returned"""
+    details = []
+    if request.mobile_gb and entry.mobile_gb and entry.mobile_gb >= request.mobile_gb:
+        details.append(f"GB: {entry.mobile_gb}GB (pedido: {request.mobile_gb}GB)")
+    if request.fiber_speed_mbps and entry.fiber_speed_mbps and entry.fiber_speed_mbps >= request.fiber_speed_mbps:
+        details.append(f"Fibra: {entry.fiber_speed_mbps}Mbps")
+    if request.tv_required and entry.tv_supported:
+        details.append(f"TV: {entry.tv_package_type or 'incluida'}")
+    if request.additional_lines > 0 and entry.additional_lines_supported:
+        details.append("Líneas adicionales soportadas")
+    if request.origin_company and origin_key(request.origin_company) in entry.bonus_origins:
+        details.append(f"Especial para {request.origin_company}")
+    return details
+
+
+async def current_index(catalog: PackCatalog) -> PackIndex:
+    """The index of the catalog's current snapshot, built on first use"""
+    snapshot = await catalog.snapshot()
+    index = snapshot.derived.get("pack_index")
+    if index is None:
+        index = snapshot.derived["pack_index"] = PackIndex(snapshot)
+    return index
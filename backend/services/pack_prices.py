@@ -0,0 +1,178 @@
+"""
+Pack prices - append-only price history of each pack, with batched as-of lookups
+"""
+import bisect
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from .dates import EPOCH, as_datetime
+
+logger = logging.getLogger(__name__)
+
+
+class PackPriceHistory:
+    """
+    One `pack_prices` document per price a pack has had, from `valid_from`
+    until the next one. Versions are only ever inserted, so the price a sale
+    was made at stays known after the catalog price changes.
+
+    `as_of` resolves any number of (pack_id, moment) pairs with a single
+    query on the (pack_id, valid_from) index.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.status = "pending"
+        self.recorded = 0
+        self.lookups = 0
+
+    async def record(self, pack_id: str, price: float, valid_from: Optional[datetime] = None,
+                     is_demo: bool = False) -> bool:
+        """Appends a version if `price` differs from the latest one; True when it did"""
+        latest = await self._latest(pack_id)
+        if latest is not None and latest["price"] == price:
+            return False
+        return await self._insert(pack_id, price, valid_from or datetime.now(timezone.utc), is_demo)
+
+    async def track(self, before: dict, price: float) -> bool:
+        """
+        Records the new `price` of a pack whose stored document was `before`.
+        A pack without history yet (the backfill has not reached it) first
+        gets its previous price, from its creation on.
+        """
+        if await self._latest(before["id"]) is None:
+            await self._insert(before["id"], before["price"], self._created_at(before), before.get("is_demo", False))
+        return await self.record(before["id"], price, is_demo=before.get("is_demo", False))
+
+    async def track_many(self, changes: Sequence[Tuple[Optional[dict], dict]]) -> int:
+        """
+        `track` and `record` for many packs at once: (stored document before
+        the write or None for a new pack, pack as written). Versions go out in
+        one unordered insert; returns how many were appended.
+        """
+        now = datetime.now(timezone.utc)
+        existing = [before["id"] for before, pack in changes if before is not None and before["price"] != pack["price"]]
+        tracked = set(await self.db.pack_prices.distinct("pack_id", {"pack_id": {"$in": existing}})) if existing else set()
+        versions = []
+        for before, pack in changes:
+            if before is None:
+                versions.append(self._version(pack["id"], pack["price"], self._created_at(pack), pack.get("is_demo", False)))
+            elif before["price"] != pack["price"]:
+                if before["id"] not in tracked:
+                    versions.append(self._version(before["id"], before["price"], self._created_at(before),
+                                                  before.get("is_demo", False)))
+                versions.append(self._version(before["id"], pack["price"], now, before.get("is_demo", False)))
+        if not versions:
+            return 0
+        try:
+            result = await self.db.pack_prices.insert_many(versions, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            inserted = e.details.get("nInserted", 0)
+            logger.warning("Pack price history: %d versions already recorded", len(e.details.get("writeErrors", [])))
+        self.recorded += inserted
+        return inserted
+
+    async def _latest(self, pack_id: str) -> Optional[dict]:
+        return await self.db.pack_prices.find_one(
+            {"pack_id": pack_id}, {"_id": 0, "price": 1}, sort=[("valid_from", -1)]
+        )
+
+    @staticmethod
+    def _created_at(pack: dict) -> datetime:
+        return _moment(pack.get("created_at")) or EPOCH
+
+    @staticmethod
+    def _version(pack_id: str, price: float, valid_from: datetime, is_demo: bool) -> dict:
+        return {
+            "pack_id": pack_id,
+            "price": price,
+            "valid_from": valid_from,
+            "recorded_at": datetime.now(timezone.utc),
+            "is_demo": is_demo,
+        }
+
+    async def _insert(self, pack_id: str, price: float, valid_from: datetime, is_demo: bool) -> bool:
+        try:
+            await self.db.pack_prices.insert_one(self._version(pack_id, price, valid_from, is_demo))
+        except DuplicateKeyError:
+            # Another write recorded a version at the same instant
+            logger.warning("Pack %s already has a price version at %s", pack_id, valid_from.isoformat())
+            return False
+        self.recorded += 1
+        return True
+
+    async def history(self, pack_id: str) -> List[dict]:
+        return await self.db.pack_prices.find(
+            {"pack_id": pack_id}, {"_id": 0, "price": 1, "valid_from": 1, "recorded_at": 1}
+        ).sort("valid_from", 1).to_list(None)
+
+    async def as_of(self, lookups: Iterable[Tuple[Optional[str], Any]]) -> List[Optional[float]]:
+        """
+        Price of each (pack_id, moment) pair, in order; None when the pack had
+        no price yet, has no history, or the pair is incomplete.
+        """
+        lookups = [(pack_id, _moment(at) if pack_id else None) for pack_id, at in lookups]
+        wanted = [(pack_id, at) for pack_id, at in lookups if pack_id and at]
+        if not wanted:
+            return [None] * len(lookups)
+        versions: Dict[str, Tuple[List[datetime], List[float]]] = {}
+        cursor = self.db.pack_prices.find(
+            {"pack_id": {"$in": list({pack_id for pack_id, _ in wanted})},
+             "valid_from": {"$lte": max(at for _, at in wanted)}},
+            {"_id": 0, "pack_id": 1, "price": 1, "valid_from": 1}
+        ).sort([("pack_id", 1), ("valid_from", 1)])
+        async for version in cursor:
+            starts, prices = versions.setdefault(version["pack_id"], ([], []))
+            starts.append(as_datetime(version["valid_from"]))
+            prices.append(version["price"])
+        self.lookups += len(wanted)
+        resolved = []
+        for pack_id, at in lookups:
+            starts, prices = versions.get(pack_id, ((), ()))
+            position = bisect.bisect_right(starts, at) if at else 0
+            resolved.append(prices[position - 1] if position else None)
+        return resolved
+
+    async def backfill(self):
+        """Gives packs created before the history existed their current price as first version"""
+        state_id = "pack_prices_v1"
+        try:
+            state = await self.db.migrations.find_one({"id": state_id}, {"_id": 0})
+            if state and state.get("status") == "complete":
+                self.status = "complete"
+                return
+            self.status = "running"
+            tracked = set(await self.db.pack_prices.distinct("pack_id"))
+            packs = self.db.packs.find({}, {"_id": 0, "id": 1, "price": 1, "created_at": 1, "is_demo": 1})
+            async for pack in packs:
+                if pack["id"] in tracked or pack.get("price") is None:
+                    continue
+                await self.record(pack["id"], pack["price"], self._created_at(pack), pack.get("is_demo", False))
+            await self.db.migrations.update_one(
+                {"id": state_id},
+                {"$set": {"status": "complete", "recorded": self.recorded}},
+                upsert=True
+            )
+            self.status = "complete"
+        except Exception:
+            # Retried on the next startup
+            logger.exception("Pack price backfill failed")
+            self.status = "failed"
+
+    def stats(self) -> dict:
+        return {
+            "status": self.status,
+            "recorded": self.recorded,
+            "lookups": self.lookups,
+        }
+
+
+def _moment(value: Any) -> Optional[datetime]:
+    try:
+        return as_datetime(value)
+    except ValueError:
+        return None
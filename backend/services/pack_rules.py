@@ -0,0 +1,165 @@
+"""
+Pack rules - origin-company eligibility and bonuses compiled from pack restrictions and observations
+"""
+import logging
+import re
+import unicodedata
+from typing import List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Bump when compile_rules changes; the backfill then recompiles every pack
+RULES_VERSION = 1
+
+# Operators recognised anywhere in the text, by the spellings staff use
+KNOWN_OPERATORS = {
+    "movistar": ["movistar", "telefonica"],
+    "vodafone": ["vodafone"],
+    "orange": ["orange", "amena"],
+    "yoigo": ["yoigo"],
+    "masmovil": ["masmovil", "mas movil"],
+    "jazztel": ["jazztel"],
+    "pepephone": ["pepephone"],
+    "simyo": ["simyo"],
+    "lowi": ["lowi"],
+    "digi": ["digi", "digi mobil"],
+    "o2": ["o2"],
+    "finetwork": ["finetwork"],
+    "euskaltel": ["euskaltel"],
+    "telecable": ["telecable"],
+    "virgintelco": ["virgin", "virgin telco"],
+    "lebara": ["lebara"],
+    "llamaya": ["llamaya"],
+    "avatel": ["avatel"],
+    "adamo": ["adamo"],
+}
+
+# "... que vienen de Digi y Lowi", "portabilidad desde Orange", ...
+ORIGIN_PHRASE = re.compile(r"\b(?:vienen|vengan|procedentes|procedan|clientes|portabilidad|portados?)\s+(?:de|desde)\s+([^.;:()\n]+)"
+                           r"|\bdesde\s+([^.;:()\n]+)")
+LIST_SEPARATOR = re.compile(r",|/|\s+(?:y|e|o|u)\s+")
+# Where a company name in such a phrase ends ("de Movistar con permanencia")
+NAME_END = re.compile(r"\s+(?:con|sin|que|para|en|durante|hasta|a partir)\b.*", re.IGNORECASE)
+
+
+def plain_words(text: str) -> str:
+    """Lowercase, unaccented, alphanumeric words separated by single spaces"""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def origin_key(company: Optional[str]) -> Optional[str]:
+    """
+    "MásMóvil", "Mas Movil", "masmovil" -> "masmovil".
+
+    The form origin companies are compared in, on packs and on requests.
+    """
+    if not company:
+        return None
+    return plain_words(company).replace(" ", "") or None
+
+
+def origins(text: Optional[str]) -> List[str]:
+    """Origin keys a restriction or observation text names, sorted"""
+    if not text:
+        return []
+    found = set()
+    for match in ORIGIN_PHRASE.finditer(text):
+        for item in LIST_SEPARATOR.split(match.group(1) or match.group(2)):
+            key = origin_key(NAME_END.sub("", item))
+            if key:
+                found.add(key)
+    words = f" {plain_words(text)} "
+    for key, spellings in KNOWN_OPERATORS.items():
+        if any(f" {spelling} " in words for spelling in spellings):
+            found.add(key)
+    return sorted(found)
+
+
+def compile_rules(restrictions: Optional[str], observations: Optional[str]) -> dict:
+    """
+    The fields stored next to a pack's texts:
+
+    - allowed_origins: origin keys the pack is limited to by a "Solo ..."
+      restriction ("Solo clientes que vienen de Digi" -> ["digi"]), or None
+      when anyone can have it
+    - bonus_origins: origin keys its observations single out
+      ("Especial portabilidad desde Vodafone" -> ["vodafone"])
+    """
+    allowed = None
+    if restrictions and "solo" in plain_words(restrictions).split():
+        allowed = origins(restrictions)
+        if not allowed:
+            logger.warning("Pack restriction names no origin company, nobody qualifies: %r", restrictions)
+    return {
+        "allowed_origins": allowed,
+        "bonus_origins": origins(observations),
+        "rules_version": RULES_VERSION,
+    }
+
+
+def with_rules(doc: dict) -> dict:
+    """`doc` with its rules compiled, unless they are already current"""
+    if doc.get("rules_version") == RULES_VERSION:
+        return doc
+    return {**doc, **compile_rules(doc.get("restrictions"), doc.get("observations"))}
+
+
+class PackRules:
+    """Compiles the rules of packs stored before (or by an older version of) compile_rules"""
+
+    def __init__(self, db, batch_size: int = 500):
+        self.db = db
+        self.batch_size = batch_size
+        self.status = "pending"
+        self.compiled = 0
+
+    async def backfill(self):
+        state_id = f"pack_rules_v{RULES_VERSION}"
+        try:
+            state = await self.db.migrations.find_one({"id": state_id}, {"_id": 0})
+            if state and state.get("status") == "complete":
+                self.status = "complete"
+                return
+            self.status = "running"
+            last_id = None
+            while True:
+                query = {"rules_version": {"$ne": RULES_VERSION}}
+                if last_id is not None:
+                    query["_id"] = {"$gt": last_id}
+                docs = await self.db.packs.find(
+                    query, {"_id": 1, "restrictions": 1, "observations": 1}
+                ).sort("_id", 1).to_list(self.batch_size)
+                if not docs:
+                    break
+                last_id = docs[-1]["_id"]
+                operations = [
+                    # Only applies if the texts did not change meanwhile
+                    UpdateOne(
+                        {"_id": doc["_id"], "restrictions": doc.get("restrictions"), "observations": doc.get("observations")},
+                        {"$set": compile_rules(doc.get("restrictions"), doc.get("observations"))}
+                    )
+                    for doc in docs
+                ]
+                result = await self.db.packs.bulk_write(operations, ordered=False)
+                self.compiled += result.modified_count
+            await self.db.migrations.update_one(
+                {"id": state_id},
+                {"$set": {"status": "complete", "compiled": self.compiled}},
+                upsert=True
+            )
+            self.status = "complete"
+        except Exception:
+            # Retried on the next startup
+            logger.exception("Pack rules backfill failed")
+            self.status = "failed"
+
+    def stats(self) -> dict:
+        return {
+            "status": self.status,
+            "version": RULES_VERSION,
+            "compiled": self.compiled,
+        }
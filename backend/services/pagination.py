@@ -0,0 +1,103 @@
+"""
+Keyset pagination - opaque cursors over (sort field, id)
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from .dates import as_datetime
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Keyset:
+    """
+    One page of `collection` ordered by (`field`, id), `direction` for both.
+
+    The cursor holds the (field, id) of the last document returned; the next
+    page is whatever sorts strictly after it, so pages stay consistent while
+    documents are inserted and cost the same however deep they are, given an
+    index on the query's equality fields followed by (field, id).
+
+    Documents without a value (null or missing) sort below every value, as
+    in BSON: last in a descending walk, first in an ascending one.
+
+    `dual_read` covers date fields that may still hold legacy ISO strings:
+    BSON orders every string before every date, so a descending page that
+    ends on a date continues into the strings (and an ascending one that ends
+    on a string continues into the dates).
+    """
+
+    def __init__(self, field: str, direction: int = -1, dual_read=None):
+        self.field = field
+        self.direction = direction
+        self.dual_read = dual_read
+
+    def encode(self, doc: dict) -> str:
+        value = doc.get(self.field)
+        kind = "d" if isinstance(value, datetime) else "s"
+        if kind == "d":
+            value = as_datetime(value).isoformat()
+        payload = json.dumps({"f": self.field, "k": kind, "v": value, "id": doc["id"]}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode(self, cursor: str) -> Tuple[Any, str]:
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if payload["f"] != self.field or not isinstance(payload["id"], str):
+                raise InvalidCursor(cursor)
+            value = payload["v"]
+            if payload["k"] == "d":
+                value = as_datetime(value)
+            return value, payload["id"]
+        except (binascii.Error, ValueError, KeyError, TypeError, UnicodeDecodeError):
+            raise InvalidCursor(cursor)
+
+    def after(self, cursor: str) -> dict:
+        """Query fragment for the documents sorting after `cursor`"""
+        value, last_id = self.decode(cursor)
+        op = "$lt" if self.direction < 0 else "$gt"
+        clauses = [
+            {self.field: {op: value}},
+            {self.field: value, "id": {op: last_id}},
+        ]
+        # Range operators never match null, so the nulls still ahead are added explicitly
+        if self.direction < 0 and value is not None:
+            clauses.append({self.field: None})
+        elif self.direction > 0 and value is None:
+            clauses.append({self.field: {"$ne": None}})
+        if self.dual_read is not None and self.dual_read():
+            if self.direction < 0 and isinstance(value, datetime):
+                clauses.append({self.field: {"$type": "string"}})
+            elif self.direction > 0 and isinstance(value, str):
+                clauses.append({self.field: {"$type": "date"}})
+        return {"$or": clauses}
+
+    async def page(self, collection, query: dict, projection: dict, limit: int = DEFAULT_LIMIT,
+                   cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Up to `limit` documents and the cursor of the next page (None on the last one)"""
+        limit = max(1, min(limit, MAX_LIMIT))
+        if cursor:
+            query = {"$and": [query, self.after(cursor)]} if query else self.after(cursor)
+        # The cursor is built from the sort field and id, fetched even if not selected
+        inclusion = any(value for field, value in projection.items() if field != "_id")
+        added = [field for field in (self.field, "id") if inclusion and not projection.get(field)]
+        if added:
+            projection = {**projection, **{field: 1 for field in added}}
+        docs = await collection.find(query, projection).sort(
+            [(self.field, self.direction), ("id", self.direction)]
+        ).limit(limit + 1).to_list(limit + 1)
+        next_cursor = self.encode(docs[limit - 1]) if len(docs) > limit else None
+        docs = docs[:limit]
+        for doc in docs:
+            for field in added:
+                doc.pop(field, None)
+        return docs, next_cursor
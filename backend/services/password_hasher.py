@@ -0,0 +1,223 @@
+"""
+Password hashing service - runs bcrypt on a bounded worker pool
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+from passlib.hash import bcrypt
+
+logger = logging.getLogger(__name__)
+
+# Deliberately weak cost (bcrypt's minimum) used ONLY for demo/test accounts
+# created by seed_demo_data, so seeding is not dominated by hashing
+DEMO_BCRYPT_ROUNDS = 4
+
+# passlib's bcrypt default, used until calibration has run
+DEFAULT_BCRYPT_ROUNDS = 12
+
+# Cost measured during calibration; each extra round doubles the work
+_CALIBRATION_ROUNDS = 8
+_CALIBRATION_SAMPLES = 3
+
+
+class PasswordHasherUnavailable(Exception):
+    """Raised when the hashing pool cannot take or finish a job in time"""
+
+
+class PasswordHasherBusy(PasswordHasherUnavailable):
+    """The pool queue is full"""
+
+
+class PasswordHasherTimeout(PasswordHasherUnavailable):
+    """A hashing job did not finish within the per-call timeout"""
+
+
+class PasswordHasher:
+    """
+    Runs passlib bcrypt hashing/verification off the event loop.
+
+    bcrypt releases the GIL while it works, so a small thread pool keeps the
+    event loop free without the cost of a process pool. The number of jobs
+    admitted at once (running + queued) is capped at max_workers + max_queue;
+    anything beyond that is rejected immediately instead of piling up.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 32, timeout: float = 5.0,
+                 rounds: Optional[int] = None, target_ms: float = 250.0,
+                 min_rounds: int = 10, max_rounds: int = 14):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.target_ms = target_ms
+        self.min_rounds = min_rounds
+        self.max_rounds = max_rounds
+        # An explicit cost disables calibration
+        self.fixed_rounds = rounds
+        self.rounds = rounds or DEFAULT_BCRYPT_ROUNDS
+        self.calibrated_ms: Optional[float] = None
+        self._context = self._build_context(self.rounds, enforce_policy=rounds is not None)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._submitted = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._errors = 0
+        self._total_run_seconds = 0.0
+        self._max_run_seconds = 0.0
+        self._total_wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "PasswordHasher":
+        """Build a hasher from BCRYPT_POOL_SIZE / BCRYPT_QUEUE_LIMIT / BCRYPT_TIMEOUT_SECONDS"""
+        default_workers = max(1, min(4, (os.cpu_count() or 1)))
+        rounds = os.environ.get("BCRYPT_ROUNDS")
+        return cls(
+            max_workers=int(os.environ.get("BCRYPT_POOL_SIZE", default_workers)),
+            max_queue=int(os.environ.get("BCRYPT_QUEUE_LIMIT", 32)),
+            timeout=float(os.environ.get("BCRYPT_TIMEOUT_SECONDS", 5.0)),
+            rounds=int(rounds) if rounds else None,
+            target_ms=float(os.environ.get("BCRYPT_TARGET_MS", 250)),
+            min_rounds=int(os.environ.get("BCRYPT_MIN_ROUNDS", 10)),
+            max_rounds=int(os.environ.get("BCRYPT_MAX_ROUNDS", 14)),
+        )
+
+    @staticmethod
+    def _build_context(rounds: int, enforce_policy: bool) -> CryptContext:
+        settings = {"bcrypt__default_rounds": rounds}
+        if enforce_policy:
+            # Hashes whose cost is outside [rounds, rounds + 1] need an update
+            settings.update(bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds + 1)
+        return CryptContext(schemes=["bcrypt"], deprecated="auto", **settings)
+
+    async def calibrate(self) -> int:
+        """
+        Pick the bcrypt cost that takes about target_ms on this machine.
+
+        A cheap cost is timed on the pool and extrapolated (the work doubles
+        with every round), then clamped to [min_rounds, max_rounds]. From then
+        on stored hashes with a different cost are reported by needs_update().
+        """
+        if self.fixed_rounds is None:
+            samples = [await self._submit(self._time_hash, _CALIBRATION_ROUNDS) for _ in range(_CALIBRATION_SAMPLES)]
+            measured_ms = min(samples)
+            extra_rounds = math.floor(math.log2(self.target_ms / measured_ms)) if measured_ms > 0 else 0
+            self.rounds = max(self.min_rounds, min(self.max_rounds, _CALIBRATION_ROUNDS + extra_rounds))
+            self.calibrated_ms = round(measured_ms * 2 ** (self.rounds - _CALIBRATION_ROUNDS), 1)
+            logger.info(
+                "bcrypt calibrated: %d rounds (~%.0f ms, target %.0f ms)",
+                self.rounds, self.calibrated_ms, self.target_ms
+            )
+        self._context = self._build_context(self.rounds, enforce_policy=True)
+        return self.rounds
+
+    @staticmethod
+    def _time_hash(rounds: int) -> float:
+        started_at = time.perf_counter()
+        bcrypt.using(rounds=rounds).hash("calibration")
+        return (time.perf_counter() - started_at) * 1000
+
+    async def hash(self, password: str, rounds: Optional[int] = None) -> str:
+        """Hash with the current policy, or with an explicit cost (demo accounts)"""
+        if rounds is not None:
+            return await self._submit(bcrypt.using(rounds=rounds).hash, password)
+        return await self._submit(self._context.hash, password)
+
+    def needs_update(self, hashed: str) -> bool:
+        """Whether a stored hash is out of the current cost policy (cheap, no hashing)"""
+        return self._context.needs_update(hashed)
+
+    async def verify(self, plain: str, hashed: str) -> bool:
+        return await self._submit(self._context.verify, plain, hashed)
+
+    async def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise PasswordHasherBusy("Password hashing queue is full")
+            self._pending += 1
+            self._submitted += 1
+
+        # The slot is released when the job really ends (or is cancelled
+        # before starting), not when the caller stops waiting for it.
+        job = self._executor.submit(self._run, fn, time.perf_counter(), *args)
+        job.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(job), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timeouts += 1
+            raise PasswordHasherTimeout("Password hashing timed out")
+
+    def _release(self, job):
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self, fn, enqueued_at: float, *args):
+        started_at = time.perf_counter()
+        with self._lock:
+            wait = started_at - enqueued_at
+            self._total_wait_seconds += wait
+            self._max_wait_seconds = max(self._max_wait_seconds, wait)
+            self._running += 1
+        failed = False
+        try:
+            return fn(*args)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started_at
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._errors += failed
+                self._total_run_seconds += elapsed
+                self._max_run_seconds = max(self._max_run_seconds, elapsed)
+
+    def stats(self) -> dict:
+        completed = self._completed or 1
+        return {
+            "rounds": self.rounds,
+            "calibrated_ms": self.calibrated_ms,
+            "target_ms": self.target_ms,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "timeout_seconds": self.timeout,
+            "pending": self._pending,
+            "running": self._running,
+            "queued": max(0, self._pending - self._running),
+            "submitted": self._submitted,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "timeouts": self._timeouts,
+            "errors": self._errors,
+            "avg_run_ms": round(self._total_run_seconds / completed * 1000, 2),
+            "max_run_ms": round(self._max_run_seconds * 1000, 2),
+            "avg_wait_ms": round(self._total_wait_seconds / completed * 1000, 2),
+            "max_wait_ms": round(self._max_wait_seconds * 1000, 2),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_default_hasher: Optional[PasswordHasher] = None
+
+
+def get_password_hasher() -> PasswordHasher:
+    """Process-wide hasher, created on first use"""
+    global _default_hasher
+    if _default_hasher is None:
+        _default_hasher = PasswordHasher.from_env()
+    return _default_hasher
@@ -0,0 +1,127 @@
+"""
+Phone keys - canonical E.164 form of client phones, used to dedupe clients
+"""
+import logging
+import re
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COUNTRY_CODE = "34"
+NATIONAL_NUMBER_LENGTH = 9
+
+
+def phone_key(phone: Optional[str], country_code: str = DEFAULT_COUNTRY_CODE) -> Optional[str]:
+    """
+    "+34 600 000 001", "0034600000001", "600-000-001" -> "+34600000001".
+
+    Numbers without an international prefix are taken as national numbers of
+    `country_code`; anything else keeps its digits behind a "+".
+    """
+    if not phone:
+        return None
+    phone = phone.strip()
+    digits = re.sub(r"\D", "", phone)
+    if not digits:
+        return None
+    if phone.startswith("+"):
+        return f"+{digits}"
+    if digits.startswith("00"):
+        return f"+{digits[2:]}"
+    if len(digits) == NATIONAL_NUMBER_LENGTH:
+        return f"+{country_code}{digits}"
+    return f"+{digits}"
+
+
+class ClientPhoneKeys:
+    """
+    Assigns `phone_key` to clients stored before it existed.
+
+    The key has a unique index, so only one client can hold it: the first one
+    (by insertion order) keeps it and later ones are marked `duplicate_of`
+    with the holder's id instead, to be merged by hand.
+    """
+
+    def __init__(self, db, batch_size: int = 500, version: int = 1):
+        self.db = db
+        self.batch_size = batch_size
+        self.version = version
+        self.status = "pending"
+        self.assigned = 0
+        self.duplicates = 0
+
+    async def claim(self, docs: List[dict]):
+        """Set phone_key (or duplicate_of) on client documents about to be written"""
+        keys = {doc["id"]: phone_key(doc.get("phone")) for doc in docs}
+        wanted = [key for key in keys.values() if key]
+        holders: Dict[str, str] = {}
+        if wanted:
+            async for holder in self.db.clients.find({"phone_key": {"$in": wanted}}, {"_id": 0, "id": 1, "phone_key": 1}):
+                holders[holder["phone_key"]] = holder["id"]
+        for doc in docs:
+            key = keys[doc["id"]]
+            if not key:
+                continue
+            holder = holders.setdefault(key, doc["id"])
+            if holder == doc["id"]:
+                doc["phone_key"] = key
+            else:
+                doc["duplicate_of"] = holder
+
+    async def backfill(self):
+        state_id = f"client_phone_keys_v{self.version}"
+        try:
+            state = await self.db.migrations.find_one({"id": state_id}, {"_id": 0})
+            if state and state.get("status") == "complete":
+                self.status = "complete"
+                return
+            self.status = "running"
+            last_id = None
+            while True:
+                query = {"phone_key": {"$exists": False}, "duplicate_of": {"$exists": False}}
+                if last_id is not None:
+                    query["_id"] = {"$gt": last_id}
+                docs = await self.db.clients.find(query, {"_id": 1, "id": 1, "phone": 1}).sort("_id", 1).to_list(self.batch_size)
+                if not docs:
+                    break
+                last_id = docs[-1]["_id"]
+                await self._assign(docs)
+            await self.db.migrations.update_one(
+                {"id": state_id},
+                {"$set": {"status": "complete", "assigned": self.assigned, "duplicates": self.duplicates}},
+                upsert=True
+            )
+            self.status = "complete"
+        except Exception:
+            # Retried on the next startup
+            logger.exception("Phone key backfill failed")
+            self.status = "failed"
+
+    async def _assign(self, docs: List[dict]):
+        await self.claim(docs)
+        operations = []
+        for doc in docs:
+            update = {field: doc[field] for field in ("phone_key", "duplicate_of") if field in doc}
+            if update:
+                # Only applies if the phone did not change meanwhile
+                operations.append(UpdateOne({"_id": doc["_id"], "phone": doc.get("phone")}, {"$set": update}))
+                self.duplicates += "duplicate_of" in update
+        if not operations:
+            return
+        try:
+            result = await self.db.clients.bulk_write(operations, ordered=False)
+            self.assigned += result.modified_count
+        except BulkWriteError as e:
+            # A client created meanwhile took the key; left for the next run
+            self.assigned += e.details.get("nModified", 0)
+            logger.warning("Phone key backfill: %d conflicting writes", len(e.details.get("writeErrors", [])))
+
+    def stats(self) -> dict:
+        return {
+            "status": self.status,
+            "assigned": self.assigned,
+            "duplicates": self.duplicates,
+        }
@@ -0,0 +1,143 @@
+"""
+Sliding-window rate limiting with pluggable storage backends
+"""
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional, Tuple
+
+
+class LimiterBackend(ABC):
+    """Storage for the timestamps of hits under a key"""
+
+    @abstractmethod
+    async def window(self, key: str, since: float) -> Tuple[int, Optional[float]]:
+        """Number of hits after `since` and the oldest of them"""
+
+    @abstractmethod
+    async def add(self, key: str, at: float, window: float):
+        """Records a hit at `at`, kept for at least `window` seconds"""
+
+    @abstractmethod
+    async def reset(self, key: str):
+        """Forgets every hit under `key`"""
+
+
+class InMemoryLimiterBackend(LimiterBackend):
+    """Per-process backend; keeps at most `max_keys` keys (least recently hit evicted)"""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._hits: "OrderedDict[str, deque]" = OrderedDict()
+
+    async def window(self, key: str, since: float) -> Tuple[int, Optional[float]]:
+        hits = self._hits.get(key)
+        if not hits:
+            return 0, None
+        while hits and hits[0] <= since:
+            hits.popleft()
+        if not hits:
+            del self._hits[key]
+            return 0, None
+        return len(hits), hits[0]
+
+    async def add(self, key: str, at: float, window: float):
+        hits = self._hits.get(key)
+        if hits is None:
+            hits = self._hits[key] = deque()
+        hits.append(at)
+        self._hits.move_to_end(key)
+        while len(self._hits) > self.max_keys:
+            self._hits.popitem(last=False)
+
+    async def reset(self, key: str):
+        self._hits.pop(key, None)
+
+
+class MongoLimiterBackend(LimiterBackend):
+    """
+    Backend shared by every worker, stored in a Mongo collection.
+
+    Each hit is one small document; a TTL index on `expires_at` removes
+    them once they can no longer affect any window.
+    """
+
+    def __init__(self, db, collection: str = "rate_limit_hits"):
+        self.db = db
+        self.collection = collection
+
+    async def window(self, key: str, since: float) -> Tuple[int, Optional[float]]:
+        query = {"key": key, "at": {"$gt": since}}
+        count = await self.db[self.collection].count_documents(query)
+        if not count:
+            return 0, None
+        oldest = await self.db[self.collection].find_one(query, {"_id": 0, "at": 1}, sort=[("at", 1)])
+        return count, oldest["at"] if oldest else None
+
+    async def add(self, key: str, at: float, window: float):
+        await self.db[self.collection].insert_one({
+            "key": key,
+            "at": at,
+            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=window)
+        })
+
+    async def reset(self, key: str):
+        await self.db[self.collection].delete_many({"key": key})
+
+
+class SlidingWindowLimiter:
+    """
+    Limits hits per dimension (e.g. email and client IP) over a sliding window.
+
+    `limits` maps a dimension name to (max_hits, window_seconds). A request is
+    refused while any of its keys already has max_hits inside the window.
+    """
+
+    def __init__(self, name: str, backend: LimiterBackend, limits: Dict[str, Tuple[int, float]]):
+        self.name = name
+        self.backend = backend
+        self.limits = limits
+        self.checked = 0
+        self.rejected = 0
+        self.rejected_by = {dimension: 0 for dimension in limits}
+
+    def _key(self, dimension: str, value: str) -> str:
+        return f"{self.name}:{dimension}:{value.lower()}"
+
+    async def retry_after(self, **keys: Optional[str]) -> float:
+        """Seconds until the request would be admitted (0 when admitted now)"""
+        self.checked += 1
+        now = time.time()
+        wait = 0.0
+        for dimension, value in keys.items():
+            if not value:
+                continue
+            max_hits, window = self.limits[dimension]
+            count, oldest = await self.backend.window(self._key(dimension, value), now - window)
+            if count >= max_hits:
+                self.rejected_by[dimension] += 1
+                wait = max(wait, (oldest or now) + window - now)
+        if wait > 0:
+            self.rejected += 1
+        return wait
+
+    async def hit(self, **keys: Optional[str]):
+        now = time.time()
+        for dimension, value in keys.items():
+            if value:
+                await self.backend.add(self._key(dimension, value), now, self.limits[dimension][1])
+
+    async def reset(self, **keys: Optional[str]):
+        for dimension, value in keys.items():
+            if value:
+                await self.backend.reset(self._key(dimension, value))
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "limits": {d: {"max_hits": m, "window_seconds": w} for d, (m, w) in self.limits.items()},
+            "checked": self.checked,
+            "rejected": self.rejected,
+            "rejected_by": dict(self.rejected_by),
+        }
@@ -0,0 +1,59 @@
+"""
+Trusted serialization - JSON for documents read from our own collections, without revalidation
+"""
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple, Type
+
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined, to_json
+
+from .dates import as_datetime
+
+_MISSING = object()
+
+
+class TrustedSerializer:
+    """
+    Serializes a list of `model` documents as FastAPI would, minus validation.
+
+    Documents come from collections only the API writes, already in the
+    model's shape, so each one is reduced to the model's fields (missing ones
+    get the model default, unknown keys are dropped) and the list is dumped by
+    pydantic-core in one call. The only coercion kept is for legacy ISO-string
+    dates still awaiting the date migration.
+    """
+
+    def __init__(self, model: Type[BaseModel], date_fields: Sequence[str] = ()):
+        self.model = model
+        self.date_fields = tuple(field for field in date_fields if field in model.model_fields)
+        # (field, default, default_factory), resolved once per model
+        self.fields: List[Tuple[str, Any, Optional[Callable]]] = []
+        for name, info in model.model_fields.items():
+            default = _MISSING if info.default is PydanticUndefined else info.default
+            self.fields.append((name, default, info.default_factory))
+
+    def rows(self, docs: Iterable[dict]) -> List[dict]:
+        rows = []
+        for doc in docs:
+            row = {}
+            for name, default, factory in self.fields:
+                value = doc.get(name, _MISSING)
+                if value is _MISSING:
+                    if factory is not None:
+                        value = factory()
+                    elif default is _MISSING:
+                        continue
+                    else:
+                        value = default
+                row[name] = value
+            for field in self.date_fields:
+                value = row.get(field)
+                if isinstance(value, str):
+                    try:
+                        row[field] = as_datetime(value)
+                    except ValueError:
+                        pass
+            rows.append(row)
+        return rows
+
+    def dump_json(self, docs: Iterable[dict]) -> bytes:
+        return to_json(self.rows(docs))
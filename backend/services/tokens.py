@@ -0,0 +1,124 @@
+"""
+Access tokens - single JWT issuer/verifier shared by the whole backend
+"""
+import os
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Optional
+
+import jwt
+
+from .ttl_cache import TTLCache
+
+DEFAULT_SECRET_KEY = "hipnotik-level-stand-secret-key-2025"
+ALGORITHM = "HS256"
+
+# Claims every self-contained token carries; tokens missing any of them
+# (issued before claims were embedded) are treated as legacy tokens
+PRINCIPAL_CLAIMS = ("sub", "email", "name", "role", "lang", "ver")
+
+
+class InvalidTokenError(Exception):
+    """The token is malformed, has a bad signature or has expired"""
+
+
+class ExpiredTokenError(InvalidTokenError):
+    """The token signature is valid but it has expired"""
+
+
+class RevokedTokenError(InvalidTokenError):
+    """The token was issued before the user's current token_version"""
+
+
+def resolve_secret_key() -> str:
+    """SECRET_KEY, falling back to the legacy JWT_SECRET variable"""
+    return os.environ.get("SECRET_KEY") or os.environ.get("JWT_SECRET") or DEFAULT_SECRET_KEY
+
+
+class TokenService:
+    """Issues and verifies HS256 access tokens that embed the user's principal"""
+
+    def __init__(self, secret_key: str, expire_minutes: int = 60 * 24, algorithm: str = ALGORITHM):
+        self.secret_key = secret_key
+        self.expire_minutes = expire_minutes
+        self.algorithm = algorithm
+        self._algorithms = [algorithm]
+        self._decode_options = {"require": ["exp", "sub"]}
+
+    def issue(self, user: dict, token_version: int = 0) -> str:
+        """Create a token for a user document (or model dump)"""
+        now = datetime.now(timezone.utc)
+        claims = {
+            "sub": user["id"],
+            "email": user["email"],
+            "name": user["name"],
+            "role": user["role"],
+            "lang": user.get("language", "es"),
+            "ver": token_version,
+            "iat": now,
+            "exp": now + timedelta(minutes=self.expire_minutes),
+        }
+        return jwt.encode(claims, self.secret_key, algorithm=self.algorithm)
+
+    def encode(self, data: dict) -> str:
+        """Create a token from arbitrary claims (legacy {"sub": ...} tokens)"""
+        to_encode = data.copy()
+        to_encode["exp"] = datetime.now(timezone.utc) + timedelta(minutes=self.expire_minutes)
+        return jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        try:
+            return jwt.decode(token, self.secret_key, algorithms=self._algorithms, options=self._decode_options)
+        except jwt.ExpiredSignatureError:
+            raise ExpiredTokenError("Token expired")
+        except jwt.InvalidTokenError:
+            raise InvalidTokenError("Invalid token")
+
+    @staticmethod
+    def is_self_contained(payload: dict) -> bool:
+        return all(claim in payload for claim in PRINCIPAL_CLAIMS)
+
+
+class TokenVerifier:
+    """
+    Verifies access tokens without loading the user document.
+
+    Self-contained tokens are trusted once their signature is valid and their
+    `ver` claim matches the user's current token_version. Versions come from
+    `load_version` (which must return -1 for users that no longer exist) and
+    are kept in a small TTL cache, so revocation by bumping the version takes
+    effect immediately in this process and within the TTL everywhere else.
+    """
+
+    def __init__(self, tokens: TokenService, load_version: Callable[[str], Awaitable[int]], versions: TTLCache):
+        self.tokens = tokens
+        self.load_version = load_version
+        self.versions = versions
+
+    async def verify(self, token: str) -> dict:
+        payload = self.tokens.decode(token)
+        if not self.tokens.is_self_contained(payload):
+            return payload
+
+        user_id = payload["sub"]
+        current = self.versions.get(user_id)
+        if current is None:
+            current = await self.load_version(user_id)
+            self.versions.set(user_id, current)
+        if payload["ver"] != current:
+            raise RevokedTokenError("Token revoked")
+        return payload
+
+    def forget(self, user_id: str):
+        """Drop the cached version of a user after bumping it"""
+        self.versions.invalidate(user_id)
+
+
+_default_service: Optional[TokenService] = None
+
+
+def get_token_service() -> TokenService:
+    """Process-wide token service, created on first use"""
+    global _default_service
+    if _default_service is None:
+        _default_service = TokenService(resolve_secret_key())
+    return _default_service
@@ -0,0 +1,14 @@
+import React from 'react';
+import { Button } from './ui/button';
+
+// "Load more" under a paged list; hidden once the last page is loaded
+export const LoadMore = ({ hasMore, loading, onClick }) => {
+  if (!hasMore) return null;
+  return (
+    <div className="flex justify-center p-4">
+      <Button data-testid="load-more-button" variant="outline" onClick={onClick} disabled={loading}>
+        {loading ? 'Cargando...' : 'Cargar más'}
+      </Button>
+    </div>
+  );
+};
@@ -39,7 +39,7 @@ export const SaleForm = ({ onSuccess, onCancel, preloadData = null }) => {
 
   const fetchPacks = async () => {
     try {
-      const response = await axios.get(`${API_URL}/packs?active_only=true`);
+      const response = await axios.get(`${API_URL}/packs`, { params: { active_only: true, limit: 500 } });
       setPacks(response.data);
     } catch (error) {
       console.error('Error fetching packs:', error);
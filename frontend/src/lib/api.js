@@ -0,0 +1,30 @@
+import axios from 'axios';
+
+const API_URL = process.env.REACT_APP_BACKEND_URL + '/api';
+
+// One page of a list endpoint: its items and the cursor of the next page,
+// read from X-Next-Cursor (null on the last page). Pages are fetched as the
+// user asks for them, so a list costs the same however long it grows.
+export async function getPage(url, { params = {}, cursor = null, ...config } = {}) {
+  const response = await axios.get(url, { ...config, params: { ...params, ...(cursor ? { cursor } : {}) } });
+  return { items: response.data, nextCursor: response.headers['x-next-cursor'] || null };
+}
+
+// Name and phone of the clients with these ids, keyed by id: one request
+// for the clients shown on a page of sales or incidents.
+export async function getClientsById(ids) {
+  const wanted = [...new Set(ids.filter(Boolean))];
+  if (wanted.length === 0) return {};
+  const response = await axios.get(`${API_URL}/clients`, {
+    params: { id: wanted.join(','), fields: 'picker', limit: wanted.length }
+  });
+  const clients = {};
+  response.data.forEach(c => clients[c.id] = c);
+  return clients;
+}
+
+// Clients matching a search, for pickers (name and phone only)
+export async function searchClients(search, limit = 20) {
+  const response = await axios.get(`${API_URL}/clients`, { params: { search, fields: 'picker', limit } });
+  return response.data;
+}
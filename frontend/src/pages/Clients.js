@@ -12,6 +12,8 @@ import { Textarea } from '../components/ui/textarea';
 import { Search, Edit2, Save, X, User, Phone, Mail, MapPin, FileText, ShoppingBag, AlertCircle, Star, CreditCard, ChevronRight } from 'lucide-react';
 import { toast } from 'sonner';
 import axios from 'axios';
+import { getPage } from '../lib/api';
+import { LoadMore } from '../components/LoadMore';
 
 const API_URL = process.env.REACT_APP_BACKEND_URL + '/api';
 
@@ -20,6 +22,8 @@ const Clients = () => {
   const [clients, setClients] = useState([]);
   const [search, setSearch] = useState('');
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedClient, setSelectedClient] = useState(null);
   const [clientSalesData, setClientSalesData] = useState({ sales: [], total_score: 0, sales_count: 0 });
   const [clientIncidents, setClientIncidents] = useState([]);
@@ -33,9 +37,9 @@ const Clients = () => {
   const fetchClients = async (searchQuery = '') => {
     try {
       setLoading(true);
-      const url = searchQuery ? `${API_URL}/clients?search=${searchQuery}` : `${API_URL}/clients`;
-      const response = await axios.get(url);
-      setClients(response.data);
+      const page = await getPage(`${API_URL}/clients`, searchQuery ? { params: { search: searchQuery } } : {});
+      setClients(page.items);
+      setNextCursor(page.nextCursor);
     } catch (error) {
       console.error('Error fetching clients:', error);
       toast.error('Error al cargar clientes');
@@ -44,6 +48,20 @@ const Clients = () => {
     }
   };
 
+  const loadMoreClients = async () => {
+    try {
+      setLoadingMore(true);
+      const page = await getPage(`${API_URL}/clients`, { cursor: nextCursor });
+      setClients(current => [...current, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error('Error fetching clients:', error);
+      toast.error('Error al cargar clientes');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleSearch = (e) => {
     e.preventDefault();
     fetchClients(search);
@@ -65,11 +83,11 @@ const Clients = () => {
     try {
       const [salesRes, incidentsRes] = await Promise.all([
         axios.get(`${API_URL}/clients/${client.id}/sales`),
-        axios.get(`${API_URL}/incidents`)
+        axios.get(`${API_URL}/incidents`, { params: { client_id: client.id } })
       ]);
       
       setClientSalesData(salesRes.data);
-      setClientIncidents(incidentsRes.data.filter(i => i.client_id === client.id));
+      setClientIncidents(incidentsRes.data);
     } catch (error) {
       console.error('Error fetching client details:', error);
     }
@@ -191,6 +209,7 @@ const Clients = () => {
                 <p className="text-slate-500">No se encontraron clientes</p>
               </div>
             )}
+            <LoadMore hasMore={!!nextCursor} loading={loadingMore} onClick={loadMoreClients} />
           </Card>
         )}
 
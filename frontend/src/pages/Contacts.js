@@ -10,6 +10,8 @@ import { Textarea } from '../components/ui/textarea';
 import { Plus, Phone, Mail, MessageCircle, Trash2 } from 'lucide-react';
 import { toast } from 'sonner';
 import axios from 'axios';
+import { getPage } from '../lib/api';
+import { LoadMore } from '../components/LoadMore';
 
 const API_URL = process.env.REACT_APP_BACKEND_URL + '/api';
 
@@ -27,14 +29,18 @@ const Contacts = () => {
     notes: ''
   });
 
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
   useEffect(() => {
     fetchContacts();
   }, []);
 
   const fetchContacts = async () => {
     try {
-      const response = await axios.get(`${API_URL}/contacts`);
-      setContacts(response.data);
+      const page = await getPage(`${API_URL}/contacts`);
+      setContacts(page.items);
+      setNextCursor(page.nextCursor);
     } catch (error) {
       console.error('Error fetching contacts:', error);
       toast.error('Error al cargar contactos');
@@ -43,6 +49,20 @@ const Contacts = () => {
     }
   };
 
+  const loadMoreContacts = async () => {
+    try {
+      setLoadingMore(true);
+      const page = await getPage(`${API_URL}/contacts`, { cursor: nextCursor });
+      setContacts(current => [...current, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error('Error fetching contacts:', error);
+      toast.error('Error al cargar contactos');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     try {
@@ -154,6 +174,8 @@ const Contacts = () => {
           </div>
         )}
 
+        {!loading && <LoadMore hasMore={!!nextCursor} loading={loadingMore} onClick={loadMoreContacts} />}
+
         {!loading && contacts.length === 0 && (
           <div className="text-center py-12">
             <p className="text-slate-500">No hay contactos registrados</p>
@@ -20,6 +20,7 @@ import {
 } from 'lucide-react';
 import { toast } from 'sonner';
 import axios from 'axios';
+import { getPage } from '../lib/api';
 
 const API_URL = process.env.REACT_APP_BACKEND_URL + '/api';
 
@@ -42,8 +43,9 @@ const Fichajes = () => {
 
   const fetchMyFichajes = async () => {
     try {
-      const response = await axios.get(`${API_URL}/fichajes`);
-      setMyFichajes(response.data);
+      // The newest page covers today's state and the last days shown
+      const page = await getPage(`${API_URL}/fichajes`);
+      setMyFichajes(page.items);
     } catch (error) {
       console.error('Error fetching fichajes:', error);
       toast.error('Error al cargar fichajes');
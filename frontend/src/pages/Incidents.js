@@ -26,6 +26,8 @@ import {
 } from 'lucide-react';
 import { toast } from 'sonner';
 import axios from 'axios';
+import { getPage, getClientsById, searchClients } from '../lib/api';
+import { LoadMore } from '../components/LoadMore';
 
 const API_URL = process.env.REACT_APP_BACKEND_URL + '/api';
 
@@ -42,6 +44,12 @@ const Incidents = () => {
   const [loading, setLoading] = useState(true);
   const [showDialog, setShowDialog] = useState(false);
   const [filterStatus, setFilterStatus] = useState(searchParams.get('status') || 'all');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  
+  // Client picker of the new incident dialog, served by the client search
+  const [clientSearch, setClientSearch] = useState('');
+  const [clientOptions, setClientOptions] = useState([]);
   
   // Detail sheet state
   const [showDetail, setShowDetail] = useState(false);
@@ -66,20 +74,33 @@ const Incidents = () => {
     fetchData();
   }, []);
 
+  useEffect(() => {
+    if (clientSearch.trim().length < 2) {
+      setClientOptions([]);
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        setClientOptions(await searchClients(clientSearch.trim()));
+      } catch (error) {
+        console.error('Error searching clients:', error);
+      }
+    }, 250);
+    return () => clearTimeout(timer);
+  }, [clientSearch]);
+
   const fetchData = async () => {
     try {
-      const [incidentsRes, clientsRes, rankingRes] = await Promise.all([
-        axios.get(`${API_URL}/incidents`),
-        axios.get(`${API_URL}/clients`),
+      const [incidentsPage, rankingRes] = await Promise.all([
+        getPage(`${API_URL}/incidents`),
         axios.get(`${API_URL}/dashboard/ranking`)
       ]);
       
-      setIncidents(incidentsRes.data);
+      setIncidents(incidentsPage.items);
+      setNextCursor(incidentsPage.nextCursor);
       setEmployees(rankingRes.data);
-      
-      const clientsMap = {};
-      clientsRes.data.forEach(c => clientsMap[c.id] = c);
-      setClients(clientsMap);
+      // Only the clients shown in the rows
+      setClients(await getClientsById(incidentsPage.items.map(i => i.client_id)));
     } catch (error) {
       console.error('Error fetching data:', error);
       toast.error('Error al cargar incidencias');
@@ -88,6 +109,22 @@ const Incidents = () => {
     }
   };
 
+  const loadMoreIncidents = async () => {
+    try {
+      setLoadingMore(true);
+      const page = await getPage(`${API_URL}/incidents`, { cursor: nextCursor });
+      const more = await getClientsById(page.items.map(i => i.client_id).filter(id => !clients[id]));
+      setIncidents(current => [...current, ...page.items]);
+      setClients(current => ({ ...current, ...more }));
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error('Error fetching data:', error);
+      toast.error('Error al cargar incidencias');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const fetchIncidentDetail = async (incidentId) => {
     setLoadingDetail(true);
     try {
@@ -176,6 +213,7 @@ const Incidents = () => {
         priority: 'Media',
         type: 'Técnica'
       });
+      setClientSearch('');
       fetchData();
     } catch (error) {
       toast.error(error.response?.data?.detail || 'Error al crear incidencia');
@@ -352,6 +390,7 @@ const Incidents = () => {
                 </p>
               </div>
             )}
+            <LoadMore hasMore={!!nextCursor} loading={loadingMore} onClick={loadMoreIncidents} />
           </Card>
         )}
 
@@ -641,12 +680,19 @@ const Incidents = () => {
             <form onSubmit={handleSubmit} className="space-y-4">
               <div>
                 <Label>Cliente *</Label>
+                <Input
+                  data-testid="incident-client-search"
+                  value={clientSearch}
+                  onChange={(e) => setClientSearch(e.target.value)}
+                  placeholder="Buscar por nombre, teléfono, email o DNI"
+                  className="mt-1.5"
+                />
                 <Select value={formData.client_id} onValueChange={(val) => setFormData({...formData, client_id: val})} required>
                   <SelectTrigger className="mt-1.5">
-                    <SelectValue placeholder="Seleccionar cliente" />
+                    <SelectValue placeholder={clientOptions.length ? 'Seleccionar cliente' : 'Escribe al menos 2 caracteres'} />
                   </SelectTrigger>
                   <SelectContent>
-                    {Object.values(clients).map(client => (
+                    {clientOptions.map(client => (
                       <SelectItem key={client.id} value={client.id}>{client.name} - {client.phone}</SelectItem>
                     ))}
                   </SelectContent>
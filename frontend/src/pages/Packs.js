@@ -22,6 +22,8 @@ import {
 } from 'lucide-react';
 import { toast } from 'sonner';
 import axios from 'axios';
+import { getPage } from '../lib/api';
+import { LoadMore } from '../components/LoadMore';
 
 const API_URL = process.env.REACT_APP_BACKEND_URL + '/api';
 
@@ -81,14 +83,18 @@ const Packs = () => {
     active: true
   });
 
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+
   useEffect(() => {
     fetchPacks();
   }, []);
 
   const fetchPacks = async () => {
     try {
-      const response = await axios.get(`${API_URL}/packs`);
-      setPacks(response.data);
+      const page = await getPage(`${API_URL}/packs`);
+      setPacks(page.items);
+      setNextCursor(page.nextCursor);
     } catch (error) {
       console.error('Error fetching packs:', error);
       toast.error('Error al cargar tarifas');
@@ -97,6 +103,20 @@ const Packs = () => {
     }
   };
 
+  const loadMorePacks = async () => {
+    try {
+      setLoadingMore(true);
+      const page = await getPage(`${API_URL}/packs`, { cursor: nextCursor });
+      setPacks(current => [...current, ...page.items]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error('Error fetching packs:', error);
+      toast.error('Error al cargar tarifas');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const resetForm = () => {
     setFormData({
       company: '',
@@ -357,6 +377,7 @@ const Packs = () => {
                 <p className="text-slate-500">No hay tarifas disponibles</p>
               </div>
             )}
+            <LoadMore hasMore={!!nextCursor} loading={loadingMore} onClick={loadMorePacks} />
           </>
         )}
 
@@ -12,6 +12,8 @@ import { Sheet, SheetContent, SheetHeader, SheetTitle } from '../components/ui/s
 import { Dialog, DialogContent, DialogHeader, DialogTitle } from '../components/ui/dialog';
 import { toast } from 'sonner';
 import axios from 'axios';
+import { getPage, getClientsById } from '../lib/api';
+import { LoadMore } from '../components/LoadMore';
 import { 
   Plus, 
   X, 
@@ -51,6 +53,8 @@ const Sales = () => {
   const [clients, setClients] = useState({});
   const [users, setUsers] = useState({});
   const [packs, setPacks] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [filterStatus, setFilterStatus] = useState('all');
   const [filterCompany, setFilterCompany] = useState('all');
@@ -87,19 +91,17 @@ const Sales = () => {
 
   const fetchData = async () => {
     try {
-      const [salesRes, clientsRes, usersRes, packsRes] = await Promise.all([
-        axios.get(`${API_URL}/sales`),
-        axios.get(`${API_URL}/clients`),
+      const [salesPage, usersRes, packsRes] = await Promise.all([
+        getPage(`${API_URL}/sales`),
         axios.get(`${API_URL}/dashboard/ranking`),
-        axios.get(`${API_URL}/packs?active_only=true`)
+        axios.get(`${API_URL}/packs`, { params: { active_only: true, limit: 500 } })
       ]);
       
-      setSales(salesRes.data);
+      setSales(salesPage.items);
+      setNextCursor(salesPage.nextCursor);
       setPacks(packsRes.data);
-      
-      const clientsMap = {};
-      clientsRes.data.forEach(c => clientsMap[c.id] = c);
-      setClients(clientsMap);
+      // Only the clients shown in the rows
+      setClients(await getClientsById(salesPage.items.map(s => s.client_id)));
       
       const usersMap = {};
       usersRes.data.forEach(u => usersMap[u.user_id] = u.name);
@@ -112,6 +114,23 @@ const Sales = () => {
     }
   };
 
+  const loadMoreSales = async () => {
+    try {
+      setLoadingMore(true);
+      const page = await getPage(`${API_URL}/sales`, { cursor: nextCursor });
+      const missing = page.items.map(s => s.client_id).filter(id => !clients[id]);
+      const more = await getClientsById(missing);
+      setSales(current => [...current, ...page.items]);
+      setClients(current => ({ ...current, ...more }));
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error('Error fetching sales:', error);
+      toast.error('Error al cargar ventas');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const fetchSaleDetail = async (saleId) => {
     setLoadingDetail(true);
     try {
@@ -451,6 +470,7 @@ const Sales = () => {
                 <p className="text-slate-500">No hay ventas que coincidan con los filtros</p>
               </div>
             )}
+            <LoadMore hasMore={!!nextCursor} loading={loadingMore} onClick={loadMoreSales} />
           </Card>
         )}
 
@@ -0,0 +1,98 @@
+"""
+Differential tests for the configurator's columnar scoring (services/pack_index.py)
+against the original scan-score-sort in benchmarks/configurator.py, on seeded
+random catalogs. These run in-process: no server needed.
+"""
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+from benchmarks.configurator import COMPANIES, TYPES, catalog, scan_and_sort  # noqa: E402
+from server import ConfiguratorRequest  # noqa: E402
+from services.pack_catalog import CatalogSnapshot  # noqa: E402
+from services.pack_index import PackIndex, score, scores  # noqa: E402
+from services.pack_rules import origin_key, with_rules  # noqa: E402
+
+SEEDS = [1, 2, 3, 4, 5]
+
+
+def _catalog(seed: int, size: int = 400):
+    """
+    The benchmark catalog plus, for a fifth of its packs, exact copies (ties)
+    and copies a cent or two apart (ties or not once rounded), some of them
+    without GB or fiber speed.
+    """
+    rng = random.Random(seed)
+    packs = catalog(size, seed=seed)
+    for pack in rng.sample(packs, size // 5):
+        packs.append({**pack, "id": str(uuid.uuid4())})
+        variant = {**pack, "id": str(uuid.uuid4()), "price": round(pack["price"] + rng.choice([-0.02, -0.01, 0.01]), 2)}
+        if rng.random() < 0.5:
+            variant[rng.choice(["mobile_gb", "fiber_speed_mbps"])] = None
+        packs.append(with_rules(variant))
+    packs.sort(key=lambda pack: (pack["created_at"], pack["id"]), reverse=True)
+    return packs
+
+
+def _requests(seed: int, count: int = 60):
+    rng = random.Random(seed * 101)
+    return [ConfiguratorRequest(
+        pack_type=rng.choice(TYPES),
+        origin_company=rng.choice([None, *COMPANIES]),
+        priority=rng.choice(["Ahorrar", "Equilibrado", "Máxima calidad"]),
+        mobile_gb=rng.choice([None, 10, 50, 100]),
+        fiber_speed_mbps=rng.choice([None, 300, 600, 1000]),
+        additional_lines=rng.choice([0, 0, 1, 2]),
+        tv_required=rng.random() < 0.25,
+        respect_restrictions=rng.random() < 0.8,
+    ) for _ in range(count)]
+
+
+def _setup(seed: int):
+    now = datetime.now(timezone.utc)
+    packs = _catalog(seed)
+    return packs, PackIndex(CatalogSnapshot(1, packs, now, 3600), now), now
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_top_matches_scan(seed):
+    """Test that each request's top three (ids, scores, tie order) is the scan's"""
+    packs, index, now = _setup(seed)
+    for request in _requests(seed):
+        expected = [(p["id"], p["score"]) for p in scan_and_sort(packs, request, now)]
+        assert [(entry.pack["id"], value) for value, entry in index.top(request, 3, now)] == expected, request
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_top_many_matches_top(seed):
+    """Test that scoring requests together gives what scoring them one by one does"""
+    _, index, now = _setup(seed)
+    requests = _requests(seed)
+    assert index.top_many(requests, 3, now) == [index.top(request, 3, now) for request in requests]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_scores_match_scalar_score(seed):
+    """Test every cell of the score matrix against score() and the restriction rule"""
+    _, index, now = _setup(seed)
+    now_ts = now.timestamp()
+    requests = _requests(seed)
+    for (pack_type, tv_required), columns in index.buckets.items():
+        group = [r for r in requests if (r.pack_type, r.tv_required) == (pack_type, tv_required)]
+        if not group or not len(columns):
+            continue
+        for request, raw in zip(group, scores(columns, group, now_ts)):
+            origin = origin_key(request.origin_company)
+            for entry, value in zip(columns.entries, raw):
+                excluded = bool(request.respect_restrictions and origin and entry.allowed_origins is not None
+                                and origin not in entry.allowed_origins)
+                assert np.isneginf(value) == excluded
+                if not excluded:
+                    assert abs(value - score(entry, request, origin, now_ts)) <= 0.005 + 1e-9
@@ -0,0 +1,1132 @@
+"""
+Backend API Tests for HIPNOTIK LEVEL Stand - Platform services
+Tests for: Password hashing pool, principal cache, token claims, login admission control, diagnostics
+"""
+import io
+import pytest
+import requests
+import os
+import json
+import base64
+import uuid
+import msgpack
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# ==================== AUTH FIXTURES ====================
+
+@pytest.fixture(scope="module")
+def auth_headers():
+    """Get auth headers for SuperAdmin user"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "email": "test@hipnotik.com",
+        "password": "test123"
+    })
+    if response.status_code != 200:
+        # Register if not exists
+        response = requests.post(f"{BASE_URL}/api/auth/register", json={
+            "email": "test@hipnotik.com",
+            "password": "test123",
+            "name": "Test SuperAdmin",
+            "role": "SuperAdmin"
+        })
+    token = response.json().get("access_token")
+    return {"Authorization": f"Bearer {token}"}
+
+
+# ==================== PACK FIXTURES ====================
+
+@pytest.fixture
+def create_pack(request, auth_headers):
+    """
+    Creates TEST packs through POST /api/packs, with the test class's
+    PACK_DEFAULTS applied; every pack created is deactivated afterwards so
+    cheap test packs do not outrank real tariffs in the calculator.
+    """
+    created = []
+
+    def create(**fields):
+        payload = {"company": "TEST Packs", "name": f"TEST Pack {uuid.uuid4().hex[:6]}",
+                   "type": "Solo Fibra", "price": 20.0, **getattr(request.cls, "PACK_DEFAULTS", {}), **fields}
+        response = requests.post(f"{BASE_URL}/api/packs", headers=auth_headers, json=payload)
+        assert response.status_code == 200
+        created.append(response.json())
+        return response.json()
+
+    yield create
+    for pack in created:
+        requests.put(f"{BASE_URL}/api/packs/{pack['id']}", headers=auth_headers, json={**pack, "active": False})
+
+
+# ==================== PASSWORD HASHING TESTS ====================
+
+class TestPasswordHashing:
+    """Tests for the bounded bcrypt worker pool"""
+
+    def test_diagnostics_reports_hasher_pool(self, auth_headers):
+        """Test GET /api/admin/diagnostics exposes password hasher metrics"""
+        response = requests.get(f"{BASE_URL}/api/admin/diagnostics", headers=auth_headers)
+        assert response.status_code == 200
+
+        hasher = response.json()["password_hasher"]
+        for key in ["max_workers", "max_queue", "pending", "completed", "rejected", "timeouts", "avg_run_ms"]:
+            assert key in hasher, f"Missing metric '{key}'"
+        assert hasher["max_workers"] >= 1
+
+    def test_bcrypt_cost_is_calibrated(self, auth_headers):
+        """Test that the bcrypt cost chosen at startup is within the allowed range"""
+        response = requests.get(f"{BASE_URL}/api/admin/diagnostics", headers=auth_headers)
+        hasher = response.json()["password_hasher"]
+        assert 10 <= hasher["rounds"] <= 31
+        assert "target_ms" in hasher
+
+    def test_other_endpoints_respond_during_login_burst(self, auth_headers):
+        """Test that a burst of logins does not block unrelated endpoints"""
+        def do_login(_):
+            return requests.post(f"{BASE_URL}/api/auth/login", json={
+                "email": "test@hipnotik.com",
+                "password": "test123"
+            }).status_code
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            logins = [pool.submit(do_login, i) for i in range(8)]
+            statuses = requests.get(f"{BASE_URL}/api/sales/statuses", headers=auth_headers, timeout=2)
+            results = [f.result() for f in logins]
+
+        assert statuses.status_code == 200
+        # Logins either succeed or are shed with 503/429, never hang or fail with 500
+        assert all(code in (200, 429, 503) for code in results)
+
+    def test_diagnostics_requires_super_admin(self):
+        """Test diagnostics endpoint rejects anonymous requests"""
+        response = requests.get(f"{BASE_URL}/api/admin/diagnostics")
+        assert response.status_code in (401, 403)
+
+
+# ==================== PRINCIPAL CACHE TESTS ====================
+
+class TestPrincipalCache:
+    """Tests for the authenticated-principal and token-version caches"""
+
+    def test_repeated_requests_hit_cache(self, auth_headers):
+        """Test that repeated authenticated requests need no users lookup"""
+        before = requests.get(f"{BASE_URL}/api/admin/diagnostics", headers=auth_headers).json()["token_versions"]
+
+        for _ in range(5):
+            response = requests.get(f"{BASE_URL}/api/notifications/unread-count", headers=auth_headers)
+            assert response.status_code == 200
+
+        after = requests.get(f"{BASE_URL}/api/admin/diagnostics", headers=auth_headers).json()["token_versions"]
+        assert after["hits"] >= before["hits"] + 5
+        assert "misses" in after and "hit_ratio" in after
+
+    def test_me_still_returns_current_user(self, auth_headers):
+        """Test /auth/me returns the same principal on consecutive calls"""
+        first = requests.get(f"{BASE_URL}/api/auth/me", headers=auth_headers)
+        second = requests.get(f"{BASE_URL}/api/auth/me", headers=auth_headers)
+        assert first.status_code == 200 and second.status_code == 200
+        assert first.json()["id"] == second.json()["id"]
+        assert "password" not in second.json()
+
+
+# ==================== TOKEN CLAIMS TESTS ====================
+
+def _token_claims(headers):
+    """Decode the (unverified) payload of the bearer token"""
+    token = headers["Authorization"].split(" ", 1)[1]
+    payload = token.split(".")[1]
+    payload += "=" * (-len(payload) % 4)
+    return json.loads(base64.urlsafe_b64decode(payload))
+
+
+class TestTokenClaims:
+    """Tests for self-contained JWT claims and token versioning"""
+
+    def test_token_carries_principal_claims(self, auth_headers):
+        """Test that login tokens embed role, name, language and token version"""
+        claims = _token_claims(auth_headers)
+        for claim in ["sub", "email", "name", "role", "lang", "ver", "exp"]:
+            assert claim in claims, f"Missing claim '{claim}'"
+        assert claims["role"] == "SuperAdmin"
+
+    def test_role_check_uses_claims(self, auth_headers):
+        """Test SuperAdmin-only endpoint accepts the self-contained token"""
+        response = requests.get(f"{BASE_URL}/api/objectives", headers=auth_headers)
+        assert response.status_code == 200
+
+    def test_tampered_token_rejected(self, auth_headers):
+        """Test that a token with a modified signature is rejected"""
+        token = auth_headers["Authorization"].split(" ", 1)[1]
+        tampered = token[:-4] + ("AAAA" if not token.endswith("AAAA") else "BBBB")
+        response = requests.get(f"{BASE_URL}/api/auth/me", headers={"Authorization": f"Bearer {tampered}"})
+        assert response.status_code == 401
+
+    def test_revoke_unknown_user(self, auth_headers):
+        """Test revoking sessions of a non-existent user returns 404"""
+        response = requests.post(f"{BASE_URL}/api/auth/revoke/does-not-exist", headers=auth_headers)
+        assert response.status_code == 404
+
+
+# ==================== LOGIN ADMISSION CONTROL TESTS ====================
+
+class TestLoginAdmission:
+    """Tests for the sliding-window limiter in front of login and forgot-password"""
+
+    def test_repeated_failures_are_rejected_before_bcrypt(self, auth_headers):
+        """Test that a retry storm against one email ends in 429 with Retry-After"""
+        email = f"storm_{uuid.uuid4().hex[:8]}@hipnotik.com"
+        codes = []
+        for _ in range(8):
+            response = requests.post(f"{BASE_URL}/api/auth/login", json={"email": email, "password": "wrong"})
+            codes.append(response.status_code)
+
+        assert codes[0] == 401
+        assert codes[-1] == 429
+        limited = requests.post(f"{BASE_URL}/api/auth/login", json={"email": email, "password": "wrong"})
+        assert int(limited.headers["Retry-After"]) > 0
+
+        stats = requests.get(f"{BASE_URL}/api/admin/diagnostics", headers=auth_headers).json()["login_limiter"]
+        assert stats["rejected"] >= 1
+        assert "bcrypt_verifications_avoided" in stats
+        assert "estimated_cpu_ms_saved" in stats
+
+    def test_valid_login_not_affected_by_other_email(self):
+        """Test that failures on one email do not lock out another account"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "test@hipnotik.com",
+            "password": "test123"
+        })
+        assert response.status_code == 200
+
+    def test_forgot_password_is_limited(self):
+        """Test that forgot-password requests for one email are throttled"""
+        email = f"reset_{uuid.uuid4().hex[:8]}@hipnotik.com"
+        codes = [
+            requests.post(f"{BASE_URL}/api/auth/forgot-password", json={"email": email}).status_code
+            for _ in range(5)
+        ]
+        assert codes[0] == 200
+        assert codes[-1] == 429
+
+
+# ==================== MONGO POOL TESTS ====================
+
+class TestMongoPool:
+    """Tests for the shared Mongo client and its pool metrics"""
+
+    def test_diagnostics_reports_pool(self, auth_headers):
+        """Test GET /api/admin/diagnostics exposes connection pool settings and counters"""
+        response = requests.get(f"{BASE_URL}/api/admin/diagnostics", headers=auth_headers)
+        assert response.status_code == 200
+
+        pool = response.json()["mongo_pool"]
+        assert pool["connected"] is True
+        assert pool["options"]["maxPoolSize"] >= 1
+        for key in ["open_connections", "in_use", "waiting", "checkouts", "waits"]:
+            assert key in pool, f"Missing metric '{key}'"
+
+
+# ==================== NATIVE DATES TESTS ====================
+
+class TestNativeDates:
+    """Tests for BSON date storage and the ISO-string migration"""
+
+    def test_diagnostics_reports_date_migration(self, auth_headers):
+        """Test GET /api/admin/diagnostics exposes the date migration state"""
+        response = requests.get(f"{BASE_URL}/api/admin/diagnostics", headers=auth_headers)
+        assert response.status_code == 200
+
+        migration = response.json()["date_migration"]
+        for key in ["status", "dual_read", "converted", "failed"]:
+            assert key in migration, f"Missing field '{key}'"
+
+    def test_new_sale_counted_in_today_range(self, auth_headers):
+        """Test that a sale stored with a native date is matched by dashboard range queries"""
+        before = requests.get(f"{BASE_URL}/api/dashboard/kpis", headers=auth_headers).json()
+
+        phone = f"699{uuid.uuid4().int % 1000000:06d}"
+        client = requests.post(f"{BASE_URL}/api/clients", headers=auth_headers, json={
+            "name": "TEST Fecha Nativa",
+            "phone": phone
+        }).json()
+        response = requests.post(f"{BASE_URL}/api/sales", headers=auth_headers, json={
+            "client_id": client["id"],
+            "company": "Jazztel",
+            "pack_type": "Solo Fibra"
+        })
+        assert response.status_code == 200
+        assert "T" in response.json()["created_at"]
+
+        after = requests.get(f"{BASE_URL}/api/dashboard/kpis", headers=auth_headers).json()
+        assert after["sales_today"] == before["sales_today"] + 1
+
+
+# ==================== INDEX REGISTRY TESTS ====================
+
+class TestIndexRegistry:
+    """Tests for the startup index bootstrapper and coverage report"""
+
+    def test_index_report_lists_indexes(self, auth_headers):
+        """Test GET /api/admin/indexes lists registered indexes with their status"""
+        response = requests.get(f"{BASE_URL}/api/admin/indexes", headers=auth_headers)
+        assert response.status_code == 200
+
+        indexes = response.json()["indexes"]
+        by_name = {(i["collection"], i["name"]): i for i in indexes}
+        assert by_name[("users", "email_1")]["unique"] is True
+        assert by_name[("password_resets", "expires_at_1")]["ttl_seconds"] is not None
+        assert all(i["status"] in ("ok", "failed", "pending") for i in indexes)
+
+    def test_every_query_shape_is_served(self, auth_headers):
+        """Test that every registered query shape has a serving index"""
+        response = requests.get(f"{BASE_URL}/api/admin/indexes", headers=auth_headers)
+        shapes = response.json()["query_shapes"]
+        assert shapes
+        unserved = [s["name"] for s in shapes if s["index"] is None]
+        assert not unserved, f"Query shapes without index: {unserved}"
+
+    def test_index_report_requires_super_admin(self):
+        """Test index report rejects anonymous requests"""
+        response = requests.get(f"{BASE_URL}/api/admin/indexes")
+        assert response.status_code in (401, 403)
+
+
+# ==================== CLIENT SEARCH TESTS ====================
+
+class TestClientSearch:
+    """Tests for the n-gram client search"""
+
+    @pytest.fixture(scope="class")
+    def search_client(self, auth_headers):
+        suffix = uuid.uuid4().hex[:6]
+        phone = f"61{uuid.uuid4().int % 10000000:07d}"
+        response = requests.post(f"{BASE_URL}/api/clients", headers=auth_headers, json={
+            "name": f"TEST Begoña Muñoz{suffix}",
+            "phone": phone,
+            "email": f"bego.{suffix}@example.com",
+            "dni": f"{uuid.uuid4().int % 100000000:08d}Z"
+        })
+        assert response.status_code == 200
+        return response.json()
+
+    def _search(self, auth_headers, term):
+        response = requests.get(f"{BASE_URL}/api/clients", headers=auth_headers, params={"search": term})
+        assert response.status_code == 200
+        return response.json()
+
+    def test_search_by_name_prefix_ignores_accents(self, auth_headers, search_client):
+        """Test that an accent-free name prefix finds the client"""
+        suffix = search_client["name"].split("Muñoz")[1]
+        results = self._search(auth_headers, f"bego munoz{suffix}")
+        assert results and results[0]["id"] == search_client["id"]
+
+    def test_search_by_formatted_phone(self, auth_headers, search_client):
+        """Test that a phone typed with spaces and country code finds the client"""
+        phone = search_client["phone"]
+        results = self._search(auth_headers, f"+34 {phone[:3]} {phone[3:6]} {phone[6:]}")
+        assert search_client["id"] in [c["id"] for c in results]
+
+    def test_search_by_dni_and_email(self, auth_headers, search_client):
+        """Test that DNI (any case) and email prefixes find the client"""
+        assert search_client["id"] in [c["id"] for c in self._search(auth_headers, search_client["dni"].lower())]
+        assert search_client["id"] in [c["id"] for c in self._search(auth_headers, search_client["email"][:9])]
+
+    def test_search_ranks_whole_words_first(self, auth_headers):
+        """Test that a whole-word match outranks prefix matches, in the same order on every call"""
+        word = f"zq{uuid.uuid4().hex[:6]}"
+        ids = {}
+        for name in (f"TEST {word}extra Uno", f"TEST {word} Dos", f"TEST {word}mas Tres"):
+            response = requests.post(f"{BASE_URL}/api/clients", headers=auth_headers, json={
+                "name": name, "phone": f"62{uuid.uuid4().int % 10000000:07d}"
+            })
+            ids[name.split()[-1]] = response.json()["id"]
+        # Prefix matches tie and are ordered by name ("...extra uno" < "...mas tres")
+        results = [c["id"] for c in self._search(auth_headers, word)]
+        assert results == [ids["Dos"], ids["Uno"], ids["Tres"]]
+        assert [c["id"] for c in self._search(auth_headers, word)] == results
+
+    def test_search_ignores_single_characters(self, auth_headers, search_client):
+        """Test that one-character terms are dropped: alone they match nothing, next to a word they are ignored"""
+        assert self._search(auth_headers, "b") == []
+        assert self._search(auth_headers, "6") == []
+        suffix = search_client["name"].split("Muñoz")[1]
+        results = self._search(auth_headers, f"x munoz{suffix}")
+        assert results and results[0]["id"] == search_client["id"]
+
+    def test_search_fields_not_exposed(self, auth_headers, search_client):
+        """Test that search bookkeeping fields are not returned"""
+        results = self._search(auth_headers, search_client["phone"])
+        assert results
+        assert "search_grams" not in results[0]
+
+    def test_search_finds_updated_name(self, auth_headers, search_client):
+        """Test that renaming a client updates its search tokens"""
+        new_name = f"TEST Renombrado {uuid.uuid4().hex[:6]}"
+        response = requests.put(f"{BASE_URL}/api/clients/{search_client['id']}", headers=auth_headers,
+                                json={"name": new_name})
+        assert response.status_code == 200
+        results = self._search(auth_headers, new_name.lower())
+        assert [c["id"] for c in results] == [search_client["id"]]
+
+
+# ==================== CLIENT PHONE KEY TESTS ====================
+
+class TestClientPhoneKey:
+    """Tests for client dedupe by normalized phone"""
+
+    def _create(self, auth_headers, name, phone):
+        response = requests.post(f"{BASE_URL}/api/clients", headers=auth_headers, json={"name": name, "phone": phone})
+        assert response.status_code == 200
+        return response.json()
+
+    def test_phone_formats_resolve_to_one_client(self, auth_headers):
+        """Test that the same number typed differently returns the same client"""
+        phone = f"62{uuid.uuid4().int % 10000000:07d}"
+        first = self._create(auth_headers, "TEST Phone Key", phone)
+        formatted = self._create(auth_headers, "TEST Phone Key 2", f"+34 {phone[:3]} {phone[3:6]} {phone[6:]}")
+        dashed = self._create(auth_headers, "TEST Phone Key 3", f"{phone[:3]}-{phone[3:6]}-{phone[6:]}")
+        assert formatted["id"] == first["id"]
+        assert dashed["id"] == first["id"]
+        assert dashed["name"] == "TEST Phone Key"
+        assert "phone_key" not in first
+
+    def test_concurrent_creates_yield_one_client(self, auth_headers):
+        """Test that simultaneous creates with the same phone return a single client"""
+        phone = f"63{uuid.uuid4().int % 10000000:07d}"
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            results = list(pool.map(lambda i: self._create(auth_headers, f"TEST Concurrent {i}", phone), range(5)))
+        assert len({client["id"] for client in results}) == 1
+
+    def test_update_to_taken_phone_conflicts(self, auth_headers):
+        """Test that moving a client onto another client's phone returns 409"""
+        taken = f"64{uuid.uuid4().int % 10000000:07d}"
+        self._create(auth_headers, "TEST Holder", taken)
+        other = self._create(auth_headers, "TEST Other", f"65{uuid.uuid4().int % 10000000:07d}")
+        response = requests.put(f"{BASE_URL}/api/clients/{other['id']}", headers=auth_headers,
+                                json={"phone": f"+34{taken}"})
+        assert response.status_code == 409
+
+
+# ==================== KEYSET PAGINATION TESTS ====================
+
+class TestKeysetPagination:
+    """Tests for cursor pagination of list endpoints"""
+
+    @pytest.fixture(scope="class", autouse=True)
+    def some_clients(self, auth_headers):
+        for i in range(3):
+            requests.post(f"{BASE_URL}/api/clients", headers=auth_headers, json={
+                "name": f"TEST Paged {i}", "phone": f"66{uuid.uuid4().int % 10000000:07d}"
+            })
+
+    def test_pages_cover_the_list_once(self, auth_headers):
+        """Test that following X-Next-Cursor walks every client exactly once, in order"""
+        full = requests.get(f"{BASE_URL}/api/clients", headers=auth_headers, params={"limit": 500}).json()
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            response = requests.get(f"{BASE_URL}/api/clients", headers=auth_headers, params=params)
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page) <= 2
+            seen.extend(c["id"] for c in page)
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert seen == [c["id"] for c in full]
+
+    def test_last_page_has_no_cursor(self, auth_headers):
+        """Test that a page holding the rest of the list has no next cursor"""
+        response = requests.get(f"{BASE_URL}/api/clients", headers=auth_headers, params={"limit": 500})
+        assert response.status_code == 200
+        assert "X-Next-Cursor" not in response.headers
+
+    def test_invalid_cursor_rejected(self, auth_headers):
+        """Test that a malformed cursor returns 400"""
+        response = requests.get(f"{BASE_URL}/api/sales", headers=auth_headers, params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+
+    def test_cursor_of_another_ordering_rejected(self, auth_headers):
+        """Test that a clients cursor (created_at) is not accepted by contacts (name)"""
+        response = requests.get(f"{BASE_URL}/api/clients", headers=auth_headers, params={"limit": 1})
+        cursor = response.headers["X-Next-Cursor"]
+        response = requests.get(f"{BASE_URL}/api/contacts", headers=auth_headers, params={"cursor": cursor})
+        assert response.status_code == 400
+
+
+# ==================== LIST QUERY TESTS ====================
+
+class TestListQuery:
+    """Tests for server-side filters and sorts on list endpoints"""
+
+    def _get(self, auth_headers, path, **params):
+        return requests.get(f"{BASE_URL}/api/{path}", headers=auth_headers, params=params)
+
+    def test_filter_by_status(self, auth_headers):
+        """Test that ?status= only returns sales in the given statuses"""
+        response = self._get(auth_headers, "sales", status="Registrado,Instalado", limit=500)
+        assert response.status_code == 200
+        assert all(s["status"] in ("Registrado", "Instalado") for s in response.json())
+        assert "X-Query-Warning" not in response.headers
+
+    def test_score_range_and_sort(self, auth_headers):
+        """Test that score bounds apply and sort=-score orders by score"""
+        response = self._get(auth_headers, "sales", score_min=10, score_max=90, sort="-score", limit=500)
+        assert response.status_code == 200
+        scores = [s["score"] for s in response.json()]
+        assert all(10 <= score <= 90 for score in scores)
+        assert scores == sorted(scores, reverse=True)
+
+    def test_date_range(self, auth_headers):
+        """Test that created_from/created_to bound created_at"""
+        response = self._get(auth_headers, "incidents", created_from="2000-01-01", created_to="2000-02-01")
+        assert response.status_code == 200
+        assert response.json() == []
+
+    def test_unknown_filter_rejected(self, auth_headers):
+        """Test that filters outside the allow-list return 400"""
+        response = self._get(auth_headers, "sales", internal_notes="x")
+        assert response.status_code == 400
+        assert "internal_notes" in response.json()["detail"]
+
+    def test_invalid_values_rejected(self, auth_headers):
+        """Test that unknown statuses, bad numbers and bad sorts return 400"""
+        assert self._get(auth_headers, "incidents", status="Perdida").status_code == 400
+        assert self._get(auth_headers, "sales", score_min="alto").status_code == 400
+        assert self._get(auth_headers, "clients", sort="name").status_code == 400
+
+    def test_unindexed_filter_warns(self, auth_headers):
+        """Test that a filter no index serves is answered with X-Query-Warning"""
+        response = self._get(auth_headers, "sales", pack_type="Solo Fibra")
+        assert response.status_code == 200
+        assert "pack_type" in response.headers["X-Query-Warning"]
+
+    def test_incidents_of_a_client(self, auth_headers):
+        """Test that ?client_id= returns only that client's incidents, from an index"""
+        client = requests.post(f"{BASE_URL}/api/clients", headers=auth_headers, json={
+            "name": "TEST Incident Filter", "phone": f"69{uuid.uuid4().int % 10000000:07d}"
+        }).json()
+        created = requests.post(f"{BASE_URL}/api/incidents", headers=auth_headers, json={
+            "client_id": client["id"], "title": "TEST Filtro", "description": "Sin línea", "type": "Técnica"
+        })
+        assert created.status_code == 200
+
+        response = self._get(auth_headers, "incidents", client_id=client["id"])
+        assert response.status_code == 200
+        assert [i["id"] for i in response.json()] == [created.json()["id"]]
+        assert "X-Query-Warning" not in response.headers
+
+    def test_clients_by_id(self, auth_headers):
+        """Test that ?id= returns just the listed clients, as pickers ask for them"""
+        ids = [requests.post(f"{BASE_URL}/api/clients", headers=auth_headers, json={
+            "name": f"TEST By Id {n}", "phone": f"69{uuid.uuid4().int % 10000000:07d}"
+        }).json()["id"] for n in range(2)]
+
+        response = self._get(auth_headers, "clients", id=",".join(ids), fields="picker")
+        assert response.status_code == 200
+        assert sorted(c["id"] for c in response.json()) == sorted(ids)
+        assert "X-Query-Warning" not in response.headers
+
+
+# ==================== SPARSE FIELDSET TESTS ====================
+
+class TestSparseFieldsets:
+    """Tests for ?fields= on list and detail endpoints"""
+
+    @pytest.fixture(scope="class")
+    def fieldset_client(self, auth_headers):
+        response = requests.post(f"{BASE_URL}/api/clients", headers=auth_headers, json={
+            "name": "TEST Fieldset", "phone": f"67{uuid.uuid4().int % 10000000:07d}",
+            "address": "Calle Mayor 1"
+        })
+        assert response.status_code == 200
+        return response.json()
+
+    def test_preset_limits_list_fields(self, auth_headers, fieldset_client):
+        """Test that fields=picker returns only id, name and phone"""
+        response = requests.get(f"{BASE_URL}/api/clients", headers=auth_headers, params={"fields": "picker"})
+        assert response.status_code == 200
+        clients = response.json()
+        assert clients
+        assert all(set(c) <= {"id", "name", "phone"} for c in clients)
+        assert all("id" in c for c in clients)
+
+    def test_explicit_fields_on_detail(self, auth_headers, fieldset_client):
+        """Test that a field list applies to the detail endpoint"""
+        response = requests.get(f"{BASE_URL}/api/clients/{fieldset_client['id']}", headers=auth_headers,
+                                params={"fields": "name,created_at"})
+        assert response.status_code == 200
+        assert set(response.json()) == {"id", "name", "created_at"}
+
+    def test_full_is_the_default(self, auth_headers, fieldset_client):
+        """Test that fields=full and no fields return the same document"""
+        url = f"{BASE_URL}/api/clients/{fieldset_client['id']}"
+        full = requests.get(url, headers=auth_headers, params={"fields": "full"}).json()
+        assert full == requests.get(url, headers=auth_headers).json()
+        assert full["address"] == "Calle Mayor 1"
+
+    def test_sparse_pages_keep_cursor(self, auth_headers, fieldset_client):
+        """Test that sparse pages still carry X-Next-Cursor without leaking the sort field"""
+        response = requests.get(f"{BASE_URL}/api/clients", headers=auth_headers,
+                                params={"fields": "name", "limit": 1})
+        assert response.status_code == 200
+        assert set(response.json()[0]) == {"id", "name"}
+        assert response.headers.get("X-Next-Cursor")
+
+    def test_unknown_or_internal_field_rejected(self, auth_headers):
+        """Test that fields outside the model (like search bookkeeping) return 400"""
+        response = requests.get(f"{BASE_URL}/api/clients", headers=auth_headers, params={"fields": "search_grams"})
+        assert response.status_code == 400
+        response = requests.get(f"{BASE_URL}/api/sales", headers=auth_headers, params={"fields": "summary,password"})
+        assert response.status_code == 400
+
+
+# ==================== TRUSTED SERIALIZATION TESTS ====================
+
+class TestTrustedSerialization:
+    """Tests for list responses serialized without response_model validation"""
+
+    def test_list_items_have_model_fields_only(self, auth_headers):
+        """Test that clients come back with every model field and no stored extras"""
+        requests.post(f"{BASE_URL}/api/clients", headers=auth_headers, json={
+            "name": "TEST Serializer", "phone": f"68{uuid.uuid4().int % 10000000:07d}"
+        })
+        response = requests.get(f"{BASE_URL}/api/clients", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/json")
+        expected = {"id", "name", "phone", "email", "city", "address", "dni", "internal_notes",
+                    "created_by", "created_at", "updated_at", "is_demo"}
+        assert all(set(c) == expected for c in response.json())
+
+    def test_openapi_keeps_list_schemas(self):
+        """Test that the OpenAPI schema still documents list responses"""
+        response = requests.get(f"{BASE_URL}/openapi.json")
+        assert response.status_code == 200
+        schema = response.json()["paths"]["/api/sales"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+        assert schema["items"]["$ref"].endswith("/Sale")
+
+
+# ==================== RESPONSE ENCODING TESTS ====================
+
+class TestResponseEncoding:
+    """Tests for orjson responses and MessagePack negotiation"""
+
+    def test_msgpack_when_accepted(self, auth_headers):
+        """Test that Accept: application/msgpack returns the same data as MessagePack"""
+        as_json = requests.get(f"{BASE_URL}/api/packs", headers=auth_headers)
+        as_msgpack = requests.get(f"{BASE_URL}/api/packs",
+                                  headers={**auth_headers, "Accept": "application/msgpack"})
+        assert as_msgpack.status_code == 200
+        assert as_msgpack.headers["content-type"] == "application/msgpack"
+        assert "Accept" in as_msgpack.headers["vary"]
+        assert msgpack.unpackb(as_msgpack.content) == as_json.json()
+
+    def test_json_preferred_by_quality(self, auth_headers):
+        """Test that JSON is kept when the client ranks it above MessagePack"""
+        response = requests.get(f"{BASE_URL}/api/packs", headers={
+            **auth_headers, "Accept": "application/msgpack;q=0.5, application/json"
+        })
+        assert response.headers["content-type"].startswith("application/json")
+        assert "Accept" in response.headers["vary"]
+
+    def test_errors_are_negotiated_too(self):
+        """Test that error bodies follow the negotiated encoding"""
+        response = requests.get(f"{BASE_URL}/api/sales", headers={"Accept": "application/msgpack"})
+        assert response.status_code in (401, 403)
+        assert "detail" in msgpack.unpackb(response.content)
+
+
+# ==================== RESPONSE COMPRESSION TESTS ====================
+
+class TestResponseCompression:
+    """Tests for Brotli/gzip response compression"""
+
+    def test_gzip_list(self, auth_headers):
+        """Test that a large list is gzip-compressed when only gzip is accepted"""
+        response = requests.get(f"{BASE_URL}/api/clients", headers={**auth_headers, "Accept-Encoding": "gzip"},
+                                params={"limit": 500})
+        assert response.status_code == 200
+        assert response.headers.get("content-encoding") == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert isinstance(response.json(), list)
+
+    def test_brotli_preferred(self, auth_headers):
+        """Test that Brotli is chosen when the client accepts both"""
+        response = requests.get(f"{BASE_URL}/api/clients", headers={**auth_headers, "Accept-Encoding": "gzip, br"},
+                                params={"limit": 500}, stream=True)
+        assert response.headers.get("content-encoding") == "br"
+
+    def test_small_responses_uncompressed(self):
+        """Test that bodies under the minimum size are sent as is"""
+        response = requests.get(f"{BASE_URL}/api/", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+    def test_streamed_csv_compressed(self, auth_headers):
+        """Test that streamed CSV exports are compressed and decode to the full file"""
+        plain = requests.get(f"{BASE_URL}/api/export/clients/csv", headers={**auth_headers, "Accept-Encoding": "identity"})
+        compressed = requests.get(f"{BASE_URL}/api/export/clients/csv", headers={**auth_headers, "Accept-Encoding": "gzip"})
+        assert compressed.status_code == 200
+        if len(plain.content) >= 1024:
+            assert compressed.headers.get("content-encoding") == "gzip"
+        assert compressed.text == plain.text
+
+    def test_pdf_not_recompressed(self, auth_headers):
+        """Test that PDF exports are never compressed"""
+        response = requests.get(f"{BASE_URL}/api/export/sales/pdf", headers={**auth_headers, "Accept-Encoding": "gzip, br"})
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+
+
+# ==================== CONDITIONAL GET TESTS ====================
+
+class TestConditionalGet:
+    """Tests for ETags and 304 responses on rarely-changing resources"""
+
+    def test_not_modified_with_matching_etag(self, auth_headers):
+        """Test that If-None-Match with the current ETag returns an empty 304"""
+        first = requests.get(f"{BASE_URL}/api/packs", headers=auth_headers)
+        etag = first.headers["ETag"]
+        assert etag.startswith('"')
+        second = requests.get(f"{BASE_URL}/api/packs", headers={**auth_headers, "If-None-Match": etag})
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers["ETag"] == etag
+
+    def test_compressed_etag_revalidates(self, auth_headers):
+        """Test that the per-coding ETag of a compressed response is accepted back"""
+        first = requests.get(f"{BASE_URL}/api/packs", headers={**auth_headers, "Accept-Encoding": "gzip"})
+        if first.headers.get("content-encoding") == "gzip":
+            assert first.headers["ETag"].endswith('-gzip"')
+        second = requests.get(f"{BASE_URL}/api/packs", headers={**auth_headers, "If-None-Match": first.headers["ETag"]})
+        assert second.status_code == 304
+
+    def test_write_changes_etag(self, auth_headers):
+        """Test that creating and deleting a contact changes the contacts ETag"""
+        etag = requests.get(f"{BASE_URL}/api/contacts", headers=auth_headers).headers["ETag"]
+        created = requests.post(f"{BASE_URL}/api/contacts", headers=auth_headers, json={"name": "TEST ETag"})
+        assert created.status_code == 200
+        response = requests.get(f"{BASE_URL}/api/contacts", headers={**auth_headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+        etag = response.headers["ETag"]
+        requests.delete(f"{BASE_URL}/api/contacts/{created.json()['id']}", headers=auth_headers)
+        response = requests.get(f"{BASE_URL}/api/contacts", headers={**auth_headers, "If-None-Match": etag})
+        assert response.status_code == 200
+
+    def test_etag_depends_on_query(self, auth_headers):
+        """Test that different query strings get different ETags"""
+        all_packs = requests.get(f"{BASE_URL}/api/packs", headers=auth_headers).headers["ETag"]
+        active = requests.get(f"{BASE_URL}/api/packs", headers=auth_headers, params={"active_only": True}).headers["ETag"]
+        assert all_packs != active
+
+    def test_not_modified_still_requires_auth(self):
+        """Test that conditional requests are authenticated first"""
+        response = requests.get(f"{BASE_URL}/api/packs", headers={"If-None-Match": "*"})
+        assert response.status_code in (401, 403)
+
+
+# ==================== PACK CATALOG TESTS ====================
+
+class TestPackCatalog:
+    """Tests for the in-memory pack catalog"""
+
+    PACK_DEFAULTS = {"company": "TEST Catalog"}
+
+    def _catalog_stats(self, auth_headers):
+        return requests.get(f"{BASE_URL}/api/admin/diagnostics", headers=auth_headers).json()["pack_catalog"]
+
+    def test_reads_served_from_memory(self, auth_headers):
+        """Test that repeated pack reads do not reload the catalog"""
+        requests.get(f"{BASE_URL}/api/packs", headers=auth_headers)
+        loads = self._catalog_stats(auth_headers)["loads"]
+        for _ in range(3):
+            requests.get(f"{BASE_URL}/api/packs", headers=auth_headers)
+            requests.post(f"{BASE_URL}/api/calculator/recommend", headers=auth_headers, params={"pack_type": "Solo Fibra"})
+        assert self._catalog_stats(auth_headers)["loads"] == loads
+
+    def test_writes_invalidate(self, auth_headers, create_pack):
+        """Test that a new or updated pack is visible right away"""
+        pack = create_pack()
+        packs = requests.get(f"{BASE_URL}/api/packs", headers=auth_headers, params={"limit": 500}).json()
+        assert pack["id"] in [p["id"] for p in packs]
+
+        update = {k: pack[k] for k in ("company", "type", "price")}
+        response = requests.put(f"{BASE_URL}/api/packs/{pack['id']}", headers=auth_headers,
+                                json={**update, "name": "TEST Renamed pack"})
+        assert response.status_code == 200
+        packs = requests.get(f"{BASE_URL}/api/packs", headers=auth_headers, params={"limit": 500}).json()
+        assert [p["name"] for p in packs if p["id"] == pack["id"]] == ["TEST Renamed pack"]
+
+    def test_expired_packs_not_offered(self, auth_headers, create_pack):
+        """Test that the calculator skips packs outside their validity window"""
+        expired = create_pack(type="Pack Fibra + Móvil + TV", price=1.0,
+                              validity_end="2000-01-01T00:00:00Z")
+        response = requests.post(f"{BASE_URL}/api/calculator/recommend", headers=auth_headers,
+                                 params={"pack_type": "Pack Fibra + Móvil + TV"})
+        assert response.status_code == 200
+        assert expired["id"] not in [p["id"] for p in response.json()]
+
+    def test_paging_matches_cursor_contract(self, auth_headers, create_pack):
+        """Test that catalog pages follow X-Next-Cursor without repeats"""
+        create_pack()
+        create_pack()
+        full = requests.get(f"{BASE_URL}/api/packs", headers=auth_headers, params={"limit": 500}).json()
+        seen, cursor = [], None
+        while True:
+            response = requests.get(f"{BASE_URL}/api/packs", headers=auth_headers,
+                                    params={"limit": 2, **({"cursor": cursor} if cursor else {})})
+            seen.extend(p["id"] for p in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert seen == [p["id"] for p in full]
+
+    def test_crafted_cursor_rejected(self, auth_headers):
+        """Test that a well-formed cursor holding something other than a date returns 400"""
+        for value in ("not-a-date", 5):
+            payload = json.dumps({"f": "created_at", "k": "s", "v": value, "id": "x"}).encode()
+            cursor = base64.urlsafe_b64encode(payload).decode().rstrip("=")
+            response = requests.get(f"{BASE_URL}/api/packs", headers=auth_headers, params={"cursor": cursor})
+            assert response.status_code == 400
+
+
+# ==================== PACK INDEX TESTS ====================
+
+class TestPackIndex:
+    """Tests for the calculator configurator's pack index"""
+
+    PACK_DEFAULTS = {"company": "TEST Index", "type": "Solo Móvil", "price": 0.01}
+
+    def _configure(self, auth_headers, **fields):
+        response = requests.post(f"{BASE_URL}/api/calculator/configure", headers=auth_headers,
+                                 json={"pack_type": "Solo Móvil", "priority": "Ahorrar", **fields})
+        assert response.status_code == 200
+        return response.json()
+
+    def test_best_three_by_score(self, auth_headers, create_pack):
+        """Test that at most three packs come back, best first, new packs included"""
+        pack = create_pack(mobile_gb=50)
+        recommendations = self._configure(auth_headers, mobile_gb=50)
+        assert 1 <= len(recommendations) <= 3
+        scores = [r["score"] for r in recommendations]
+        assert scores == sorted(scores, reverse=True)
+        assert pack["id"] in [r["id"] for r in recommendations]
+        assert all("badges" in r and "fit_details" in r for r in recommendations)
+
+    def test_tv_required(self, auth_headers, create_pack):
+        """Test that only packs with TV are offered when TV is required"""
+        with_tv = create_pack(tv_supported=True, tv_package_type="TEST Fútbol")
+        recommendations = self._configure(auth_headers, tv_required=True)
+        assert recommendations and all(r["tv_supported"] for r in recommendations)
+        assert with_tv["id"] in [r["id"] for r in recommendations]
+
+    def test_restrictions_respected(self, auth_headers, create_pack):
+        """Test that packs limited to another origin company are skipped"""
+        restricted = create_pack(price=0.0, restrictions="Solo clientes que vienen de TEST Origen")
+        other = self._configure(auth_headers, origin_company="Otra")
+        assert restricted["id"] not in [r["id"] for r in other]
+        same = self._configure(auth_headers, origin_company="TEST Origen")
+        assert restricted["id"] in [r["id"] for r in same]
+
+    def test_exact_scores_and_tie_order(self, auth_headers, create_pack):
+        """Test scores to the cent and that equal scores keep newest first"""
+        origin = f"TEST Origen {uuid.uuid4().hex[:6]}"
+        older = create_pack(type="Solo Fibra", price=0.0, observations=f"Especial portabilidad desde {origin}")
+        newer = create_pack(type="Solo Fibra", price=0.0, observations=f"Especial portabilidad desde {origin}")
+        recommendations = self._configure(auth_headers, pack_type="Solo Fibra", origin_company=origin)
+        # 20 x 3 for price under "Ahorrar", 5 for a new pack, 10 for the origin special
+        assert [(r["id"], r["score"]) for r in recommendations[:2]] == [(newer["id"], 75.0), (older["id"], 75.0)]
+        assert f"Especial para {origin}" in recommendations[0]["fit_details"]
+
+
+# ==================== CONFIGURATOR BATCH TESTS ====================
+
+class TestConfiguratorBatch:
+    """Tests for scoring several configurator scenarios in one call"""
+
+    SCENARIOS = [
+        {"pack_type": "Solo Móvil", "priority": "Ahorrar", "mobile_gb": 20},
+        {"pack_type": "Pack Fibra + Móvil", "priority": "Equilibrado", "fiber_speed_mbps": 600, "additional_lines": 2},
+        {"pack_type": "Pack Fibra + Móvil + TV", "priority": "Máxima calidad", "tv_required": True},
+    ]
+
+    def test_matches_single_scenarios(self, auth_headers):
+        """Test that each scenario gets what /calculator/configure returns"""
+        response = requests.post(f"{BASE_URL}/api/calculator/configure/batch", headers=auth_headers,
+                                 json={"scenarios": self.SCENARIOS})
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["scenarios"]) == len(self.SCENARIOS)
+        for scenario, recommendations in zip(self.SCENARIOS, data["scenarios"]):
+            single = requests.post(f"{BASE_URL}/api/calculator/configure", headers=auth_headers, json=scenario).json()
+            assert [(r["id"], r["score"], r["badges"]) for r in recommendations] == \
+                [(r["id"], r["score"], r["badges"]) for r in single]
+
+    def test_summary(self, auth_headers, create_pack):
+        """Test the cross-scenario cheapest and best-value picks"""
+        create_pack(type="Solo Móvil", mobile_gb=20)
+        data = requests.post(f"{BASE_URL}/api/calculator/configure/batch", headers=auth_headers,
+                             json={"scenarios": self.SCENARIOS}).json()
+        offered = [(i, r) for i, recommendations in enumerate(data["scenarios"]) for r in recommendations]
+        assert offered
+        cheapest, best_value = data["summary"]["cheapest"], data["summary"]["best_value"]
+        assert cheapest["price"] == min(r["price"] for _, r in offered)
+        assert best_value["score"] == max(r["score"] for _, r in offered)
+        assert best_value["id"] in [r["id"] for r in data["scenarios"][best_value["scenario"]]]
+
+    def test_scenario_limits(self, auth_headers):
+        """Test that empty and oversized batches are rejected"""
+        for scenarios in ([], [self.SCENARIOS[0]] * 21):
+            response = requests.post(f"{BASE_URL}/api/calculator/configure/batch", headers=auth_headers,
+                                     json={"scenarios": scenarios})
+            assert response.status_code == 422
+
+
+# ==================== PACK RULES TESTS ====================
+
+class TestPackRules:
+    """Tests for origin-company rules compiled from pack texts"""
+
+    PACK_DEFAULTS = {"company": "TEST Rules", "type": "Solo Móvil", "price": 0.0}
+
+    def test_compiled_on_create(self, auth_headers, create_pack):
+        """Test that restrictions and observations become origin sets"""
+        pack = create_pack(restrictions="Sólo clientes que vienen de MásMóvil o Lowi",
+                           observations="Especial portabilidad desde Vodafone")
+        assert pack["allowed_origins"] == ["lowi", "masmovil"]
+        assert pack["bonus_origins"] == ["vodafone"]
+
+        unrestricted = create_pack(restrictions="Permanencia 12 meses")
+        assert unrestricted["allowed_origins"] is None
+
+    def test_recompiled_on_update(self, auth_headers, create_pack):
+        """Test that editing the texts replaces the compiled rules"""
+        pack = create_pack(restrictions="Solo clientes que vienen de Digi")
+        update = {k: pack[k] for k in ("company", "name", "type", "price")}
+        response = requests.put(f"{BASE_URL}/api/packs/{pack['id']}", headers=auth_headers,
+                                json={**update, "observations": "Descuento clientes Orange"})
+        assert response.status_code == 200
+        assert response.json()["allowed_origins"] is None
+        assert response.json()["bonus_origins"] == ["orange"]
+
+    def test_calculator_matches_origin_keys(self, auth_headers, create_pack):
+        """Test that origin companies match however they are spelled"""
+        origin = f"TEST Origen {uuid.uuid4().hex[:6]}"
+        pack = create_pack(restrictions=f"Solo clientes que vienen de {origin}",
+                           observations=f"Especial portabilidad desde {origin}")
+        recommendations = requests.post(f"{BASE_URL}/api/calculator/configure", headers=auth_headers, json={
+            "pack_type": "Solo Móvil", "priority": "Ahorrar", "origin_company": f"  {origin.upper()} "
+        }).json()
+        assert recommendations[0]["id"] == pack["id"]
+        recommended = requests.post(f"{BASE_URL}/api/calculator/recommend", headers=auth_headers,
+                                    params={"pack_type": "Solo Móvil", "origin_company": origin.lower()}).json()
+        assert recommended[0]["id"] == pack["id"] and recommended[0]["score"] == 10
+
+
+# ==================== PACK FRONTIER TESTS ====================
+
+class TestPackFrontier:
+    """Tests for the non-dominated packs per type and TV support"""
+
+    PACK_DEFAULTS = {"company": "TEST Frontier", "type": "Pack Fibra + Móvil"}
+
+    def _frontier(self, auth_headers, **params):
+        response = requests.get(f"{BASE_URL}/api/packs/frontier", headers=auth_headers, params=params)
+        assert response.status_code == 200
+        return response.json()
+
+    def test_dominated_packs_excluded(self, auth_headers, create_pack):
+        """Test that a pack beaten on price, GB and speed is not on the frontier"""
+        best = create_pack(price=0.0, mobile_gb=100000, fiber_speed_mbps=100000)
+        beaten = create_pack(price=99.0, mobile_gb=1, fiber_speed_mbps=1)
+        groups = self._frontier(auth_headers, type="Pack Fibra + Móvil", tv_supported=False)
+        assert len(groups) == 1 and groups[0]["tv_supported"] is False
+        packs = groups[0]["packs"]
+        assert best["id"] in [p["id"] for p in packs]
+        assert beaten["id"] not in [p["id"] for p in packs]
+        assert [p["price"] for p in packs] == sorted(p["price"] for p in packs)
+
+    def test_badges(self, auth_headers, create_pack):
+        """Test that each comparison badge is on exactly one frontier pack"""
+        create_pack(price=0.0, mobile_gb=100000, fiber_speed_mbps=100000)
+        for group in self._frontier(auth_headers):
+            badges = [badge for pack in group["packs"] for badge in pack["badges"]]
+            assert sorted(badges) == ["Mejor valor", "Más barato", "Más completo"]
+            assert "Más barato" in group["packs"][0]["badges"]
+
+    def test_conditional_get(self, auth_headers, create_pack):
+        """Test that the frontier is revalidated with its ETag until packs change"""
+        first = requests.get(f"{BASE_URL}/api/packs/frontier", headers=auth_headers)
+        etag = first.headers["ETag"]
+        again = requests.get(f"{BASE_URL}/api/packs/frontier", headers={**auth_headers, "If-None-Match": etag})
+        assert again.status_code == 304
+        create_pack(price=50.0)
+        changed = requests.get(f"{BASE_URL}/api/packs/frontier", headers={**auth_headers, "If-None-Match": etag})
+        assert changed.status_code == 200
+
+
+# ==================== PACK PRICE HISTORY TESTS ====================
+
+class TestPackPriceHistory:
+    """Tests for the append-only pack price history"""
+
+    PACK_DEFAULTS = {"company": "TEST Prices", "type": "Solo Fibra"}
+
+    def _reprice(self, auth_headers, pack, price):
+        update = {k: pack[k] for k in ("company", "name", "type")}
+        response = requests.put(f"{BASE_URL}/api/packs/{pack['id']}", headers=auth_headers, json={**update, "price": price})
+        assert response.status_code == 200
+
+    def test_history_appended_on_price_change(self, auth_headers, create_pack):
+        """Test that each new price adds a version and an unchanged one does not"""
+        pack = create_pack(price=30.0)
+        self._reprice(auth_headers, pack, 40.0)
+        self._reprice(auth_headers, pack, 40.0)
+        history = requests.get(f"{BASE_URL}/api/packs/{pack['id']}/prices", headers=auth_headers).json()
+        assert [version["price"] for version in history] == [30.0, 40.0]
+
+    def test_as_of_lookup(self, auth_headers, create_pack):
+        """Test single and batched as-of lookups"""
+        pack = create_pack(price=30.0)
+        history = requests.get(f"{BASE_URL}/api/packs/{pack['id']}/prices", headers=auth_headers).json()
+        created = history[0]["valid_from"]
+        self._reprice(auth_headers, pack, 45.0)
+
+        single = requests.get(f"{BASE_URL}/api/packs/{pack['id']}/prices", headers=auth_headers, params={"at": created})
+        assert single.json()["price"] == 30.0
+        batch = requests.post(f"{BASE_URL}/api/packs/prices/as-of", headers=auth_headers, json={"lookups": [
+            {"pack_id": pack["id"], "at": created},
+            {"pack_id": pack["id"], "at": "2100-01-01T00:00:00Z"},
+            {"pack_id": pack["id"], "at": "2000-01-01T00:00:00Z"},
+            {"pack_id": "no-such-pack", "at": created},
+        ]})
+        assert batch.status_code == 200
+        assert batch.json()["prices"] == [30.0, 45.0, None, None]
+
+    def test_reports_price_sales_as_of_sale_date(self, auth_headers, create_pack):
+        """Test that a sale saved without pack_price counts its pack's price on the sale date"""
+        pack = create_pack(price=30.0)
+        company = f"TEST Historico {uuid.uuid4().hex[:6]}"
+        phone = f"698{uuid.uuid4().int % 1000000:06d}"
+        client = requests.post(f"{BASE_URL}/api/clients", headers=auth_headers,
+                               json={"name": "TEST Precio Historico", "phone": phone}).json()
+        response = requests.post(f"{BASE_URL}/api/sales", headers=auth_headers, json={
+            "client_id": client["id"], "company": company, "pack_type": "Solo Fibra", "pack_id": pack["id"]
+        })
+        assert response.status_code == 200
+        self._reprice(auth_headers, pack, 99.0)
+
+        by_company = requests.get(f"{BASE_URL}/api/analytics/sales-by-company", headers=auth_headers,
+                                  params={"days": 1}).json()
+        assert [c["revenue"] for c in by_company if c["company"] == company] == [30.0]
+
+
+# ==================== PACK IMPORT TESTS ====================
+
+class TestPackImport:
+    """Tests for operator price sheet imports"""
+
+    def _import(self, auth_headers, name, content, **params):
+        return requests.post(f"{BASE_URL}/api/packs/import", headers=auth_headers, params=params,
+                             files={"file": (name, content)})
+
+    def _packs(self, auth_headers, company):
+        packs = requests.get(f"{BASE_URL}/api/packs", headers=auth_headers, params={"limit": 500}).json()
+        return {p["name"]: p for p in packs if p["company"] == company}
+
+    def test_csv_upsert_and_deactivation(self, auth_headers):
+        """Test created, unchanged, updated, failed and deactivated rows"""
+        company = f"TEST Operador {uuid.uuid4().hex[:6]}"
+        sheet = (f"Compañía;Nombre;Tipo;Precio;GB;TV\n"
+                 f"{company};Móvil 20GB;Solo Móvil;9,90;20;no\n"
+                 f"{company};Fibra 1Gb;Solo Fibra;30;;sí\n"
+                 f"{company};Sin precio;Solo Fibra;;;\n")
+        response = self._import(auth_headers, "tarifas.csv", sheet.encode())
+        assert response.status_code == 200
+        result = response.json()
+        assert (result["created"], result["failed"]) == (2, 1)
+        assert [entry["status"] for entry in result["report"]] == ["created", "created", "failed"]
+        assert result["report"][2]["row"] == 4 and "price" in result["report"][2]["errors"][0]
+        packs = self._packs(auth_headers, company)
+        assert packs["Móvil 20GB"]["price"] == 9.9 and packs["Móvil 20GB"]["tv_supported"] is False
+        assert packs["Fibra 1Gb"]["tv_supported"] is True
+        assert [entry["pack_id"] for entry in result["report"][:2]] == [packs["Móvil 20GB"]["id"], packs["Fibra 1Gb"]["id"]]
+
+        sheet = (f"Compañía;Nombre;Tipo;Precio;GB;TV\n"
+                 f"{company};Móvil 20GB;Solo Móvil;9,90;20;no\n"
+                 f"{company};Fibra 1Gb;Solo Fibra;28;;sí\n")
+        response = self._import(auth_headers, "tarifas.csv", sheet.encode())
+        result = response.json()
+        assert [entry["status"] for entry in result["report"]] == ["unchanged", "updated"]
+        assert result["deactivated"] == []
+
+        sheet = f"company,name,type,price\n{company},Fibra 1Gb,Solo Fibra,28\n"
+        result = self._import(auth_headers, "tarifas.csv", sheet.encode()).json()
+        assert result["deactivated"] == [packs["Móvil 20GB"]["id"]]
+        packs = self._packs(auth_headers, company)
+        assert packs["Móvil 20GB"]["active"] is False
+        history = requests.get(f"{BASE_URL}/api/packs/{packs['Fibra 1Gb']['id']}/prices", headers=auth_headers).json()
+        assert [version["price"] for version in history] == [30.0, 28.0]
+
+    def test_xlsx(self, auth_headers):
+        """Test that the first worksheet of an XLSX file is imported"""
+        from openpyxl import Workbook
+
+        company = f"TEST Operador {uuid.uuid4().hex[:6]}"
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(["Operador", "Tarifa", "Tipo", "Precio", "Fibra (Mbps)"])
+        for speed in (300, 600, 1000):
+            sheet.append([company, f"Fibra {speed}", "Solo Fibra", 20 + speed / 100, speed])
+        content = io.BytesIO()
+        workbook.save(content)
+        response = self._import(auth_headers, "tarifas.xlsx", content.getvalue(), deactivate_missing=False)
+        assert response.status_code == 200
+        assert response.json()["created"] == 3
+        assert self._packs(auth_headers, company)["Fibra 600"]["fiber_speed_mbps"] == 600
+
+    def test_windows_1252_csv(self, auth_headers):
+        """Test that a CSV exported by a Spanish Excel (Windows-1252) is read"""
+        company = f"TEST Operador {uuid.uuid4().hex[:6]}"
+        sheet = f"Compañía;Nombre;Tipo;Precio\n{company};Móvil Básico;Solo Móvil;7,50\n"
+        response = self._import(auth_headers, "tarifas.csv", sheet.encode("cp1252"), deactivate_missing=False)
+        assert response.status_code == 200
+        assert response.json()["created"] == 1
+        assert self._packs(auth_headers, company)["Móvil Básico"]["price"] == 7.5
+
+    def test_duplicate_packs_update_the_tracked_one(self, auth_headers, create_pack):
+        """Test that with two packs under one (company, name), the one updated is the one repriced"""
+        company = f"TEST Operador {uuid.uuid4().hex[:6]}"
+        older = create_pack(company=company, name="Fibra 300", price=25.0)
+        newer = create_pack(company=company, name="Fibra 300", price=25.0)
+        sheet = f"company,name,type,price\n{company},Fibra 300,Solo Fibra,22\n"
+        result = self._import(auth_headers, "tarifas.csv", sheet.encode()).json()
+        assert result["report"] == [{"row": 2, "status": "updated", "pack_id": older["id"]}]
+        packs = requests.get(f"{BASE_URL}/api/packs", headers=auth_headers, params={"limit": 500}).json()
+        assert {p["id"]: p["price"] for p in packs if p["company"] == company} == {older["id"]: 22.0, newer["id"]: 25.0}
+        history = requests.get(f"{BASE_URL}/api/packs/{older['id']}/prices", headers=auth_headers).json()
+        assert [version["price"] for version in history] == [25.0, 22.0]
+
+    def test_rejects_unknown_file_type(self, auth_headers):
+        """Test that only CSV and XLSX uploads are accepted"""
+        response = self._import(auth_headers, "tarifas.pdf", b"%PDF-1.4")
+        assert response.status_code == 400
+
+
+# ==================== DEMO DATA TESTS ====================
+
+class TestDemoSeed:
+    """Tests for seeding demo data next to the unique indexes"""
+
+    def test_reseed_is_idempotent(self, auth_headers):
+        """Test that seeding twice inserts nothing the second time instead of failing"""
+        try:
+            first = requests.post(f"{BASE_URL}/api/demo/seed", headers=auth_headers)
+            assert first.status_code == 200
+            second = requests.post(f"{BASE_URL}/api/demo/seed", headers=auth_headers)
+            assert second.status_code == 200
+            assert set(second.json()["created"].values()) == {0}
+        finally:
+            requests.delete(f"{BASE_URL}/api/demo/clean", headers=auth_headers)